@@ -1,15 +1,32 @@
-from flask import Flask, request, jsonify, redirect
+from flask import Flask, Response, request, jsonify, redirect
 import requests
 import os
 from urllib.parse import urlencode
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
 from dateutil import parser
-import json
 import time
+import threading
+import queue
+import bisect
+import heapq
+import itertools
+import sqlite3
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 # NEW: websocket client for DxLink
 from websocket import create_connection, WebSocketTimeoutException
 
+import numpy as np
+from pricing import expiration_greeks, strike_for_delta
+from serialization import dumps as json_dumps, loads as json_loads
+from metrics import REGISTRY, UPSTREAM_RESPONSES, DX_EVENTS, Timings, timed
+from capture import install as install_capture
+from upstream import BREAKERS, CircuitOpenError, UpstreamSession, is_upstream_failure, retry_delay
+from snapshots import (COLUMNS as SNAPSHOT_COLUMNS, QUERY_MAX_ROWS as SNAPSHOT_QUERY_MAX_ROWS, SNAPSHOT_DIR,
+                       SnapshotStore)
+
 app = Flask(__name__)
 
 # ⬇️ ENV VARS (unchanged names)
@@ -22,16 +39,34 @@ REFRESH_TOKEN = os.getenv("TT_REFRESH_TOKEN")
 REDIRECT_URI = "https://tastytrade-webhook.onrender.com/authorize/callback"
 
 # ---- API base + token endpoints (tastyworks per docs) ----
-BASE_URL = "https://api.tastyworks.com"
+BASE_URL = os.getenv("TT_BASE_URL", "https://api.tastyworks.com")   # overridable for local fakes (bench/)
 TOKEN_URL = f"{BASE_URL}/oauth/token"
 
 # ---- Requests session with required headers ----
-SESSION = requests.Session()
+# Pooled keep-alive connections, timeouts, retries and rate-limit handling live in upstream.py
+SESSION = UpstreamSession()
 SESSION.headers.update({
     "User-Agent": "wheelwatchlist/1.0",   # required
     "Accept": "application/json"
 })
 
+# ---- Optional record/replay of all upstream traffic (see capture.py) ----
+# record: append every REST response and DxLink frame to TT_CAPTURE_PATH ("{pid}" is
+# replaced per worker; default upstream-{pid}.ndjson.gz). replay: serve SESSION and the
+# DxLink socket from TT_CAPTURE_PATH (required, used as given), at TT_REPLAY_SPEED x the
+# recorded pace (0 = as fast as possible).
+CAPTURE_MODE = os.getenv("TT_CAPTURE_MODE")
+CAPTURE_PATH = os.getenv("TT_CAPTURE_PATH")
+if CAPTURE_MODE == "replay":
+    if not CAPTURE_PATH:
+        raise ValueError("TT_CAPTURE_MODE=replay needs TT_CAPTURE_PATH: the recorded file to serve "
+                         "(used as given, {pid} is not substituted)")
+    SESSION, create_connection = install_capture(CAPTURE_MODE, CAPTURE_PATH, SESSION, create_connection,
+                                                 float(os.getenv("TT_REPLAY_SPEED", "1.0")))
+elif CAPTURE_MODE:
+    CAPTURE_PATH = (CAPTURE_PATH or "upstream-{pid}.ndjson.gz").format(pid=os.getpid())
+    SESSION, create_connection = install_capture(CAPTURE_MODE, CAPTURE_PATH, SESSION, create_connection)
+
 def _raise_for_status_with_context(resp, context):
     try:
         resp.raise_for_status()
@@ -41,6 +76,103 @@ def _raise_for_status_with_context(resp, context):
             f"status={resp.status_code} | body={resp.text}"
         )
 
+# ---- Optional state shared by all gunicorn workers ----
+# "sqlite:///relative.db", "sqlite:////abs/path.db" or "redis://host:6379/0" (needs `redis`)
+SHARED_STORE_URL = os.getenv("TT_SHARED_STORE")
+
+# ✅ Minimal Redis-style key/value store on a local SQLite file.
+# Implements the subset of redis-py we use (get/set/mget/mset/delete/scan_iter), so a
+# real Redis client can be dropped in unchanged. Safe across processes (WAL + busy timeout).
+class SQLiteStore:
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = None
+        self._pid = None
+
+    def _conn(self):
+        # One connection per process; never reuse a handle inherited across fork
+        if self._db is None or self._pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)")
+            db.commit()
+            self._db, self._pid = db, os.getpid()
+        return self._db
+
+    def get(self, key):
+        return self.mget([key])[0]
+
+    def mget(self, keys):
+        if not keys:
+            return []
+        now = time.time()
+        found = {}
+        with self._lock:
+            db = self._conn()
+            # Stay under SQLite's bound-parameter limit
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = db.execute(
+                    f"SELECT key, value, expires_at FROM kv WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                for k, v, exp in rows:
+                    if exp is None or exp > now:
+                        found[k] = v
+        return [found.get(k) for k in keys]
+
+    def set(self, key, value, ex=None, nx=False):
+        now = time.time()
+        expires_at = now + ex if ex else None
+        with self._lock:
+            db = self._conn()
+            if nx:
+                db.execute("DELETE FROM kv WHERE key = ? AND expires_at IS NOT NULL AND expires_at <= ?", (key, now))
+                cur = db.execute("INSERT OR IGNORE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                                 (key, value, expires_at))
+                db.commit()
+                return cur.rowcount == 1
+            db.execute("INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                       (key, value, expires_at))
+            db.commit()
+            return True
+
+    def mset(self, mapping):
+        with self._lock:
+            db = self._conn()
+            db.executemany("INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, NULL)",
+                           list(mapping.items()))
+            db.commit()
+        return True
+
+    def delete(self, *keys):
+        if not keys:
+            return 0
+        with self._lock:
+            db = self._conn()
+            cur = db.executemany("DELETE FROM kv WHERE key = ?", [(k,) for k in keys])
+            db.commit()
+            return cur.rowcount
+
+    def scan_iter(self, match="*"):
+        with self._lock:
+            rows = self._conn().execute("SELECT key FROM kv WHERE key GLOB ?", (match,)).fetchall()
+        return iter([r[0] for r in rows])
+
+def open_shared_store(url):
+    if not url:
+        return None
+    if url.startswith("sqlite:///"):
+        return SQLiteStore(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        import redis  # optional dependency, only needed for a real Redis
+        return redis.Redis.from_url(url)
+    raise ValueError(f"Unsupported TT_SHARED_STORE: {url}")
+
+SHARED_STORE = open_shared_store(SHARED_STORE_URL)
+
 # 🔐 Step 1: Redirect user to Tastytrade auth
 @app.route("/authorize")
 def authorize():
@@ -72,7 +204,9 @@ def callback():
         r = SESSION.post(TOKEN_URL, data=data)
         _raise_for_status_with_context(r, "token_exchange_failed")
 
-        tokens = r.json()
+        tokens = json_loads(r.content)
+        # Use them right away in this process too
+        TOKEN_MANAGER.set_tokens(tokens)
         return jsonify({
             "message": "✅ Tokens received. Please add these to Render ENV.",
             "access_token": tokens.get('access_token'),
@@ -83,276 +217,1236 @@ def callback():
     except Exception as e:
         return jsonify({"error": "Exception during token exchange", "details": str(e)}), 500
 
-# ✅ Automatically refresh token if expired
-def get_valid_access_token():
-    global ACCESS_TOKEN, REFRESH_TOKEN
+# ---- OAuth access token management ----
+# Refresh this long before the recorded expiry (in the background, callers keep the old token)
+TOKEN_REFRESH_MARGIN_SEC = float(os.getenv("TT_TOKEN_REFRESH_MARGIN_SEC", "120"))
+
+# ✅ Thread-safe holder for the access/refresh token pair.
+# Expiry comes from the OAuth response's expires_in; tokens from ENV have no known expiry
+# and are trusted until an API call answers 401. Refreshes are single-flight.
+class TokenManager:
+
+    STORE_KEY = "tt:oauth:tokens"
+    STORE_LOCK_KEY = "tt:oauth:refresh-lock"
+
+    def __init__(self, access_token, refresh_token, store=None):
+        self.store = store                     # other workers' rotations show up here
+        self._lock = threading.Lock()          # guards the fields below
+        self._refresh_lock = threading.Lock()  # held by whoever is talking to /oauth/token
+        self._bg_pending = False
+        self.access_token = access_token
+        self.refresh_token = refresh_token
+        self.expires_at = None
+        self.refreshed_at = None
+        self.last_error = None
+
+    def get(self):
+        with self._lock:
+            token, expires_at = self.access_token, self.expires_at
+        now = time.time()
+        if token and (expires_at is None or now < expires_at - TOKEN_REFRESH_MARGIN_SEC):
+            return token
+        if token and now < expires_at:
+            # Still usable: hand it out and refresh proactively
+            self._refresh_in_background()
+            return token
+        if not token:
+            token = self._adopt_shared(None)
+            if token:
+                return token
+        return self._refresh_blocking(token)
+
+    # An API call got 401 with `token`; make sure the next token is a fresh one
+    def invalidate(self, token):
+        with self._lock:
+            if self.access_token == token:
+                self.expires_at = 0
+        return self.get()
+
+    def set_tokens(self, tokens):
+        with self._lock:
+            self.access_token = tokens.get("access_token")
+            self.refresh_token = tokens.get("refresh_token") or self.refresh_token
+            expires_in = tokens.get("expires_in")
+            self.expires_at = time.time() + float(expires_in) if expires_in else None
+            self.refreshed_at = time.time()
+            shared = {"access_token": self.access_token, "refresh_token": self.refresh_token,
+                      "expires_at": self.expires_at}
+        if self.store is not None:
+            try:
+                self.store.set(self.STORE_KEY, json_dumps(shared))
+            except Exception as e:
+                self.last_error = f"shared_store_write_failed: {e}"
+        return shared["access_token"]
+
+    # Take over tokens another worker stored, if they are newer than `stale`
+    def _adopt_shared(self, stale):
+        if self.store is None:
+            return None
+        try:
+            raw = self.store.get(self.STORE_KEY)
+        except Exception as e:
+            self.last_error = f"shared_store_read_failed: {e}"
+            return None
+        if not raw:
+            return None
+        shared = json_loads(raw)
+        with self._lock:
+            # Always follow refresh-token rotation, even if we keep our access token
+            if shared.get("refresh_token"):
+                self.refresh_token = shared["refresh_token"]
+            token, expires_at = shared.get("access_token"), shared.get("expires_at")
+            if not token or token == stale:
+                return None
+            if expires_at is not None and expires_at - time.time() < TOKEN_REFRESH_MARGIN_SEC:
+                return None
+            self.access_token, self.expires_at = token, expires_at
+            return token
+
+    def status(self):
+        with self._lock:
+            return {
+                "has_access_token": bool(self.access_token),
+                "expires_in": round(self.expires_at - time.time(), 1) if self.expires_at is not None else None,
+                "refreshed_at": self.refreshed_at,
+                "last_error": self.last_error
+            }
+
+    def _refresh_blocking(self, stale):
+        with self._refresh_lock:
+            # Another thread (or worker) may have refreshed while we waited
+            with self._lock:
+                if self.access_token and self.access_token != stale:
+                    return self.access_token
+            return self._adopt_shared(stale) or self._refresh(stale)
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._bg_pending:
+                return
+            self._bg_pending = True
+        threading.Thread(target=self._background_refresh, name="token-refresh", daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            if not self._refresh_lock.acquire(blocking=False):
+                return
+            try:
+                stale = self.access_token
+                self._adopt_shared(stale) or self._refresh(stale)
+            finally:
+                self._refresh_lock.release()
+        except Exception as e:
+            self.last_error = str(e)
+        finally:
+            with self._lock:
+                self._bg_pending = False
+
+    def _refresh(self, stale=None):
+        # Only one worker talks to /oauth/token at a time; the others wait for its result
+        locked = False
+        if self.store is not None:
+            try:
+                locked = self.store.set(self.STORE_LOCK_KEY, str(os.getpid()), ex=30, nx=True)
+                if not locked:
+                    for _ in range(50):
+                        time.sleep(0.2)
+                        token = self._adopt_shared(stale)
+                        if token:
+                            return token
+            except Exception as e:
+                self.last_error = f"shared_store_lock_failed: {e}"
+        try:
+            return self._post_refresh()
+        finally:
+            if locked:
+                try:
+                    self.store.delete(self.STORE_LOCK_KEY)
+                except Exception:
+                    pass
+
+    def _post_refresh(self):
+        # Refresh with refresh token (per docs)
+        data = {
+            "grant_type": "refresh_token",
+            "refresh_token": self.refresh_token,
+            "client_secret": CLIENT_SECRET,
+        }
+        with timed("token_refresh"):
+            r = SESSION.post(TOKEN_URL, data=data)
+        UPSTREAM_RESPONSES.inc("/oauth/token", r.status_code)
+        _raise_for_status_with_context(r, "token_refresh_failed")
+        self.last_error = None
+        return self.set_tokens(json_loads(r.content))
 
-    # If we have an access token, test it
-    if ACCESS_TOKEN:
-        test = SESSION.get(
-            f"{BASE_URL}/customers/me/accounts",
-            headers={"Authorization": f"Bearer {ACCESS_TOKEN}"}
-        )
-        if test.status_code == 200:
-            return ACCESS_TOKEN
-        # else fall through to refresh
-
-    # Refresh with refresh token (per docs)
-    data = {
-        "grant_type": "refresh_token",
-        "refresh_token": REFRESH_TOKEN,
-        "client_secret": CLIENT_SECRET,
-    }
-    r = SESSION.post(TOKEN_URL, data=data)
-    _raise_for_status_with_context(r, "token_refresh_failed")
+TOKEN_MANAGER = TokenManager(ACCESS_TOKEN, REFRESH_TOKEN, SHARED_STORE)
 
-    tokens = r.json()
-    ACCESS_TOKEN = tokens.get("access_token")
-    REFRESH_TOKEN = tokens.get("refresh_token") or REFRESH_TOKEN
-    return ACCESS_TOKEN
+# ✅ Current access token, refreshed only when expired/expiring (no probe request)
+def get_valid_access_token():
+    return TOKEN_MANAGER.get()
+
+# Metrics label for an upstream URL (symbols folded out to keep the label set small)
+def _endpoint_label(url):
+    path = url[len(BASE_URL):] if url.startswith(BASE_URL) else url
+    if path.startswith("/option-chains/"):
+        return "/option-chains/nested"
+    return path
+
+# ✅ Authenticated GET that refreshes the token and retries once on 401.
+# Goes through `breaker` (default: the REST one); fails fast with CircuitOpenError while it's open.
+def _api_get(url, token, context, params=None, breaker=None):
+    breaker = breaker or BREAKERS["rest"]
+    breaker.check()
+    try:
+        r = SESSION.get(url, headers={"Authorization": f"Bearer {token}"}, params=params)
+        UPSTREAM_RESPONSES.inc(_endpoint_label(url), r.status_code)
+        if r.status_code == 401:
+            token = TOKEN_MANAGER.invalidate(token)
+            r = SESSION.get(url, headers={"Authorization": f"Bearer {token}"}, params=params)
+            UPSTREAM_RESPONSES.inc(_endpoint_label(url), r.status_code)
+    except Exception as e:
+        breaker.record_failure(e)
+        raise
+    if is_upstream_failure(r.status_code):
+        breaker.record_failure(f"HTTP {r.status_code} from {_endpoint_label(url)}")
+    else:
+        breaker.record_success()
+    _raise_for_status_with_context(r, context)
+    return r
 
 # ✅ Get an API Quote Token for DxLink
 def get_api_quote_token(access_token):
-    r = SESSION.get(
-        f"{BASE_URL}/api-quote-tokens",
-        headers={"Authorization": f"Bearer {access_token}"}
-    )
-    _raise_for_status_with_context(r, "api_quote_token_failed")
-    payload = r.json().get("data", {})
+    with timed("quote_token"):
+        r = _api_get(f"{BASE_URL}/api-quote-tokens", access_token, "api_quote_token_failed",
+                     breaker=BREAKERS["quote_token"])
+    payload = json_loads(r.content).get("data", {})
     return payload.get("token"), payload.get("dxlink-url")
 
-# ✅ Find the closest expiration that actually has strikes (via nested)
-def get_closest_expiration(symbol, token):
-    url = f"{BASE_URL}/option-chains/{symbol}/nested"
-    headers = {'Authorization': f'Bearer {token}'}
-    r = SESSION.get(url, headers=headers)
-    _raise_for_status_with_context(r, "expirations_fetch_failed")
-
-    data = r.json().get('data', {})
-    items = data.get('items', [])
-    if not items:
-        raise Exception(f"No option chain items found for {symbol}")
-
-    expirations = []
-    for chain in items:
-        for exp in chain.get('expirations', []):
-            d = exp.get('expiration-date')
-            if d:
-                expirations.append(d)
-    if not expirations:
+# ---- Option-chain cache (/option-chains/{symbol}/nested) ----
+CHAIN_CACHE_TTL_SEC = float(os.getenv("TT_CHAIN_CACHE_TTL_SEC", "21600"))
+CHAIN_CACHE_MAX = int(os.getenv("TT_CHAIN_CACHE_MAX", "512"))
+CHAIN_CACHE_PATH = os.getenv("TT_CHAIN_CACHE_PATH")   # optional SQLite file, survives restarts
+
+# ✅ LRU + TTL cache for nested chain documents, keyed by (symbol, expiration-date or None).
+# Entries never outlive the local day they were fetched on (chains roll daily), and
+# entries for an expiration that is already in the past are dropped.
+class ChainCache:
+
+    STORE_PREFIX = "tt:chain:"
+
+    # `store` (SQLiteStore or Redis) is an optional second level shared with other workers
+    def __init__(self, max_entries, ttl_sec, store=None):
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self._entries = OrderedDict()   # key -> (expires_at, data, ParsedChain or None until parsed)
+        self._lock = threading.Lock()
+        self.store = store
+        self.hits = 0
+        self.store_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(symbol, expiration):
+        return f"{symbol.upper()}|{expiration or ''}"
+
+    def _expires_at(self, expiration, now=None):
+        now = now or datetime.now()
+        end_of_day = datetime(now.year, now.month, now.day) + timedelta(days=1)
+        expires_at = min(now.timestamp() + self.ttl_sec, end_of_day.timestamp())
+        if expiration:
+            # Filtered documents are useless once the expiration itself has passed
+            exp_end = parser.parse(expiration) + timedelta(days=1)
+            expires_at = min(expires_at, exp_end.timestamp())
+        return expires_at
+
+    def get(self, symbol, expiration=None):
+        key = self._key(symbol, expiration)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+        if self.store is not None:
+            try:
+                raw = self.store.get(self.STORE_PREFIX + key)
+            except Exception:
+                raw = None
+            if raw:
+                entry = json_loads(raw)
+                if entry["expires_at"] > now:
+                    with self._lock:
+                        self._store(key, entry["expires_at"], entry["data"])
+                        self.store_hits += 1
+                    return entry["data"]
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, symbol, expiration, data):
+        key = self._key(symbol, expiration)
+        expires_at = self._expires_at(expiration)
+        with self._lock:
+            self._store(key, expires_at, data)
+        if self.store is not None:
+            try:
+                self.store.set(self.STORE_PREFIX + key,
+                               json_dumps({"expires_at": expires_at, "data": data}),
+                               ex=max(1, int(expires_at - time.time())))
+            except Exception:
+                pass
+
+    # ParsedChain of a document get()/put() handled, built once per entry and evicted with it
+    # (a document that isn't cached, e.g. one without items, is parsed on every call)
+    def parsed(self, symbol, expiration, data):
+        key = self._key(symbol, expiration)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is data and entry[2] is not None:
+                return entry[2]
+        parsed = ParsedChain(symbol, data)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is data:
+                self._entries[key] = (entry[0], data, parsed)
+        return parsed
+
+    def _store(self, key, expires_at, data):
+        self._entries[key] = (expires_at, data, None)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, symbol=None):
+        prefix = f"{symbol.upper()}|" if symbol else ""
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+        if self.store is not None:
+            keys = list(self.store.scan_iter(match=self.STORE_PREFIX + prefix + "*"))
+            if keys:
+                self.store.delete(*keys)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_sec": self.ttl_sec,
+                "hits": self.hits,
+                "store_hits": self.store_hits,
+                "misses": self.misses,
+                "shared": self.store is not None
+            }
+
+CHAIN_CACHE = ChainCache(CHAIN_CACHE_MAX, CHAIN_CACHE_TTL_SEC,
+                         SQLiteStore(CHAIN_CACHE_PATH) if CHAIN_CACHE_PATH else SHARED_STORE)
+
+# ✅ All nested-chain reads go through here; returns the response's "data" object
+# (refresh=True skips the cached copy and replaces it)
+def fetch_nested_chain(symbol, token, expiration=None, context="nested_chain_fetch_failed", refresh=False):
+    data = None if refresh else CHAIN_CACHE.get(symbol, expiration)
+    if data is not None:
+        return data
+
+    params = {'expiration-date': expiration} if expiration else None
+    with timed("chain_fetch"):
+        r = _api_get(f"{BASE_URL}/option-chains/{symbol}/nested", token, context, params=params)
+        data = json_loads(r.content).get('data', {})
+    if data.get('items'):
+        CHAIN_CACHE.put(symbol, expiration, data)
+    return data
+
+# ✅ One expiration of a parsed chain: strikes plus put/call streamer symbols
+class ChainExpiration:
+
+    def __init__(self, date):
+        self.date = date
+        self.dte = (parser.parse(date).date() - datetime.now().date()).days
+        self.strikes = []          # sorted strike prices
+        self.puts = []             # put streamer symbols, in strike order
+        self.calls = []            # call streamer symbols, in strike order
+        self.sym_to_strike = {}
+
+    def _add_strike(self, s):
+        strike = float(s.get('strike-price'))
+        call_stream = s.get('call-streamer-symbol')
+        put_stream = s.get('put-streamer-symbol')
+        self.strikes.append(strike)
+        if call_stream:
+            self.calls.append(call_stream)
+            self.sym_to_strike[call_stream] = strike
+        if put_stream:
+            self.puts.append(put_stream)
+            self.sym_to_strike[put_stream] = strike
+
+    def _finish(self):
+        self.strikes = sorted(set(self.strikes))
+        self.puts.sort(key=self.sym_to_strike.__getitem__)
+        self.calls.sort(key=self.sym_to_strike.__getitem__)
+
+# ✅ A nested chain document parsed once into expirations -> strikes -> streamer symbols
+class ParsedChain:
+
+    def __init__(self, symbol, data):
+        self.symbol = symbol
+        self.expirations = {}      # expiration-date -> ChainExpiration
+        for chain in data.get('items', []):
+            for exp in chain.get('expirations', []):
+                d = exp.get('expiration-date')
+                if not d:
+                    continue
+                ce = self.expirations.get(d)
+                if ce is None:
+                    ce = self.expirations[d] = ChainExpiration(d)
+                for s in exp.get('strikes', []):
+                    ce._add_strike(s)
+        for ce in self.expirations.values():
+            ce._finish()
+
+    # Expiration closest to target_dte, preferring ones that actually list strikes
+    def closest_expiration(self, target_dte=21):
+        if not self.expirations:
+            return None
+        by_distance = sorted(self.expirations.values(), key=lambda ce: abs(ce.dte - target_dte))
+        for ce in by_distance:
+            if ce.puts and ce.calls:
+                return ce.date
+        return by_distance[0].date
+
+    # Expirations with strikes whose DTE lies in [dte_min, dte_max], nearest first
+    def expirations_between(self, dte_min, dte_max):
+        found = [ce for ce in self.expirations.values()
+                 if dte_min <= ce.dte <= dte_max and ce.puts and ce.calls]
+        return [ce.date for ce in sorted(found, key=lambda ce: ce.dte)]
+
+    def get(self, expiration):
+        return self.expirations.get(expiration)
+
+# ✅ Parsed view of a (cached) nested document; re-parsed only when the raw document changes
+def get_parsed_chain(symbol, token, expiration=None, context="nested_chain_fetch_failed"):
+    data = fetch_nested_chain(symbol, token, expiration, context=context)
+    return CHAIN_CACHE.parsed(symbol, expiration, data)
+
+# ✅ Find the expiration closest to target_dte that actually has strikes (one nested document)
+def get_closest_expiration(symbol, token, target_dte=21):
+    chain = get_parsed_chain(symbol, token, context="expirations_fetch_failed")
+    if not chain.expirations:
         raise Exception(f"No expirations found for {symbol}")
-
-    today = datetime.now()
-    target_dte = 21
-    expirations_sorted = sorted(
-        set(expirations),
-        key=lambda d: abs((parser.parse(d) - today).days - target_dte)
-    )
-
-    # Probe a few closest, pick the first that has strikes listed for that exp
-    headers_q = {'Authorization': f'Bearer {token}'}
-    for exp in expirations_sorted[:6]:
-        r2 = SESSION.get(
-            f"{BASE_URL}/option-chains/{symbol}/nested",
-            headers=headers_q,
-            params={'expiration-date': exp}
-        )
-        _raise_for_status_with_context(r2, "nested_probe_failed")
-        items2 = r2.json().get('data', {}).get('items', [])
-        has_any = False
-        for row in items2:
-            if row.get('expirations'):
-                # when filtered by expiration-date, there is usually one row with strikes for that expiration
-                for e in row.get('expirations', []):
-                    if e.get('expiration-date') == exp and e.get('strikes'):
-                        has_any = True
-                        break
-            if has_any:
-                break
-        if has_any:
-            return exp
-
-    # Fallback to the closest date even if it looked empty
-    return expirations_sorted[0]
+    return chain.closest_expiration(target_dte)
 
 # ✅ Collect streamer symbols for all strikes of that expiration
 def get_streamer_symbols_for_expiration(symbol, expiration, token):
-    url = f"{BASE_URL}/option-chains/{symbol}/nested"
-    headers = {'Authorization': f'Bearer {token}'}
-    params = {'expiration-date': expiration}
-    r = SESSION.get(url, headers=headers, params=params)
-    _raise_for_status_with_context(r, "nested_for_symbols_failed")
-
-    items = r.json().get('data', {}).get('items', [])
-    if not items:
+    ce = get_parsed_chain(symbol, token, context="nested_for_symbols_failed").get(expiration)
+    if ce is None or not ce.puts or not ce.calls:
+        # Unfiltered document did not list strikes for this date; ask for it directly
+        ce = get_parsed_chain(symbol, token, expiration, context="nested_for_symbols_failed").get(expiration)
+    if ce is None:
         raise Exception(f"No option data found for {symbol} @ {expiration}")
-
-    # Build maps: streamer_symbol -> strike, and also separate puts/calls lists
-    put_streamers = []
-    call_streamers = []
-    sym_to_strike = {}
-
-    for chain in items:
-        for exp in chain.get('expirations', []):
-            if exp.get('expiration-date') != expiration:
-                continue
-            for s in exp.get('strikes', []):
-                strike = float(s.get('strike-price'))
-                call_stream = s.get('call-streamer-symbol')
-                put_stream = s.get('put-streamer-symbol')
-                if call_stream:
-                    call_streamers.append(call_stream)
-                    sym_to_strike[call_stream] = strike
-                if put_stream:
-                    put_streamers.append(put_stream)
-                    sym_to_strike[put_stream] = strike
-
-    if not put_streamers or not call_streamers:
+    if not ce.puts or not ce.calls:
         raise Exception(f"No streamer symbols found for {symbol} @ {expiration}")
 
-    return put_streamers, call_streamers, sym_to_strike
-
-# ✅ Subscribe via DxLink and gather Quote + Greeks quickly
-def dxlink_fetch_quotes_and_greeks(dx_url, dx_token, symbols, timeout_sec=3.0):
-    # Open websocket
-    ws = create_connection(dx_url, timeout=10)
-    ws.settimeout(1.0)
-
-    def send(obj):
-        ws.send(json.dumps(obj))
-
-    # 1) SETUP
-    send({"type": "SETUP", "channel": 0, "version": "wheelwatchlist/1.0",
-          "keepaliveTimeout": 60, "acceptKeepaliveTimeout": 60})
-
-    # Expect AUTH_STATE -> UNAUTHORIZED (we’ll auth immediately anyway)
-    # 2) AUTH
-    send({"type": "AUTH", "channel": 0, "token": dx_token})
-
-    # 3) CHANNEL_REQUEST
-    FEED_CH = 3
-    send({"type": "CHANNEL_REQUEST", "channel": FEED_CH,
-          "service": "FEED", "parameters": {"contract": "AUTO"}})
-
-    # 4) FEED_SETUP (request JSON format for easier parsing)
-    send({
-        "type": "FEED_SETUP",
-        "channel": FEED_CH,
-        "acceptAggregationPeriod": 0.1,
-        "acceptDataFormat": "JSON",
-        "acceptEventFields": {
-            "Quote": ["eventType", "eventSymbol", "bidPrice", "askPrice", "bidSize", "askSize"],
-            "Greeks": ["eventType", "eventSymbol", "volatility", "delta", "gamma", "theta", "rho", "vega"]
-        }
-    })
-
-    # 5) FEED_SUBSCRIPTION
-    add_list = []
-    for s in symbols:
-        add_list.append({"type": "Quote", "symbol": s})
-        add_list.append({"type": "Greeks", "symbol": s})
-
-    send({"type": "FEED_SUBSCRIPTION", "channel": FEED_CH, "reset": True, "add": add_list})
-
-    # Gather data for a short window
-    quotes = {}   # symbol -> {"bid":..., "ask":...}
-    greeks = {}   # symbol -> {"delta":...}
-    t_end = time.time() + timeout_sec
-
-    try:
-        while time.time() < t_end:
-            try:
-                raw = ws.recv()
-            except WebSocketTimeoutException:
+    return list(ce.puts), list(ce.calls), ce.sym_to_strike
+
+# ---- Live market-data book (process-wide, keyed by streamer symbol) ----
+# Max age of book data we will serve when the stream is not confirming it live
+MAX_STALENESS_SEC = float(os.getenv("TT_MAX_STALENESS_SEC", "60"))
+
+# ✅ One compact record per streamer symbol; quote and greeks halves stamp their own time
+class MarketRecord:
+    __slots__ = ("bid", "ask", "bid_size", "ask_size",
+                 "delta", "gamma", "theta", "vega", "rho", "iv",
+                 "quote_ts", "greeks_ts", "price", "trade_ts", "local_greeks")
+
+    def __init__(self):
+        self.bid = self.ask = self.bid_size = self.ask_size = None
+        self.delta = self.gamma = self.theta = self.vega = self.rho = self.iv = None
+        self.quote_ts = 0.0
+        self.greeks_ts = 0.0
+        self.price = None      # last trade (underlyings only)
+        self.trade_ts = 0.0
+        self.local_greeks = False   # delta/iv computed here (pricing.py), not from DxLink
+
+    def copy(self):
+        rec = MarketRecord.__new__(MarketRecord)
+        for f in MarketRecord.__slots__:
+            setattr(rec, f, getattr(self, f))
+        return rec
+
+    # Last trade, else quote mid; None if neither is known
+    @property
+    def spot(self):
+        if self.price:
+            return float(self.price)
+        if self.bid and self.ask:
+            return (float(self.bid) + float(self.ask)) / 2
+        return None
+
+    @property
+    def has_quote(self):
+        return self.quote_ts > 0
+
+    @property
+    def has_greeks(self):
+        return self.greeks_ts > 0 and self.delta is not None
+
+# ✅ Book of the latest Quote/Greeks per streamer symbol.
+# Writes come from the streamer thread (under its lock); the DxLink feed only sends
+# events on change, so a record received on the current live connection is current no
+# matter how old its timestamp is. Only data left over from a dropped connection ages.
+class MarketBook:
+
+    def __init__(self):
+        self._records = {}
+        self.live_since = None   # wall time the current connection (re)subscribed, None when down
+
+    def __len__(self):
+        return len(self._records)
+
+    def get(self, symbol):
+        return self._records.get(symbol)
+
+    def discard(self, symbol):
+        self._records.pop(symbol, None)
+
+    # apply_* take the event's values positionally, in DX_EVENT_FIELDS order (after
+    # eventType/eventSymbol), already cleaned by _dx_value
+    def apply_quote(self, symbol, values, now):
+        bp, ap, bs, asz = values
+        if bp is None and ap is None:
+            return False
+        rec = self._records.get(symbol)
+        if rec is None:
+            rec = self._records[symbol] = MarketRecord()
+        if bp is not None:
+            rec.bid = bp
+        if ap is not None:
+            rec.ask = ap
+        if bs is not None:
+            rec.bid_size = bs
+        if asz is not None:
+            rec.ask_size = asz
+        rec.quote_ts = now
+        return True
+
+    def apply_trade(self, symbol, values, now):
+        price = values[0]
+        if price is None:
+            return False
+        rec = self._records.get(symbol)
+        if rec is None:
+            rec = self._records[symbol] = MarketRecord()
+        rec.price = price
+        rec.trade_ts = now
+        return True
+
+    def apply_greeks(self, symbol, values, now):
+        iv, d, gamma, theta, rho, vega = values
+        if d is None:
+            return False
+        rec = self._records.get(symbol)
+        if rec is None:
+            rec = self._records[symbol] = MarketRecord()
+        rec.delta = d
+        rec.gamma = gamma
+        rec.theta = theta
+        rec.vega = vega
+        rec.rho = rho
+        rec.iv = iv
+        rec.greeks_ts = now
+        return True
+
+    def age(self, rec, now=None):
+        oldest = min(ts for ts in (rec.quote_ts, rec.greeks_ts, time.time()) if ts > 0)
+        if self._live(oldest):
+            return 0.0
+        return (now or time.time()) - oldest
+
+    # Record if it has Greeks (and Quote, unless need_quote=False) no older than max_age
+    def fresh(self, symbol, max_age, now=None, need_quote=True):
+        rec = self._records.get(symbol)
+        if rec is None or not rec.has_greeks or (need_quote and not rec.has_quote):
+            return None
+        if now is None:
+            now = time.time()
+        if not self.greeks_fresh(rec, max_age, now):
+            return None
+        if rec.has_quote and not self.quote_fresh(rec, max_age, now):
+            return None
+        return rec
+
+    def quote_fresh(self, rec, max_age, now):
+        return rec.has_quote and (now - rec.quote_ts <= max_age or self._live(rec.quote_ts))
+
+    def greeks_fresh(self, rec, max_age, now):
+        return rec.has_greeks and (now - rec.greeks_ts <= max_age or self._live(rec.greeks_ts))
+
+    def _live(self, ts):
+        return self.live_since is not None and ts >= self.live_since
+
+MARKET_BOOK = MarketBook()
+
+# ✅ Incremental coverage for one waiter: which of its symbols still lack Quote / Greeks.
+# The streamer notes every applied event, so completeness is an O(1) check instead of a
+# rescan of all symbols after every FEED_DATA message.
+class CoverageTracker:
+
+    def __init__(self, symbols, book, max_age, borrowed=None):
+        self.book = book
+        self.borrowed = borrowed or {}     # records taken from another worker (SharedQuotes)
+        self.symbols = set(symbols)
+        self.missing_quote = set()
+        self.missing_greeks = set()
+        self.changed = True                # new data since the caller last looked
+        self.first_event_at = None         # wall time of the first event for one of our symbols
+        now = time.time()
+        for s in self.symbols:
+            if s in self.borrowed:
                 continue
+            rec = book.get(s)
+            if rec is None or not book.quote_fresh(rec, max_age, now):
+                self.missing_quote.add(s)
+            if rec is None or not book.greeks_fresh(rec, max_age, now):
+                self.missing_greeks.add(s)
+
+    def note(self, symbol, kind):
+        if symbol not in self.symbols:
+            return
+        if kind == "Quote":
+            self.missing_quote.discard(symbol)
+        else:
+            self.missing_greeks.discard(symbol)
+        self.changed = True
+        if self.first_event_at is None:
+            self.first_event_at = time.time()
+
+    def forget(self, symbol):
+        if symbol in self.symbols and symbol not in self.borrowed:
+            self.missing_quote.add(symbol)
+            self.missing_greeks.add(symbol)
+
+    @property
+    def complete(self):
+        return not self.missing_quote and not self.missing_greeks
+
+    @property
+    def quotes_complete(self):
+        return not self.missing_quote
+
+    def has(self, symbol):
+        return symbol not in self.missing_quote and symbol not in self.missing_greeks
+
+    def record(self, symbol):
+        return self.borrowed.get(symbol) or self.book.get(symbol)
+
+# Default wait strategy: "bracket" stops once the target delta is straddled on both sides,
+# "full" waits for Quote + Greeks on every subscribed strike (or the timeout)
+WAIT_MODE = os.getenv("TT_WAIT_MODE", "bracket")
+
+def _side_bracketed(lookup, side_syms, target_delta):
+    # side_syms are in strike order, so |delta| is monotonic along the list and two fully
+    # known neighbours on opposite sides of the target fence in the closest strike
+    prev = None
+    for s in side_syms:
+        rec = lookup(s)
+        if rec is None or rec.delta is None:
+            prev = None
+            continue
+        diff = abs(float(rec.delta)) - target_delta
+        if diff == 0:
+            return True
+        if prev is not None and (prev < 0) != (diff < 0):
+            return True
+        prev = diff
+    return False
+
+# `source` is a CoverageTracker (live wait) or a {symbol: MarketRecord} snapshot
+def _bracket_lookup(source):
+    if isinstance(source, CoverageTracker):
+        return lambda s: source.record(s) if source.has(s) else None
+    return lambda s: (source[s] if s in source and source[s].has_quote and source[s].delta is not None
+                      else None)
+
+SHARED_QUOTE_FLUSH_SEC = float(os.getenv("TT_SHARED_QUOTE_FLUSH_SEC", "1.0"))
+
+# ✅ Mirrors each worker's live book into SHARED_STORE so other workers can answer from it.
+# Records carry the publishing pid; a per-pid heartbeat says whether that worker's stream is
+# still up, which lets readers apply the same "live connection" rule MarketBook uses.
+class SharedQuotes:
+    PREFIX = "tt:quote:"
+    LIVE_PREFIX = "tt:dx:live:"
+
+    def __init__(self, store, flush_sec):
+        self.store = store
+        self.flush_sec = flush_sec
+        self._lock = threading.Lock()
+        self._dirty = set()
+        self._removed = set()
+        self._thread = None
+
+    def mark(self, symbols):
+        with self._lock:
+            self._dirty.update(symbols)
+
+    def mark_removed(self, symbols):
+        with self._lock:
+            self._removed.update(symbols)
+            self._dirty.difference_update(symbols)
+
+    def start(self, book):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, args=(book,), name="shared-quotes", daemon=True)
+        self._thread.start()
+
+    def _run(self, book):
+        while True:
+            time.sleep(self.flush_sec)
+            try:
+                self.flush(book)
+            except Exception:
+                # Shared store is best-effort; the local book keeps working
+                pass
+
+    def flush(self, book):
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            removed, self._removed = self._removed, set()
+        pid = os.getpid()
+        mapping = {}
+        for s in dirty:
+            rec = book.get(s)
+            if rec is not None:
+                mapping[self.PREFIX + s] = json_dumps([getattr(rec, f) for f in MarketRecord.__slots__] + [pid])
+        if mapping:
+            self.store.mset(mapping)
+        if removed:
+            self.store.delete(*[self.PREFIX + s for s in removed])
+        self.store.set(self.LIVE_PREFIX + str(pid),
+                       json_dumps({"live_since": book.live_since, "at": time.time()}),
+                       ex=max(1, int(self.flush_sec * 5)))
+
+    # {symbol: MarketRecord} for symbols other workers hold with fresh Quote + Greeks
+    def load(self, symbols, max_age):
+        keys = [self.PREFIX + s for s in symbols]
+        try:
+            raws = self.store.mget(keys)
+        except Exception:
+            return {}
+        now = time.time()
+        live = {}
+        records = {}
+        for s, raw in zip(symbols, raws):
             if not raw:
                 continue
+            values = json_loads(raw)
+            rec = MarketRecord()
+            for f, v in zip(MarketRecord.__slots__, values):
+                setattr(rec, f, v)
+            if not rec.has_quote or not rec.has_greeks:
+                continue
+            pid = values[-1]
+            if pid not in live:
+                hb = self.store.get(self.LIVE_PREFIX + str(pid))
+                hb = json_loads(hb) if hb else {}
+                fresh_hb = hb.get("at", 0) > now - self.flush_sec * 3
+                live[pid] = hb.get("live_since") if fresh_hb else None
+            since = live[pid]
+            oldest = min(rec.quote_ts, rec.greeks_ts)
+            if (since is not None and oldest >= since) or now - oldest <= max_age:
+                records[s] = rec
+        return records
+
+SHARED_QUOTES = SharedQuotes(SHARED_STORE, SHARED_QUOTE_FLUSH_SEC) if SHARED_STORE is not None else None
+
+# ---- DxLink streaming client (one long-lived connection per process) ----
+DX_FEED_CHANNEL = 3
+DX_KEEPALIVE_SEC = 30          # we send KEEPALIVE well inside the 60s timeout
+DX_DATA_FORMAT = os.getenv("TT_DX_DATA_FORMAT", "COMPACT").upper()   # COMPACT or FULL (JSON objects)
+DX_RECONNECT_MAX_SEC = 30      # cap for reconnect backoff
+# Groups (scan leases and the warm "{symbol}|{expiration}" groups they are released into) not
+# set again for this long are unsubscribed, checked on every keepalive; 0 keeps them forever.
+# Stream topics are pinned.
+DX_GROUP_IDLE_SEC = float(os.getenv("TT_DX_GROUP_IDLE_SEC", "900"))
+DX_EVENT_FIELDS = {
+    "Quote": ["eventType", "eventSymbol", "bidPrice", "askPrice", "bidSize", "askSize"],
+    "Greeks": ["eventType", "eventSymbol", "volatility", "delta", "gamma", "theta", "rho", "vega"],
+    "Trade": ["eventType", "eventSymbol", "price"]
+}
+
+# DxLink sends missing numbers as "NaN"/"Infinity" strings (or NaN floats); treat them as absent
+def _dx_value(v):
+    if v is None or v.__class__ is str or v != v:
+        return None
+    return v
+
+# Same for a whole COMPACT column: the JSON parser only ever yields str for the
+# "NaN"-style placeholders, so a column without any str is used as-is
+def _dx_column(col):
+    if str in set(map(type, col)):
+        return [_dx_value(v) for v in col]
+    return col
+
+# ✅ Positional layout of each event type's COMPACT rows: (row length, eventSymbol index,
+# index of each DX_EVENT_FIELDS value or None). Built from the fields the server confirmed
+# in FEED_CONFIG, which may differ from what we asked for.
+def _compact_layouts(event_fields):
+    layouts = {}
+    for et, wanted in DX_EVENT_FIELDS.items():
+        fields = event_fields.get(et)
+        if not fields or "eventSymbol" not in fields:
+            continue
+        idx = [fields.index(f) if f in fields else None for f in wanted[2:]]
+        layouts[et] = (len(fields), fields.index("eventSymbol"), idx)
+    return layouts
+
+DX_COMPACT_LAYOUTS = _compact_layouts(DX_EVENT_FIELDS)
+
+# ✅ FEED_DATA -> (eventType, eventSymbol, values) with values positional as in DX_EVENT_FIELDS.
+# COMPACT data is ["Quote", [row, row, ...flattened], "Greeks", [...], ...]; each field is
+# pulled out as one strided slice and zipped back into rows, so nothing is built per event
+# beyond the values tuple. FULL ("JSON") data is one event object or a list of them.
+def _iter_feed_events(data, layouts=None):
+    if isinstance(data, list) and data and data[0].__class__ is str:
+        layouts = layouts or DX_COMPACT_LAYOUTS
+        for k in range(0, len(data) - 1, 2):
+            layout = layouts.get(data[k])
+            values = data[k + 1]
+            if layout is None or not isinstance(values, list):
+                continue
+            et = data[k]
+            n, si, idx = layout
+            end = len(values) - len(values) % n
+            syms = values[si:end:n]
+            cols = [_dx_column(values[i:end:n]) if i is not None else [None] * len(syms) for i in idx]
+            for es, row in zip(syms, zip(*cols)):
+                if es:
+                    yield et, es, row
+        return
+
+    # DXLink "JSON" format may deliver either a single event object or a list
+    if isinstance(data, dict):
+        data = [data]
+    if not isinstance(data, list):
+        return
+    for ev in data:
+        if not isinstance(ev, dict):
+            continue
+        fields = DX_EVENT_FIELDS.get(ev.get("eventType"))
+        if fields and ev.get("eventSymbol"):
+            yield ev["eventType"], ev["eventSymbol"], tuple(_dx_value(ev.get(f)) for f in fields[2:])
+
+# ✅ Background DxLink client: one authenticated FEED channel shared by all requests.
+# Subscriptions are grouped by a caller key, so a group can be replaced incrementally and a
+# streamer symbol stays subscribed while any group still uses it. Request scans each own a
+# lease (their own group, see lease()); stream topics own a pinned group per topic.
+class DxLinkStreamer:
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._send_lock = threading.Lock()
+        self._groups = {}      # key -> set(streamer symbols)
+        self._members = {}     # streamer symbol -> keys of the groups using it
+        self._touched = set()  # keys of groups with a book change since take_touched()
+        self._expires = {}     # key -> time after which an unused group is dropped (absent = pinned)
+        self._trackers = set() # CoverageTrackers of in-flight waits
+        self._lease_ids = itertools.count(1)
+        self._ws = None
+        self._thread = None
+        self._connected = False
+        self._authorized = False
+        self.version = 0       # bumped on every book change, for waiters polling several things
+        self.book = MARKET_BOOK
+        self._layouts = DX_COMPACT_LAYOUTS
+        self.last_error = None
+
+    # -- lifecycle --
+    def start(self):
+        with self._cond:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="dxlink-streamer", daemon=True)
+            self._thread.start()
+        if SHARED_QUOTES is not None:
+            SHARED_QUOTES.start(self.book)
+
+    def _send(self, obj):
+        ws = self._ws
+        if ws is None:
+            return False
+        with self._send_lock:
+            ws.send(json_dumps(obj))
+        return True
+
+    def _connect(self):
+        # Fresh quote token on every (re)connect; it is only valid for a limited time
+        access_token = get_valid_access_token()
+        dx_token, dx_url = get_api_quote_token(access_token)
+        if not dx_token or not dx_url:
+            raise Exception("Failed to obtain DxLink token/url")
+
+        with timed("ws_connect"):
+            ws = create_connection(dx_url, timeout=10)
+            ws.settimeout(1.0)
+            self._ws = ws
+            self._open_session(dx_token)
+
+    # SETUP/AUTH/FEED handshake on the fresh socket, then replay the subscription set
+    def _open_session(self, dx_token):
+        self._authorized = False
+        self._layouts = DX_COMPACT_LAYOUTS
+        self._send({"type": "SETUP", "channel": 0, "version": "wheelwatchlist/1.0",
+                    "keepaliveTimeout": 60, "acceptKeepaliveTimeout": 60})
+        self._send({"type": "AUTH", "channel": 0, "token": dx_token})
+        self._send({"type": "CHANNEL_REQUEST", "channel": DX_FEED_CHANNEL,
+                    "service": "FEED", "parameters": {"contract": "AUTO"}})
+        self._send({
+            "type": "FEED_SETUP",
+            "channel": DX_FEED_CHANNEL,
+            "acceptAggregationPeriod": 0.1,
+            "acceptDataFormat": "COMPACT" if DX_DATA_FORMAT == "COMPACT" else "JSON",
+            "acceptEventFields": DX_EVENT_FIELDS
+        })
+
+        # Replay the current subscription set on the fresh channel. Sent under the lock so
+        # that no set_groups() delta can go out ahead of the reset (which would discard it)
+        with self._cond:
+            self._send({"type": "FEED_SUBSCRIPTION", "channel": DX_FEED_CHANNEL, "reset": True,
+                        "add": _subscription_entries(list(self._members))})
+            self._connected = True
+            self.book.live_since = time.time()
+
+    def _disconnect(self):
+        with self._cond:
+            self._connected = False
+            self.book.live_since = None
+        ws, self._ws = self._ws, None
+        if ws is not None:
             try:
-                msg = json.loads(raw)
+                ws.close()
             except Exception:
-                continue
+                pass
 
-            if not isinstance(msg, dict):
+    def _run(self):
+        backoff = 1
+        while True:
+            try:
+                self._connect()
+                BREAKERS["dxlink"].record_success()
+                backoff = 1
+                self._read_loop()
+            except Exception as e:
+                self.last_error = str(e)
+                BREAKERS["dxlink"].record_failure(e)
+            self._disconnect()
+            time.sleep(backoff)
+            backoff = min(backoff * 2, DX_RECONNECT_MAX_SEC)
+
+    def _read_loop(self):
+        last_keepalive = time.time()
+        while True:
+            if time.time() - last_keepalive >= DX_KEEPALIVE_SEC:
+                self._send({"type": "KEEPALIVE", "channel": 0})
+                last_keepalive = time.time()
+                self.evict_idle()
+            try:
+                raw = self._ws.recv()
+            except WebSocketTimeoutException:
                 continue
+            if not raw:
+                # Server closed the socket
+                raise Exception("DxLink connection closed")
+            self._handle_message(raw)
 
-            # Expect FEED_DATA with "data": list of events or single event object
-            if msg.get("type") == "FEED_DATA":
-                data = msg.get("data")
-                if not data:
-                    continue
-
-                # DXLink "JSON" format may deliver either a single event object or a list
-                # Normalize to list of event dicts
-                events = []
-                if isinstance(data, list):
-                    # Each element might already be an object like {"eventType":"Quote",...}
-                    for ev in data:
-                        if isinstance(ev, dict) and ev.get("eventType") in ("Quote", "Greeks"):
-                            events.append(ev)
-                elif isinstance(data, dict):
-                    if data.get("eventType") in ("Quote", "Greeks"):
-                        events.append(data)
-
-                for ev in events:
-                    et = ev.get("eventType")
-                    es = ev.get("eventSymbol")
-                    if not es:
-                        continue
-                    if et == "Quote":
-                        bp = ev.get("bidPrice")
-                        ap = ev.get("askPrice")
-                        if bp is not None or ap is not None:
-                            q = quotes.get(es, {})
-                            if bp is not None:
-                                q["bid"] = bp
-                            if ap is not None:
-                                q["ask"] = ap
-                            quotes[es] = q
-                    elif et == "Greeks":
-                        d = ev.get("delta")
-                        if d is not None:
-                            greeks[es] = {"delta": d}
-
-            # Early exit if we already have coverage for all symbols
-            # (both quote + greeks present)
-            complete = True
-            for s in symbols:
-                if s not in greeks or s not in quotes:
-                    complete = False
-                    break
-            if complete:
-                break
-    finally:
+    # One raw protocol message; raises when the session has to be re-established
+    def _handle_message(self, raw):
         try:
-            ws.close()
+            msg = json_loads(raw)
         except Exception:
-            pass
-
-    return quotes, greeks
-
-# ✅ Find options closest to 30 delta using DxLink for quotes + greeks
-def find_30_delta_options(symbol, expiration, token):
-    # 1) get streamer symbols for this expiration
-    put_syms, call_syms, sym_to_strike = get_streamer_symbols_for_expiration(symbol, expiration, token)
-
-    # 2) get api quote token + dxlink url
-    dx_token, dx_url = get_api_quote_token(token)
-    if not dx_token or not dx_url:
-        raise Exception("Failed to obtain DxLink token/url")
-
-    # 3) subscribe via DxLink and collect quick snapshot
-    symbols = put_syms + call_syms
-    quotes, greeks = dxlink_fetch_quotes_and_greeks(dx_url, dx_token, symbols, timeout_sec=3.0)
-
-    # 4) pick closest to 0.30 |delta| for each side, using only symbols we have greeks for
+            return
+        if not isinstance(msg, dict):
+            return
+
+        mtype = msg.get("type")
+        if mtype == "FEED_DATA":
+            self._apply_events(msg.get("data"))
+        elif mtype == "FEED_CONFIG" and isinstance(msg.get("eventFields"), dict):
+            self._layouts = _compact_layouts(msg["eventFields"])
+        elif mtype == "AUTH_STATE" and msg.get("state") == "UNAUTHORIZED" and msg.get("channel") == 0:
+            # Expected once before AUTH is processed; after that it means the token expired
+            if self._authorized:
+                self._authorized = False
+                raise Exception("DxLink session unauthorized")
+        elif mtype == "AUTH_STATE" and msg.get("state") == "AUTHORIZED":
+            self._authorized = True
+        elif mtype == "CHANNEL_CLOSED" and msg.get("channel") == DX_FEED_CHANNEL:
+            raise Exception("DxLink feed channel closed")
+        elif mtype == "ERROR":
+            self.last_error = f"{msg.get('error')}: {msg.get('message')}"
+
+    def _apply_events(self, data):
+        changed = []
+        received = {}
+        now = time.time()
+        with self._cond:
+            for et, es, values in _iter_feed_events(data, self._layouts):
+                received[et] = received.get(et, 0) + 1
+                groups = self._members.get(es)
+                if groups is None:
+                    # Late event for something we already unsubscribed
+                    continue
+                if et == "Quote":
+                    applied = self.book.apply_quote(es, values, now)
+                elif et == "Greeks":
+                    applied = self.book.apply_greeks(es, values, now)
+                else:
+                    applied = self.book.apply_trade(es, values, now)
+                if applied:
+                    changed.append(es)
+                    self._touched.update(groups)
+                    for t in self._trackers:
+                        t.note(es, et)
+            if changed:
+                self.version += 1
+                self._cond.notify_all()
+        for et, n in received.items():
+            DX_EVENTS.inc(et, amount=n)
+        if changed and SHARED_QUOTES is not None:
+            SHARED_QUOTES.mark(changed)
+
+    # -- subscriptions --
+    # Make `key` subscribe exactly `symbols`, sending only the add/remove delta.
+    # pinned=True exempts the group from idle eviction (it stays until dropped).
+    def set_group(self, key, symbols, pinned=False):
+        self.set_groups({key: symbols}, pinned)
+
+    # Same as set_group for many keys at once, in a single FEED_SUBSCRIPTION message
+    def set_groups(self, groups, pinned=False):
+        with self._cond:
+            added, removed = self._update_groups(groups, pinned)
+            connected = self._connected
+        self._send_changes(added, removed, connected)
+        self.start()
+
+    # Caller holds self._cond; returns the symbols that gained/lost their last group
+    def _update_groups(self, groups, pinned=False):
+        added, removed = [], []
+        expires = time.time() + DX_GROUP_IDLE_SEC
+        for key, symbols in groups.items():
+            symbols = set(symbols)
+            old = self._groups.get(key, set())
+            for s in symbols - old:
+                members = self._members.setdefault(s, set())
+                members.add(key)
+                if len(members) == 1:
+                    added.append(s)
+            for s in old - symbols:
+                members = self._members[s]
+                members.discard(key)
+                if not members:
+                    del self._members[s]
+                    self.book.discard(s)
+                    for t in self._trackers:
+                        t.forget(s)
+                    removed.append(s)
+            if symbols:
+                self._groups[key] = symbols
+                if pinned or not DX_GROUP_IDLE_SEC:
+                    self._expires.pop(key, None)
+                else:
+                    self._expires[key] = expires
+            else:
+                self._groups.pop(key, None)
+                self._expires.pop(key, None)
+        return added, removed
+
+    def _send_changes(self, added, removed, connected):
+        if removed and SHARED_QUOTES is not None:
+            SHARED_QUOTES.mark_removed(removed)
+        if connected and (added or removed):
+            msg = {"type": "FEED_SUBSCRIPTION", "channel": DX_FEED_CHANNEL}
+            if added:
+                msg["add"] = _subscription_entries(added)
+            if removed:
+                msg["remove"] = _subscription_entries(removed)
+            try:
+                self._send(msg)
+            except Exception:
+                # Read loop will notice the broken socket and resubscribe on reconnect
+                pass
+
+    def drop_group(self, key):
+        self.set_group(key, ())
+
+    # Add symbols to groups without dropping what they already stream, so a repeat request
+    # keeps its warm window while the underlying's price is (re)checked
+    def extend_groups(self, groups, pinned=False):
+        with self._cond:
+            merged = {key: self._groups.get(key, set()) | set(symbols) for key, symbols in groups.items()}
+        self.set_groups(merged, pinned)
+
+    # A group key private to one in-flight scan of `key`, so that concurrent scans of the same
+    # underlying (other expiration, delta or window) never replace each other's symbols.
+    # Pair with release().
+    def lease(self, key):
+        return f"{key}#{next(self._lease_ids)}"
+
+    # End a lease. Its symbols listed in `keep` ({key: symbols}) are first merged into those
+    # shared groups, which are only ever extended and stay warm until they idle out
+    def release(self, lease, keep=None):
+        with self._cond:
+            groups = {key: self._groups.get(key, set()) | set(symbols) for key, symbols in (keep or {}).items()}
+            groups[lease] = ()
+            added, removed = self._update_groups(groups)
+            connected = self._connected
+        self._send_changes(added, removed, connected)
+
+    # Drop unpinned groups nobody has set for DX_GROUP_IDLE_SEC; returns their keys
+    def evict_idle(self):
+        with self._cond:
+            now = time.time()
+            expired = [key for key, expires in self._expires.items() if expires <= now]
+            added, removed = self._update_groups({key: () for key in expired})
+            connected = self._connected
+        self._send_changes(added, removed, connected)
+        return expired
+
+    # Group keys whose symbols changed since the previous call. Meant for a single consumer
+    # (the stream hub's publisher), which only re-evaluates what these cover.
+    def take_touched(self):
+        with self._cond:
+            touched, self._touched = self._touched, set()
+        return touched
+
+    # -- reads --
+    # Register a CoverageTracker for symbols; pair with untrack()
+    def track(self, symbols, max_age=None, borrowed=None):
+        if max_age is None:
+            max_age = MAX_STALENESS_SEC
+        with self._cond:
+            tracker = CoverageTracker(symbols, self.book, max_age, borrowed)
+            self._trackers.add(tracker)
+        return tracker
+
+    def untrack(self, tracker):
+        with self._cond:
+            self._trackers.discard(tracker)
+
+    # Wait up to timeout_sec for fresh Quote + Greeks on every symbol, or until
+    # until(tracker) says the data is good enough. Returns {symbol: MarketRecord copy}
+    # for every symbol with fresh Greeks or a fresh Quote. With `timings`, records how long
+    # the first event and the whole wait took.
+    def snapshot(self, symbols, timeout_sec=3.0, max_age=None, until=None, timings=None):
+        if max_age is None:
+            max_age = MAX_STALENESS_SEC
+        t_start = time.time()
+        t_end = t_start + timeout_sec
+        borrowed = {}
+        if SHARED_QUOTES is not None:
+            # Another worker may already be streaming what we are missing
+            with self._cond:
+                now = time.time()
+                missing = [s for s in symbols if not self.book.fresh(s, max_age, now)]
+            if missing:
+                borrowed = SHARED_QUOTES.load(missing, max_age)
+        tracker = self.track(symbols, max_age, borrowed)
+        try:
+            with self._cond:
+                while not tracker.complete:
+                    if until is not None and tracker.changed:
+                        tracker.changed = False
+                        if until(tracker):
+                            break
+                    remaining = t_end - time.time()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                records = self._collect(symbols, max_age)
+        finally:
+            self.untrack(tracker)
+        if timings is not None:
+            if tracker.first_event_at is not None:
+                timings.record("first_event", tracker.first_event_at - t_start)
+            timings.record("coverage", time.time() - t_start)
+        for s, rec in borrowed.items():
+            if s not in records or not records[s].has_quote:
+                records[s] = rec
+        return records
+
+    # Non-blocking read of whatever the book has for symbols
+    def collect(self, symbols, max_age=None):
+        if max_age is None:
+            max_age = MAX_STALENESS_SEC
+        with self._cond:
+            return self._collect(symbols, max_age)
+
+    # Fresh Greeks and/or fresh Quote; quote-only records feed the local greeks engine
+    def _collect(self, symbols, max_age):
+        now = time.time()
+        records = {}
+        for s in symbols:
+            rec = self.book.get(s)
+            if rec is None:
+                continue
+            if self.book.greeks_fresh(rec, max_age, now) or self.book.quote_fresh(rec, max_age, now):
+                records[s] = rec.copy()
+        return records
+
+    # Wait up to timeout_sec for a price (trade or quote mid) on each underlying
+    def wait_for_prices(self, symbols, timeout_sec=1.0):
+        t_end = time.time() + timeout_sec
+        with self._cond:
+            while True:
+                prices = {}
+                for s in symbols:
+                    rec = self.book.get(s)
+                    if rec is not None and rec.spot:
+                        prices[s] = rec.spot
+                remaining = t_end - time.time()
+                if len(prices) == len(symbols) or remaining <= 0:
+                    return prices
+                self._cond.wait(remaining)
+
+    # Block until the book changes after `version` (or timeout); returns the new version
+    def wait_for_change(self, version, timeout_sec):
+        with self._cond:
+            if self.version == version:
+                self._cond.wait(timeout_sec)
+            return self.version
+
+def _subscription_entries(symbols):
+    # Option streamer symbols start with "."; anything else is an underlying
+    add_list = []
+    for s in symbols:
+        add_list.append({"type": "Quote", "symbol": s})
+        add_list.append({"type": "Greeks" if s.startswith(".") else "Trade", "symbol": s})
+    return add_list
+
+_STREAMER = None
+_STREAMER_LOCK = threading.Lock()
+
+def get_streamer():
+    # Created lazily so each gunicorn worker gets its own connection after fork
+    global _STREAMER
+    with _STREAMER_LOCK:
+        if _STREAMER is None:
+            _STREAMER = DxLinkStreamer()
+        return _STREAMER
+
+# ✅ Pick the put and call closest to target_delta from a book snapshot
+def select_delta_options(symbol, expiration, put_syms, call_syms, sym_to_strike, records, target_delta=0.30):
+    # pick closest to target |delta| for each side, using only symbols we have greeks for
     def pick_closest(sym_list):
         best = None
         best_abs = 999
         for s in sym_list:
-            g = greeks.get(s)
-            if not g or g.get("delta") is None:
+            rec = records.get(s)
+            if rec is None or rec.delta is None:
                 continue
-            d = abs(abs(float(g["delta"])) - 0.30)
+            d = abs(abs(float(rec.delta)) - target_delta)
             if d < best_abs:
                 best_abs = d
                 best = s
@@ -364,25 +1458,1463 @@ def find_30_delta_options(symbol, expiration, token):
     if not best_put_sym or not best_call_sym:
         raise Exception(f"Insufficient options with greeks for {symbol} @ {expiration}")
 
-    def pack(side_sym):
-        q = quotes.get(side_sym, {})
-        return {
-            "strike": sym_to_strike.get(side_sym),
-            "bid": q.get("bid"),
-            "ask": q.get("ask"),
-            "delta": greeks.get(side_sym, {}).get("delta")
-        }
-
     return {
         "expiration": expiration,
-        "put": pack(best_put_sym),
-        "call": pack(best_call_sym)
+        "put": pack_leg(best_put_sym, put_syms, records, sym_to_strike, target_delta),
+        "call": pack_leg(best_call_sym, call_syms, records, sym_to_strike, target_delta)
     }
 
+# ✅ Response shape for one chosen option
+def pack_leg(side_sym, side_syms, records, sym_to_strike, target_delta):
+    rec = records[side_sym]
+    leg = {
+        "strike": sym_to_strike.get(side_sym),
+        "bid": rec.bid,
+        "ask": rec.ask,
+        "delta": rec.delta,
+        "age": round(MARKET_BOOK.age(rec), 3)
+    }
+    if rec.local_greeks:
+        leg["greeks_source"] = "local"
+    # Strike at exactly target delta, interpolated between the bracketing strikes
+    known = [s for s in side_syms if s in records and records[s].delta is not None]
+    target_strike, _ = strike_for_delta([sym_to_strike[s] for s in known],
+                                        [records[s].delta for s in known], target_delta)
+    if target_strike is not None:
+        leg["target_strike"] = round(target_strike, 2)
+    return leg
+
+# ---- Local greeks (pricing.py) ----
+RISK_FREE_RATE = float(os.getenv("TT_RISK_FREE_RATE", "0.045"))
+# "dxlink": DxLink Greeks, local Black-Scholes only for strikes still missing them
+# "local": compute delta/IV locally from Quote mids for every strike (Greeks events unused)
+GREEKS_SOURCE = os.getenv("TT_GREEKS_SOURCE", "dxlink")
+MARKET_TZ = ZoneInfo(os.getenv("TT_MARKET_TZ", "America/New_York"))
+
+# Years to expiration, counting to the 4pm close in MARKET_TZ (whatever the host's zone)
+# and never quite zero
+def _years_to_expiration(expiration, now=None):
+    day = parser.parse(expiration).date()
+    close = datetime(day.year, day.month, day.day, 16, tzinfo=MARKET_TZ)
+    now = now or datetime.now(timezone.utc)
+    return max((close - now).total_seconds(), 3600.0) / (365.0 * 86400.0)
+
+# ✅ Fill delta/iv on quote-only records (or all quoted records when overwrite=True)
+def apply_local_greeks(records, option_syms, sym_to_strike, put_set, spot, expiration,
+                       rate=None, overwrite=False):
+    if not spot:
+        return 0
+    todo = []
+    for s in option_syms:
+        rec = records.get(s)
+        if rec is None or rec.bid is None or rec.ask is None:
+            continue
+        if rec.delta is not None and not overwrite:
+            continue
+        todo.append(s)
+    if not todo:
+        return 0
+
+    strikes = np.array([sym_to_strike[s] for s in todo], dtype=float)
+    mids = np.array([(float(records[s].bid) + float(records[s].ask)) / 2 for s in todo], dtype=float)
+    is_call = np.array([s not in put_set for s in todo], dtype=bool)
+    iv, delta = expiration_greeks(float(spot), strikes, _years_to_expiration(expiration),
+                                  RISK_FREE_RATE if rate is None else rate, mids, is_call)
+    filled = 0
+    for s, v, d in zip(todo, iv, delta):
+        if np.isnan(d):
+            continue
+        rec = records[s]
+        rec.delta, rec.iv = float(d), float(v)
+        rec.gamma = rec.theta = rec.vega = rec.rho = None
+        rec.greeks_ts = rec.quote_ts
+        rec.local_greeks = True
+        filled += 1
+    return filled
+
+# ---- Strike windowing ----
+# Strikes subscribed on each side of the underlying price at first (0 = whole expiration);
+# the window doubles whenever the target delta is not bracketed inside it
+STRIKE_WINDOW = int(os.getenv("TT_STRIKE_WINDOW", "8"))
+SPOT_WAIT_SEC = float(os.getenv("TT_SPOT_WAIT_SEC", "1.0"))
+
+# ✅ Subset of an expiration's strikes centred on the underlying price, widened on demand
+class StrikeWindow:
+
+    def __init__(self, put_syms, call_syms, sym_to_strike, spot=None, half_width=None):
+        self.put_syms = put_syms
+        self.call_syms = call_syms
+        self.sym_to_strike = sym_to_strike
+        self.strikes = sorted(set(sym_to_strike[s] for s in put_syms + call_syms))
+        if spot is None or not half_width:
+            # No price (or windowing off): cover the whole expiration
+            self.center, self.half_width = 0, len(self.strikes)
+        else:
+            self.center, self.half_width = bisect.bisect_left(self.strikes, spot), half_width
+
+    @property
+    def full(self):
+        return self.center - self.half_width <= 0 and self.center + self.half_width >= len(self.strikes)
+
+    def widen(self):
+        if self.full:
+            return False
+        self.half_width *= 2
+        return True
+
+    def sides(self):
+        if self.full:
+            return self.put_syms, self.call_syms
+        lo = self.strikes[max(0, self.center - self.half_width)]
+        hi = self.strikes[min(len(self.strikes), self.center + self.half_width) - 1]
+        puts = [s for s in self.put_syms if lo <= self.sym_to_strike[s] <= hi]
+        calls = [s for s in self.call_syms if lo <= self.sym_to_strike[s] <= hi]
+        return puts, calls
+
+# ✅ One underlying's delta search: its expiration, current strike window and target
+class DeltaScan:
+
+    def __init__(self, symbol, expiration, put_syms, call_syms, sym_to_strike,
+                 target_delta=0.30, spot=None, half_width=None, greeks_source=None, rate=None,
+                 targets=None, sides=("put", "call")):
+        self.greeks_source = greeks_source or GREEKS_SOURCE
+        self.rate = rate
+        self.targets = targets or [target_delta]   # every |delta| that must end up bracketed
+        self.sides = sides
+        self.symbol = symbol
+        self.expiration = expiration
+        self.put_syms = put_syms
+        self.call_syms = call_syms
+        self.sym_to_strike = sym_to_strike
+        self.target_delta = target_delta
+        self.spot = spot
+        self.window = StrikeWindow(put_syms, call_syms, sym_to_strike, spot, half_width)
+
+    # Option symbols currently worth streaming
+    def option_symbols(self):
+        puts, calls = self.window.sides()
+        return puts + calls
+
+    # What this underlying's subscription group should hold (options + the underlying itself)
+    def subscription(self):
+        return self.option_symbols() + [self.symbol]
+
+    # Shared group the scan's lease is released into (DxLinkStreamer.release)
+    def keep(self):
+        return {f"{self.symbol}|{self.expiration}": self.subscription()}
+
+    def bracketed(self, source):
+        puts, calls = self.window.sides()
+        lookup = _bracket_lookup(source)
+        for t in self.targets:
+            if "put" in self.sides and not _side_bracketed(lookup, puts, t):
+                return False
+            if "call" in self.sides and not _side_bracketed(lookup, calls, t):
+                return False
+        return True
+
+    # Early-exit test while waiting on the stream; None means wait for full coverage
+    def wait_until(self, bracket):
+        if self.greeks_source == "local" and self.spot:
+            # Only quotes matter; greeks come from pricing.py afterwards
+            return lambda tracker: tracker.quotes_complete
+        return self.bracketed if bracket else None
+
+    # Post-process a snapshot: local greeks as primary path, or as fallback when the
+    # streamed Greeks don't bracket the target (late/missing events). Then it goes to the
+    # snapshot store unless record=False.
+    def finish(self, records, record=True):
+        if self.spot:
+            local = self.greeks_source == "local"
+            if local or not self.bracketed(records):
+                apply_local_greeks(records, self.option_symbols(), self.sym_to_strike, set(self.put_syms),
+                                   self.spot, self.expiration, self.rate, overwrite=local)
+        if record:
+            self.record(records)
+        return records
+
+    def record(self, records):
+        if SNAPSHOTS is not None:
+            SNAPSHOTS.append(self.symbol, self.expiration, self.spot, self.option_symbols(), records,
+                             self.sym_to_strike, self.put_syms)
+
+    def select(self, records):
+        return select_delta_options(self.symbol, self.expiration, self.put_syms, self.call_syms,
+                                    self.sym_to_strike, records, self.target_delta)
+
+# ✅ Find options closest to 30 delta using DxLink for quotes + greeks
+def find_30_delta_options(symbol, expiration, token, max_age=None, target_delta=0.30, wait_mode=None,
+                          strike_window=None, timeout_sec=3.0, greeks_source=None, rate=None, timings=None):
+    BREAKERS["dxlink"].check(probe=False)
+    t_end = time.time() + timeout_sec
+    bracket = (wait_mode or WAIT_MODE) == "bracket"
+    half_width = STRIKE_WINDOW if strike_window is None else strike_window
+    timings = timings or Timings()
+
+    # 1) get streamer symbols for this expiration
+    with timings.stage("chain_symbols"):
+        put_syms, call_syms, sym_to_strike = get_streamer_symbols_for_expiration(symbol, expiration, token)
+
+    # 2) underlying price, to centre the strike window
+    # (also needed by the local greeks engine)
+    streamer = get_streamer()
+    lease = streamer.lease(symbol)
+    scan = None
+    try:
+        with timings.stage("spot"):
+            streamer.set_group(lease, [symbol])
+            spot = streamer.wait_for_prices([symbol], min(SPOT_WAIT_SEC, timeout_sec)).get(symbol)
+        scan = DeltaScan(symbol, expiration, put_syms, call_syms, sym_to_strike, target_delta, spot, half_width,
+                         greeks_source, rate)
+
+        # 3) stream the window; widen while the window is covered but the target isn't bracketed
+        records = {}
+        while True:
+            streamer.set_group(lease, scan.subscription())
+            records = streamer.snapshot(scan.option_symbols(), timeout_sec=max(0.0, t_end - time.time()),
+                                        max_age=max_age, until=scan.wait_until(bracket), timings=timings)
+            with timings.stage("finish"):
+                scan.finish(records)
+            if time.time() >= t_end or scan.bracketed(records) or not scan.window.widen():
+                break
+    finally:
+        streamer.release(lease, scan.keep() if scan else None)
+
+    # 4) pick closest to target |delta| for each side
+    with timings.stage("selection"):
+        return scan.select(records)
+
+# ---- Strategy queries (many deltas / expirations / sides against one chain + snapshot) ----
+QUERY_MAX_EXPIRATIONS = int(os.getenv("TT_QUERY_MAX_EXPIRATIONS", "8"))
+
+# ✅ One side of one expiration sorted by |delta|, so each target is a binary search
+class DeltaIndex:
+
+    def __init__(self, side_syms, records):
+        pairs = sorted(
+            (abs(float(records[s].delta)), s)
+            for s in side_syms if s in records and records[s].delta is not None
+        )
+        self.deltas = [d for d, _ in pairs]
+        self.symbols = [s for _, s in pairs]
+
+    def nearest(self, target_delta):
+        i = bisect.bisect_left(self.deltas, target_delta)
+        best = None
+        for j in (i - 1, i):
+            if 0 <= j < len(self.deltas):
+                if best is None or abs(self.deltas[j] - target_delta) < abs(self.deltas[best] - target_delta):
+                    best = j
+        return self.symbols[best] if best is not None else None
+
+# ✅ Evaluate every (expiration, side, target delta) combination from one parsed chain and
+# one streamed snapshot. dtes picks the closest expiration to each value; dte_range adds
+# every expiration inside [min, max].
+def query_options(symbol, token, deltas=(0.30,), sides=("put", "call"), dtes=(21,), dte_range=None,
+                  max_age=None, wait_mode=None, strike_window=None, timeout_sec=5.0,
+                  greeks_source=None, rate=None):
+    BREAKERS["dxlink"].check(probe=False)
+    t_end = time.time() + timeout_sec
+    bracket = (wait_mode or WAIT_MODE) == "bracket"
+    half_width = STRIKE_WINDOW if strike_window is None else strike_window
+
+    # 1) one chain document -> the expirations asked for
+    chain = get_parsed_chain(symbol, token, context="expirations_fetch_failed")
+    if not chain.expirations:
+        raise Exception(f"No expirations found for {symbol}")
+    expirations = [chain.closest_expiration(d) for d in dtes]
+    if dte_range:
+        expirations += chain.expirations_between(dte_range[0], dte_range[1])
+    expirations = list(dict.fromkeys(e for e in expirations if e))[:QUERY_MAX_EXPIRATIONS]
+
+    # 2) spot, then one strike window per expiration wide enough for every target
+    streamer = get_streamer()
+    lease = streamer.lease(symbol)
+    scans = []
+    try:
+        streamer.set_group(lease, [symbol])
+        spot = streamer.wait_for_prices([symbol], min(SPOT_WAIT_SEC, timeout_sec)).get(symbol)
+        for exp in expirations:
+            put_syms, call_syms, sym_to_strike = get_streamer_symbols_for_expiration(symbol, exp, token)
+            scans.append(DeltaScan(symbol, exp, put_syms, call_syms, sym_to_strike, spot=spot,
+                                   half_width=half_width, greeks_source=greeks_source, rate=rate,
+                                   targets=list(deltas), sides=sides))
+
+        # 3) one subscription + one wait for all of them, widening windows that miss a target
+        records = {}
+        active = list(scans)
+        while active:
+            streamer.set_group(lease, [s for scan in scans for s in scan.option_symbols()] + [symbol])
+            checks = [scan.wait_until(bracket) for scan in active]
+            until = None
+            if all(checks):
+                until = lambda tracker: all(check(tracker) for check in checks)
+            opt_syms = [s for scan in active for s in scan.option_symbols()]
+            records.update(streamer.snapshot(opt_syms, timeout_sec=max(0.0, t_end - time.time()),
+                                             max_age=max_age, until=until))
+            for scan in active:
+                scan.finish(records)
+            if time.time() >= t_end:
+                break
+            active = [scan for scan in active if not scan.bracketed(records) and scan.window.widen()]
+    finally:
+        streamer.release(lease, {key: syms for scan in scans for key, syms in scan.keep().items()})
+
+    # 4) every target is a bisect into the per-side delta index
+    out = []
+    for scan in scans:
+        legs = []
+        for side in sides:
+            side_syms = scan.put_syms if side == "put" else scan.call_syms
+            index = DeltaIndex(side_syms, records)
+            for target in deltas:
+                best = index.nearest(target)
+                if best is None:
+                    legs.append({"side": side, "target_delta": target, "error": "No options with greeks"})
+                    continue
+                leg = pack_leg(best, side_syms, records, scan.sym_to_strike, target)
+                leg.update({"side": side, "target_delta": target, "iv": records[best].iv})
+                legs.append(leg)
+        out.append({
+            "expiration": scan.expiration,
+            "dte": chain.get(scan.expiration).dte,
+            "legs": legs
+        })
+
+    return {"symbol": symbol, "spot": spot, "expirations": out}
+
+# ---- Batch scans ----
+BATCH_MAX_WORKERS = int(os.getenv("TT_BATCH_MAX_WORKERS", "8"))
+BATCH_MAX_SYMBOLS = int(os.getenv("TT_BATCH_MAX_SYMBOLS", "500"))
+BATCH_EXECUTOR = ThreadPoolExecutor(max_workers=BATCH_MAX_WORKERS, thread_name_prefix="batch")
+# Upper bound on a client's "timeout": each second of it holds a request thread and a subscription group
+MAX_TIMEOUT_SEC = float(os.getenv("TT_MAX_TIMEOUT_SEC", "30"))
+
+# ✅ One numeric request value; a malformed one raises ValueError naming the field (the routes answer 400)
+def parse_number(name, value, cast=float):
+    try:
+        number = cast(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f"{name} must be {'an integer' if cast is int else 'a number'}") from None
+    if not np.isfinite(number):
+        raise ValueError(f"{name} must be finite")
+    return number
+
+def number_field(data, name, cast=float, default=None):
+    value = data.get(name)
+    return default if value is None else parse_number(name, value, cast)
+
+# Request fields shared by /fetch, /fetch/batch and /screen (both entry points) as scan kwargs; raises ValueError
+def scan_options(data):
+    return {
+        "target_dte": number_field(data, 'target_dte', int, 21),
+        "target_delta": number_field(data, 'target_delta', float, 0.30),
+        "max_age": number_field(data, 'max_staleness'),
+        "wait_mode": data.get('wait'),
+        "strike_window": number_field(data, 'strike_window', int),
+        "greeks_source": data.get('greeks'),
+        "rate": number_field(data, 'rate'),
+    }
+
+# The client's "timeout" in seconds (default 5), at most TT_MAX_TIMEOUT_SEC; raises ValueError
+def timeout_option(data):
+    timeout_sec = number_field(data, 'timeout', float, 5.0)
+    if not 0 <= timeout_sec <= MAX_TIMEOUT_SEC:
+        raise ValueError(f"timeout must be between 0 and {MAX_TIMEOUT_SEC:g}")
+    return timeout_sec
+
+# ✅ Chain lookups for one underlying: (expiration, puts, calls, sym_to_strike)
+def _prepare_symbol(symbol, token, target_dte):
+    expiration = get_closest_expiration(symbol, token, target_dte)
+    put_syms, call_syms, sym_to_strike = get_streamer_symbols_for_expiration(symbol, expiration, token)
+    return expiration, put_syms, call_syms, sym_to_strike
+
+# ✅ Scan many underlyings: chains fetched concurrently, one subscription update per window step
+def find_delta_options_batch(symbols, token, target_delta=0.30, target_dte=21,
+                             max_age=None, timeout_sec=5.0, wait_mode=None, strike_window=None,
+                             greeks_source=None, rate=None):
+    t_end = time.time() + timeout_sec
+    bracket = (wait_mode or WAIT_MODE) == "bracket"
+    half_width = STRIKE_WINDOW if strike_window is None else strike_window
+    streamer = get_streamer()
+    # Underlying prices stream in while the chains are being fetched
+    leases = {sym: streamer.lease(sym) for sym in symbols}
+    scans = {}
+    try:
+        streamer.set_groups({leases[sym]: [sym] for sym in symbols})
+
+        results = {}
+        prepared = {}
+        futures = {sym: BATCH_EXECUTOR.submit(_prepare_symbol, sym, token, target_dte) for sym in symbols}
+        for sym, fut in futures.items():
+            try:
+                prepared[sym] = fut.result()
+            except requests.HTTPError as http_err:
+                results[sym] = {"error": "HTTPError", "details": str(http_err)}
+            except Exception as e:
+                results[sym] = {"error": str(e)}
+        for sym in results:
+            streamer.release(leases.pop(sym))
+
+        spots = streamer.wait_for_prices(list(prepared), min(SPOT_WAIT_SEC, timeout_sec))
+        scans = {sym: DeltaScan(sym, p[0], p[1], p[2], p[3], target_delta, spots.get(sym), half_width,
+                                greeks_source, rate)
+                 for sym, p in prepared.items()}
+
+        records = {}
+        active = dict(scans)
+        while active:
+            streamer.set_groups({leases[sym]: scan.subscription() for sym, scan in active.items()})
+            opt_syms = [s for scan in active.values() for s in scan.option_symbols()]
+
+            until = None
+            checks = {sym: scan.wait_until(bracket) for sym, scan in active.items()}
+            if all(checks.values()):
+                done = set()
+
+                def until(tracker):
+                    for sym, check in checks.items():
+                        if sym not in done and check(tracker):
+                            done.add(sym)
+                    return len(done) == len(checks)
+
+            records.update(streamer.snapshot(opt_syms, timeout_sec=max(0.0, t_end - time.time()),
+                                             max_age=max_age, until=until))
+            for scan in active.values():
+                scan.finish(records)
+            if time.time() >= t_end:
+                break
+            # Next round only for windows that are covered but miss the target
+            active = {sym: scan for sym, scan in active.items()
+                      if not scan.bracketed(records) and scan.window.widen()}
+    finally:
+        for sym, lease in leases.items():
+            streamer.release(lease, scans[sym].keep() if sym in scans else None)
+
+    for sym, scan in scans.items():
+        try:
+            results[sym] = scan.select(records)
+        except Exception as e:
+            results[sym] = {"error": str(e)}
+
+    # Keep the caller's ordering
+    return {sym: results[sym] for sym in symbols}
+
+# ✅ Streaming variant: yields (symbol, result) as soon as each underlying is covered.
+# timeout_sec counts from the moment that underlying's chain lookup finished.
+def iter_delta_options_batch(symbols, token, target_delta=0.30, target_dte=21,
+                             max_age=None, timeout_sec=5.0, wait_mode=None, strike_window=None,
+                             greeks_source=None, rate=None):
+    streamer = get_streamer()
+    bracket = (wait_mode or WAIT_MODE) == "bracket"
+    half_width = STRIKE_WINDOW if strike_window is None else strike_window
+    leases = {sym: streamer.lease(sym) for sym in symbols}
+    streamer.set_groups({leases[sym]: [sym] for sym in symbols})
+    futures = {sym: BATCH_EXECUTOR.submit(_prepare_symbol, sym, token, target_dte) for sym in symbols}
+    pending = {}   # symbol -> [deadline, tracker, scan]
+    try:
+        yield from _iter_batch_loop(streamer, leases, futures, pending, bracket, half_width,
+                                    target_delta, max_age, timeout_sec, greeks_source, rate)
+    finally:
+        # Client went away mid-stream: stop tracking what we never emitted
+        for _, tracker, _ in pending.values():
+            streamer.untrack(tracker)
+        for sym, lease in leases.items():
+            streamer.release(lease, pending[sym][2].keep() if sym in pending else None)
+
+def _iter_batch_loop(streamer, leases, futures, pending, bracket, half_width, target_delta, max_age,
+                     timeout_sec, greeks_source, rate):
+    version = streamer.version
+    spot_deadline = time.time() + SPOT_WAIT_SEC
+    while futures or pending:
+        # Newly finished chain lookups: subscribe them (or report their error)
+        for sym in [s for s, f in futures.items() if f.done()]:
+            rec = streamer.book.get(sym)
+            spot = rec.spot if rec is not None else None
+            if spot is None and time.time() < spot_deadline and not futures[sym].exception():
+                # Give the underlying's price a moment so the window can be centred
+                continue
+            fut = futures.pop(sym)
+            try:
+                expiration, put_syms, call_syms, sym_to_strike = fut.result()
+            except requests.HTTPError as http_err:
+                streamer.release(leases.pop(sym))
+                yield sym, {"error": "HTTPError", "details": str(http_err)}
+                continue
+            except Exception as e:
+                streamer.release(leases.pop(sym))
+                yield sym, {"error": str(e)}
+                continue
+            scan = DeltaScan(sym, expiration, put_syms, call_syms, sym_to_strike,
+                             target_delta, spot, half_width, greeks_source, rate)
+            streamer.set_group(leases[sym], scan.subscription())
+            pending[sym] = [time.time() + timeout_sec, streamer.track(scan.option_symbols(), max_age), scan]
+
+        # Emit every underlying that is covered (fully, or bracketed) or out of time
+        now = time.time()
+        for sym in list(pending):
+            deadline, tracker, scan = pending[sym]
+            check = scan.wait_until(bracket)
+            if now < deadline:
+                if not tracker.complete and not (check and tracker.changed):
+                    continue
+                tracker.changed = False
+                if not tracker.complete and check(tracker) and scan.greeks_source == "local":
+                    # Window quotes are in; the local engine decides whether to widen
+                    if not scan.bracketed(scan.finish(streamer.collect(scan.option_symbols(), max_age))) \
+                            and scan.window.widen():
+                        streamer.untrack(tracker)
+                        streamer.set_group(leases[sym], scan.subscription())
+                        pending[sym][1] = streamer.track(scan.option_symbols(), max_age)
+                        continue
+                elif not scan.bracketed(tracker):
+                    if tracker.complete and scan.window.widen():
+                        # Window fully known but target outside it: widen and keep waiting
+                        streamer.untrack(tracker)
+                        streamer.set_group(leases[sym], scan.subscription())
+                        pending[sym][1] = streamer.track(scan.option_symbols(), max_age)
+                        continue
+                    if not tracker.complete:
+                        continue
+            del pending[sym]
+            streamer.untrack(tracker)
+            try:
+                records = scan.finish(streamer.collect(scan.option_symbols(), max_age))
+                result = scan.select(records)
+            except Exception as e:
+                result = {"error": str(e)}
+            streamer.release(leases.pop(sym), scan.keep())
+            yield sym, result
+
+        if futures or pending:
+            # Short wait so chain lookups finishing in the pool are picked up promptly too
+            version = streamer.wait_for_change(version, 0.05)
+
+# ---- Watchlist screener (/screen): rank batch selections, keep only the top K ----
+# Metrics for the chosen side's leg (per contract = 100 shares):
+#   annualized_return  bid / strike over the time to expiration (return on secured capital)
+#   premium_per_day    bid * 100 / days to expiration
+#   spread_pct         (ask - bid) / mid
+#   delta_distance     | |delta| - target |
+# True = higher ranks first
+SCREEN_METRICS = {
+    "annualized_return": True,
+    "premium_per_day": True,
+    "spread_pct": False,
+    "delta_distance": False,
+}
+SCREEN_MAX_K = int(os.getenv("TT_SCREEN_MAX_K", "100"))
+
+# One ranked row for a batch result, or None when the leg can't be priced
+def screen_candidate(symbol, result, side, target_delta):
+    leg = result.get(side)
+    if not leg or not leg.get("strike") or leg.get("bid") is None or leg.get("delta") is None:
+        return None
+    bid, ask, strike = float(leg["bid"]), leg.get("ask"), float(leg["strike"])
+    years = _years_to_expiration(result["expiration"])
+    mid = (bid + float(ask)) / 2 if ask is not None else None
+    return {
+        "symbol": symbol,
+        "expiration": result["expiration"],
+        "side": side,
+        "strike": strike,
+        "bid": bid,
+        "ask": ask,
+        "delta": leg["delta"],
+        "annualized_return": round(bid / strike / years, 6),
+        "premium_per_day": round(bid * 100 / (years * 365.0), 4),
+        "spread_pct": round((float(ask) - bid) / mid, 6) if mid else None,
+        "delta_distance": round(abs(abs(float(leg["delta"])) - target_delta), 6),
+    }
+
+# ✅ Bounded min-heap: keeps the k best rows seen so far, O(log k) per row
+class TopK:
+
+    def __init__(self, k, metric):
+        self.k = k
+        self.metric = metric
+        self.sign = 1 if SCREEN_METRICS[metric] else -1
+        self._heap = []      # (signed score, -arrival, row); the worst kept row is on top
+        self._seen = 0
+
+    def push(self, row):
+        score = row.get(self.metric)
+        if score is None:
+            return
+        self._seen += 1
+        entry = (self.sign * score, -self._seen, row)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif entry > self._heap[0]:
+            heapq.heapreplace(self._heap, entry)
+
+    def rows(self):
+        return [entry[2] for entry in sorted(self._heap, reverse=True)]
+
+# Request fields for /screen (both entry points); raises ValueError
+def screen_options(data):
+    symbols = data.get('symbols') or WATCHLIST
+    if not symbols or not isinstance(symbols, list):
+        raise ValueError("Missing symbols (and no TT_WATCHLIST)")
+    symbols = list(dict.fromkeys(str(s).upper() for s in symbols if s))
+    if len(symbols) > BATCH_MAX_SYMBOLS:
+        raise ValueError(f"Too many symbols (max {BATCH_MAX_SYMBOLS})")
+    sort = data.get('sort', "annualized_return")
+    if sort not in SCREEN_METRICS:
+        raise ValueError(f"sort must be one of {', '.join(SCREEN_METRICS)}")
+    side = data.get('side', "put")
+    if side not in ("put", "call"):
+        raise ValueError("side must be put or call")
+    k = number_field(data, 'k', int, 20)
+    if not 1 <= k <= SCREEN_MAX_K:
+        raise ValueError(f"k must be between 1 and {SCREEN_MAX_K}")
+    return symbols, sort, side, k
+
+# ✅ Screen symbols through the streaming batch pipeline; rows are ranked as they arrive
+def screen(symbols, token, sort="annualized_return", side="put", k=20, target_delta=0.30, **batch_options):
+    top = TopK(k, sort)
+    errors = {}
+    for sym, result in iter_delta_options_batch(symbols, token, target_delta=target_delta, **batch_options):
+        if "error" in result:
+            errors[sym] = result["error"]
+            continue
+        row = screen_candidate(sym, result, side, target_delta)
+        if row is not None:
+            top.push(row)
+    return {"sort": sort, "side": side, "k": k, "screened": len(symbols), "errors": errors,
+            "results": top.rows()}
+
+# ---- Snapshot history (see snapshots.py); off unless TT_SNAPSHOT_DIR is set ----
+SNAPSHOTS = SnapshotStore(SNAPSHOT_DIR) if SNAPSHOT_DIR else None
+
+def _epoch(value, default):
+    if value is None or value == "":
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    dt = parser.parse(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+# Query-string fields for /snapshots (both entry points) as SnapshotStore.query kwargs; raises ValueError.
+# start/end are epoch seconds or ISO times (UTC unless an offset is given); default is the last day.
+def snapshot_query_options(args):
+    symbol = (args.get('symbol') or "").upper()
+    if not symbol:
+        raise ValueError("Missing symbol")
+    end = _epoch(args.get('end'), time.time())
+    start = _epoch(args.get('start'), end - 86400.0)
+    if start >= end:
+        raise ValueError("start must be before end")
+    columns = [c for c in (args.get('columns') or "").split(",") if c] or None
+    unknown = [c for c in columns or () if c not in SNAPSHOT_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    side = args.get('side')
+    if side not in (None, "put", "call"):
+        raise ValueError("side must be put or call")
+    expiration = args.get('expiration')
+    strike_min, strike_max = args.get('strike_min'), args.get('strike_max')
+    limit = int(args.get('limit', SNAPSHOT_QUERY_MAX_ROWS))
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+    return {
+        "underlying": symbol, "start": start, "end": end, "columns": columns,
+        "expiration": int(expiration.replace("-", "")) if expiration else None,
+        "side": {"put": b"P", "call": b"C"}.get(side),
+        "strike_min": float(strike_min) if strike_min is not None else None,
+        "strike_max": float(strike_max) if strike_max is not None else None,
+        "limit": min(limit, SNAPSHOT_QUERY_MAX_ROWS),
+    }
+
+# Columnar JSON body: {"columns": {name: [values]}}, NaN as null
+def snapshot_response(options, columns, truncated):
+    out = {}
+    for name, values in columns.items():
+        if name == "expiration":
+            out[name] = [f"{v // 10000:04d}-{v // 100 % 100:02d}-{v % 100:02d}" for v in values.tolist()]
+        elif name == "side":
+            out[name] = ["put" if v == b"P" else "call" for v in values.tolist()]
+        elif name == "local":
+            out[name] = [bool(v) for v in values.tolist()]
+        else:
+            out[name] = [None if v != v else v for v in values.tolist()]
+    return {"symbol": options["underlying"], "start": options["start"], "end": options["end"],
+            "rows": len(out["ts"]), "truncated": truncated, "columns": out}
+
+# ---- Live fan-out (/stream): one DxLink subscription per topic, pushed to many clients ----
+# A topic is (underlying, target delta, target dte). Its strike window is subscribed once under
+# its own group, a publisher re-selects the put/call whenever the book changes one of the topic's
+# symbols (at most every TT_STREAM_MIN_INTERVAL_SEC; untouched topics are skipped) and offers
+# changed selections to every subscriber. Each subscriber holds only the latest selection per
+# topic, so a slow client skips intermediate updates (conflation) instead of queueing them; it
+# is sent at most once per its own interval.
+STREAM_MIN_INTERVAL_SEC = float(os.getenv("TT_STREAM_MIN_INTERVAL_SEC", "0.25"))
+STREAM_CLIENT_INTERVAL_SEC = float(os.getenv("TT_STREAM_CLIENT_INTERVAL_SEC", "1.0"))
+STREAM_RESCAN_SEC = float(os.getenv("TT_STREAM_RESCAN_SEC", "300"))   # re-pick expiration, re-centre window
+STREAM_RETRY_SEC = 5.0        # topics that failed to prepare (or had no spot) try again this often
+STREAM_KEEPALIVE_SEC = float(os.getenv("TT_STREAM_KEEPALIVE_SEC", "15"))
+STREAM_MAX_SYMBOLS = int(os.getenv("TT_STREAM_MAX_SYMBOLS", "50"))
+STREAM_UPDATES = REGISTRY.counter("tt_stream_updates_total",
+                                  "Selections offered to stream subscribers (conflated = replaced unsent)",
+                                  ("outcome",))
+
+class StreamTopic:
+
+    def __init__(self, symbol, target_delta, target_dte):
+        self.symbol = symbol
+        self.target_delta = target_delta
+        self.target_dte = target_dte
+        self.key = (symbol, target_delta, target_dte)
+        self.group = f"{symbol}|stream|{target_delta}|{target_dte}"
+        self.scan = None
+        self.prepared_at = 0.0
+        self.last = None         # last payload offered
+        self.dirty = True        # re-evaluate even if the book hasn't touched the group (new scan)
+        self.subscribers = set()
+
+    # Time to (re)prepare: periodically, and sooner while it has no usable scan
+    def due(self, now):
+        if self.scan is None or self.scan.spot is None:
+            return now - self.prepared_at >= STREAM_RETRY_SEC
+        return now - self.prepared_at >= STREAM_RESCAN_SEC
+
+    def error_payload(self, error):
+        return {"symbol": self.symbol, "target_delta": self.target_delta, "error": str(error)}
+
+    # Selected legs (strike, bid, ask, delta); None until the window has greeks
+    def evaluate(self, streamer):
+        scan = self.scan
+        if scan is None:
+            return None
+        payload = {"symbol": self.symbol, "target_delta": self.target_delta}
+        records = scan.finish(streamer.collect(scan.option_symbols()), record=False)
+        if not scan.bracketed(records) and scan.window.widen():
+            streamer.set_group(self.group, scan.subscription(), pinned=True)
+        payload["expiration"] = scan.expiration
+        for side, syms in (("put", scan.put_syms), ("call", scan.call_syms)):
+            best = None
+            for s in syms:
+                rec = records.get(s)
+                if rec is None or rec.delta is None:
+                    continue
+                dist = abs(abs(float(rec.delta)) - self.target_delta)
+                if best is None or dist < best[0]:
+                    best = (dist, s, rec)
+            if best is None:
+                payload[side] = None
+                continue
+            _, s, rec = best
+            payload[side] = {"strike": scan.sym_to_strike.get(s), "bid": rec.bid, "ask": rec.ask,
+                             "delta": rec.delta, "iv": rec.iv}
+        if payload["put"] is None and payload["call"] is None:
+            return None
+        if payload != self.last:
+            # Ticks that don't move the selection aren't worth a snapshot either
+            scan.record(records)
+        return payload
+
+# ✅ One client's view: the newest payload per topic, plus a wake-up
+class StreamSubscriber:
+
+    def __init__(self, interval_sec):
+        self.interval_sec = interval_sec
+        self.topics = []
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._pending = {}       # topic key -> payload not yet sent
+
+    def offer(self, key, payload):
+        with self._lock:
+            if key in self._pending:
+                STREAM_UPDATES.inc("conflated")
+            self._pending[key] = payload
+        STREAM_UPDATES.inc("offered")
+        self._wake()
+
+    def _wake(self):
+        self._ready.set()
+
+    def drain(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._ready.clear()
+        return list(pending.values())
+
+    def wait(self, timeout_sec):
+        self._ready.wait(timeout_sec)
+        return self.drain()
+
+# ✅ Topic registry + publisher thread over the shared streamer
+class StreamHub:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.topics = {}         # topic key -> StreamTopic
+        self._thread = None
+
+    def _new_subscriber(self, interval_sec):
+        return StreamSubscriber(interval_sec)
+
+    # `subscriber` overrides the per-client one (e.g. AlertSubscriber); returns (subscriber, new topics)
+    def subscribe(self, symbols, target_delta=0.30, target_dte=21, interval_sec=None, subscriber=None):
+        sub = subscriber or self._new_subscriber(max(STREAM_MIN_INTERVAL_SEC,
+                                                     interval_sec or STREAM_CLIENT_INTERVAL_SEC))
+        fresh = []
+        with self._lock:
+            for symbol in symbols:
+                key = (symbol, target_delta, target_dte)
+                topic = self.topics.get(key)
+                if topic is None:
+                    topic = self.topics[key] = StreamTopic(symbol, target_delta, target_dte)
+                    fresh.append(topic)
+                topic.subscribers.add(sub)
+                sub.topics.append(topic)
+        for topic in sub.topics:
+            if topic.last is not None:
+                sub.offer(topic.key, topic.last)
+        return sub, fresh
+
+    def unsubscribe(self, sub):
+        dropped = []
+        with self._lock:
+            for topic in sub.topics:
+                topic.subscribers.discard(sub)
+                if not topic.subscribers and self.topics.get(topic.key) is topic:
+                    del self.topics[topic.key]
+                    dropped.append(topic)
+        return dropped
+
+    def publish(self, topic, payload):
+        if payload is None or payload == topic.last:
+            return
+        topic.last = payload
+        with self._lock:
+            subscribers = list(topic.subscribers)
+        for sub in subscribers:
+            sub.offer(topic.key, payload)
+
+    # Re-evaluate only topics whose group had a book change (or that were just prepared)
+    def publish_all(self, streamer, topics):
+        touched = streamer.take_touched()
+        for topic in topics:
+            if not topic.dirty and topic.group not in touched:
+                continue
+            topic.dirty = False
+            try:
+                payload = topic.evaluate(streamer)
+            except Exception as e:
+                payload = topic.error_payload(e)
+            self.publish(topic, payload)
+
+    def stats(self):
+        with self._lock:
+            return {"topics": [{"symbol": t.symbol, "target_delta": t.target_delta, "target_dte": t.target_dte,
+                                "subscribers": len(t.subscribers),
+                                "expiration": t.scan.expiration if t.scan else None}
+                               for t in self.topics.values()]}
+
+# ✅ Thread-based hub for app:app (asgi.py runs the same hub on the event loop)
+class ThreadedStreamHub(StreamHub):
+
+    def subscribe(self, symbols, target_delta=0.30, target_dte=21, interval_sec=None, subscriber=None):
+        sub, fresh = super().subscribe(symbols, target_delta, target_dte, interval_sec, subscriber)
+        for topic in fresh:
+            self._prepare(topic)
+        self._start()
+        return sub
+
+    def unsubscribe(self, sub):
+        streamer = get_streamer()
+        for topic in super().unsubscribe(sub):
+            streamer.drop_group(topic.group)
+
+    def _start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="stream-hub", daemon=True)
+            self._thread.start()
+
+    def _prepare(self, topic):
+        try:
+            token = get_valid_access_token()
+            expiration = get_closest_expiration(topic.symbol, token, topic.target_dte)
+            put_syms, call_syms, sym_to_strike = get_streamer_symbols_for_expiration(topic.symbol, expiration,
+                                                                                      token)
+            streamer = get_streamer()
+            streamer.extend_groups({topic.group: [topic.symbol]}, pinned=True)
+            spot = streamer.wait_for_prices([topic.symbol], SPOT_WAIT_SEC).get(topic.symbol)
+            scan = DeltaScan(topic.symbol, expiration, put_syms, call_syms, sym_to_strike, topic.target_delta,
+                             spot, STRIKE_WINDOW)
+            streamer.set_group(topic.group, scan.subscription(), pinned=True)
+            topic.scan = scan
+            topic.dirty = True
+        except Exception as e:
+            self.publish(topic, topic.error_payload(e))
+        topic.prepared_at = time.time()
+
+    def _run(self):
+        streamer = get_streamer()
+        version = streamer.version
+        while True:
+            with self._lock:
+                topics = list(self.topics.values())
+            if not topics:
+                with self._lock:
+                    if not self.topics:
+                        self._thread = None
+                        return
+            t0 = time.time()
+            for topic in topics:
+                if topic.due(t0):
+                    self._prepare(topic)
+            self.publish_all(streamer, topics)
+            # Throttle, then sleep until the book changes
+            time.sleep(max(0.0, STREAM_MIN_INTERVAL_SEC - (time.time() - t0)))
+            version = streamer.wait_for_change(version, STREAM_KEEPALIVE_SEC)
+
+STREAM_HUB = ThreadedStreamHub()
+
+# ✅ SSE body for one client; subscribes on the first read, unsubscribes when the client goes away
+def _stream_updates(symbols, target_delta, target_dte, interval_sec):
+    sub = STREAM_HUB.subscribe(symbols, target_delta, target_dte, interval_sec)
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            sent_at = time.time()
+            updates = sub.wait(STREAM_KEEPALIVE_SEC)
+            if not updates:
+                yield ": keepalive\n\n"
+                continue
+            for payload in updates:
+                yield f"event: update\ndata: {json_dumps(payload)}\n\n"
+            # Whatever arrives meanwhile is conflated into the next send
+            time.sleep(max(0.0, sub.interval_sec - (time.time() - sent_at)))
+    finally:
+        STREAM_HUB.unsubscribe(sub)
+
+# ---- Alert rules on /stream selections (evaluated only when a selection changes) ----
+# A rule watches one side of a (symbol, target delta, target dte) topic, e.g. "put yield > 0.25":
+#   {"symbol": "SPY", "side": "put", "metric": "yield", "op": ">", "threshold": 0.25,
+#    "target_delta": 0.30, "target_dte": 21, "webhook": "https://...", "cooldown_sec": 900}
+# Rules ride on STREAM_HUB topics, so the work per book update is the rules of the topics it
+# touched. A rule fires when its condition becomes true, then stays quiet until it has been
+# false again and its cooldown has passed; the same contract (expiration + strike) is not
+# re-sent within the cooldown either. Webhooks are POSTed from a background thread with an
+# Idempotency-Key header. Rules live in this worker's memory.
+ALERT_WEBHOOK_URL = os.getenv("TT_ALERT_WEBHOOK_URL")
+ALERT_COOLDOWN_SEC = float(os.getenv("TT_ALERT_COOLDOWN_SEC", "900"))
+ALERT_WEBHOOK_RETRIES = int(os.getenv("TT_ALERT_WEBHOOK_RETRIES", "2"))
+ALERT_WEBHOOK_TIMEOUT_SEC = float(os.getenv("TT_ALERT_WEBHOOK_TIMEOUT_SEC", "5"))
+ALERT_QUEUE_MAX = int(os.getenv("TT_ALERT_QUEUE_MAX", "1000"))
+ALERT_EVENTS = REGISTRY.counter("tt_alerts_total", "Alert rule outcomes", ("outcome",))
+
+# Leg metric -> value; "yield" is bid / strike annualized over the time to expiration
+ALERT_METRICS = {
+    "yield": lambda leg, years: leg["bid"] / leg["strike"] / years if leg["bid"] and leg["strike"] else None,
+    "bid": lambda leg, years: leg["bid"],
+    "ask": lambda leg, years: leg["ask"],
+    "mid": lambda leg, years: (leg["bid"] + leg["ask"]) / 2 if leg["bid"] and leg["ask"] else None,
+    "delta": lambda leg, years: abs(leg["delta"]) if leg["delta"] is not None else None,
+    "iv": lambda leg, years: leg.get("iv"),
+}
+ALERT_OPS = {
+    ">": lambda v, t: v > t,
+    ">=": lambda v, t: v >= t,
+    "<": lambda v, t: v < t,
+    "<=": lambda v, t: v <= t,
+}
+
+class AlertRule:
+
+    def __init__(self, rule_id, spec):
+        self.id = rule_id
+        self.symbol = str(spec.get("symbol") or "").upper()
+        self.side = spec.get("side", "put")
+        self.metric = spec.get("metric", "yield")
+        self.op = spec.get("op", ">")
+        self.threshold = float(spec["threshold"]) if spec.get("threshold") is not None else None
+        self.target_delta = float(spec.get("target_delta", 0.30))
+        self.target_dte = int(spec.get("target_dte", 21))
+        self.webhook = spec.get("webhook") or ALERT_WEBHOOK_URL
+        self.cooldown_sec = float(spec.get("cooldown_sec", ALERT_COOLDOWN_SEC))
+        self.name = spec.get("name")
+        if not self.symbol:
+            raise ValueError("Missing symbol")
+        if self.side not in ("put", "call"):
+            raise ValueError("side must be put or call")
+        if self.metric not in ALERT_METRICS:
+            raise ValueError(f"metric must be one of {', '.join(ALERT_METRICS)}")
+        if self.op not in ALERT_OPS:
+            raise ValueError(f"op must be one of {', '.join(ALERT_OPS)}")
+        if self.threshold is None:
+            raise ValueError("Missing threshold")
+        if not self.webhook:
+            raise ValueError("Missing webhook (and no TT_ALERT_WEBHOOK_URL)")
+        self.topic_key = (self.symbol, self.target_delta, self.target_dte)
+        self.active = False       # condition held on the last evaluation
+        self.fired_at = None      # time.time() of the last delivery queued
+        self.last_value = None
+        self.sent = {}            # dedup key -> time.time() it was sent
+
+    # Webhook body if this update should fire, else None
+    def evaluate(self, payload, now):
+        leg = payload.get(self.side)
+        if not leg or not payload.get("expiration"):
+            return None
+        value = ALERT_METRICS[self.metric](leg, _years_to_expiration(payload["expiration"]))
+        self.last_value = value
+        holds = value is not None and ALERT_OPS[self.op](value, self.threshold)
+        was_active, self.active = self.active, holds
+        if not holds or was_active:
+            return None
+        if self.fired_at is not None and now - self.fired_at < self.cooldown_sec:
+            ALERT_EVENTS.inc("cooldown")
+            return None
+        dedup_key = f"{self.id}:{payload['expiration']}:{leg['strike']}"
+        if now - self.sent.get(dedup_key, 0.0) < self.cooldown_sec:
+            ALERT_EVENTS.inc("duplicate")
+            return None
+        self.fired_at = self.sent[dedup_key] = now
+        return {"rule": self.as_dict(), "symbol": self.symbol, "side": self.side, "metric": self.metric,
+                "value": value, "threshold": self.threshold, "expiration": payload["expiration"],
+                "leg": leg, "dedup_key": dedup_key, "fired_at": datetime.now().isoformat()}
+
+    def as_dict(self):
+        return {"id": self.id, "name": self.name, "symbol": self.symbol, "side": self.side,
+                "metric": self.metric, "op": self.op, "threshold": self.threshold,
+                "target_delta": self.target_delta, "target_dte": self.target_dte,
+                "cooldown_sec": self.cooldown_sec, "webhook": self.webhook}
+
+    def status(self):
+        return {**self.as_dict(), "active": self.active, "last_value": self.last_value, "fired_at": self.fired_at}
+
+# ✅ Receives a topic's selections from the hub instead of a client connection
+class AlertSubscriber(StreamSubscriber):
+
+    def __init__(self, engine):
+        super().__init__(0.0)
+        self.engine = engine
+
+    def offer(self, key, payload):
+        self.engine.on_update(key, payload)
+
+# ✅ Rule registry, per-topic index and webhook delivery
+class AlertEngine:
+
+    def __init__(self, hub):
+        self.hub = hub
+        self._lock = threading.Lock()
+        self.rules = {}           # id -> AlertRule
+        self._by_topic = {}       # topic key -> {id: AlertRule}
+        self._subscribers = {}    # topic key -> AlertSubscriber registered with the hub
+        self._next_id = 1
+        self._queue = queue.Queue(maxsize=ALERT_QUEUE_MAX)
+        self._thread = None
+        self._http = requests.Session()
+        self.delivered = 0
+        self.failed = 0
+        self.last_error = None
+
+    # Returns (rule, AlertSubscriber to register with the hub or None if its topic is watched)
+    def _add(self, spec):
+        with self._lock:
+            rule = AlertRule(str(self._next_id), spec)
+            self._next_id += 1
+            self.rules[rule.id] = rule
+            self._by_topic.setdefault(rule.topic_key, {})[rule.id] = rule
+            if rule.topic_key in self._subscribers:
+                return rule, None
+            sub = self._subscribers[rule.topic_key] = AlertSubscriber(self)
+            return rule, sub
+
+    # Returns the AlertSubscriber to unregister if the topic has no rules left
+    def _remove(self, rule_id):
+        with self._lock:
+            rule = self.rules.pop(rule_id, None)
+            if rule is None:
+                raise KeyError(rule_id)
+            topic_rules = self._by_topic.get(rule.topic_key, {})
+            topic_rules.pop(rule_id, None)
+            if topic_rules:
+                return None
+            self._by_topic.pop(rule.topic_key, None)
+            return self._subscribers.pop(rule.topic_key, None)
+
+    def add(self, spec):
+        rule, sub = self._add(spec)
+        if sub is not None:
+            self.hub.subscribe([rule.symbol], rule.target_delta, rule.target_dte, subscriber=sub)
+        return rule
+
+    def remove(self, rule_id):
+        sub = self._remove(rule_id)
+        if sub is not None:
+            self.hub.unsubscribe(sub)
+
+    def on_update(self, key, payload):
+        with self._lock:
+            rules = list(self._by_topic.get(key, {}).values())
+        if "error" in payload:
+            return
+        now = time.time()
+        for rule in rules:
+            body = rule.evaluate(payload, now)
+            if body is None:
+                continue
+            try:
+                self._queue.put_nowait((rule.webhook, body))
+                ALERT_EVENTS.inc("fired")
+            except queue.Full:
+                ALERT_EVENTS.inc("dropped")
+        self._start()
+
+    def _start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._deliver_loop, name="alert-webhooks", daemon=True)
+            self._thread.start()
+
+    def _deliver_loop(self):
+        while True:
+            url, body = self._queue.get()
+            self._deliver(url, body)
+
+    def _deliver(self, url, body):
+        data = json_dumps(body)
+        headers = {"Content-Type": "application/json", "Idempotency-Key": body["dedup_key"]}
+        for attempt in range(ALERT_WEBHOOK_RETRIES + 1):
+            try:
+                r = self._http.post(url, data=data, headers=headers, timeout=ALERT_WEBHOOK_TIMEOUT_SEC)
+            except requests.RequestException as e:
+                self.last_error = str(e)
+                delay = retry_delay(attempt)
+            else:
+                if r.status_code < 400:
+                    self.delivered += 1
+                    ALERT_EVENTS.inc("delivered")
+                    return
+                self.last_error = f"HTTP {r.status_code} from {url}"
+                if not is_upstream_failure(r.status_code):
+                    break
+                delay = retry_delay(attempt, r.headers)
+            if attempt < ALERT_WEBHOOK_RETRIES:
+                time.sleep(min(delay, ALERT_WEBHOOK_TIMEOUT_SEC))
+        self.failed += 1
+        ALERT_EVENTS.inc("failed")
+
+    def status(self):
+        with self._lock:
+            rules = [r.status() for r in self.rules.values()]
+        return {"rules": rules, "topics": len(self._by_topic), "queued": self._queue.qsize(),
+                "delivered": self.delivered, "failed": self.failed, "last_error": self.last_error}
+
+ALERTS = AlertEngine(STREAM_HUB)
+
+# ---- Request coalescing + short result cache for /fetch, /query and /fetch/batch ----
+# Identical concurrent requests share one computation; its result is then served for a
+# short window (per endpoint, 0 = coalesce only), never longer than the request's max_staleness
+RESULT_CACHE_SEC = {
+    "fetch": float(os.getenv("TT_RESULT_CACHE_FETCH_SEC", "1.0")),
+    "query": float(os.getenv("TT_RESULT_CACHE_QUERY_SEC", "1.0")),
+    "batch": float(os.getenv("TT_RESULT_CACHE_BATCH_SEC", "0")),
+}
+RESULT_CACHE_MAX = int(os.getenv("TT_RESULT_CACHE_MAX", "1024"))
+# Stale-while-revalidate for /fetch: "error" serves the last good result (flagged with its age)
+# when a fresh run fails or a circuit is open; "always" serves it straight away and refreshes
+# in the background; "off" never serves stale. Per request: {"stale": "off" | "error" | "always"}
+SWR_MODES = ("off", "error", "always")
+SWR_MODE = os.getenv("TT_SWR_MODE", "error")
+SWR_MAX_AGE_SEC = float(os.getenv("TT_SWR_MAX_AGE_SEC", "300"))
+REVALIDATE_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv("TT_REVALIDATE_WORKERS", "2")),
+                                         thread_name_prefix="revalidate")
+RESULT_CACHE_EVENTS = REGISTRY.counter("tt_result_cache_total",
+                                       "Endpoint results by how they were produced", ("endpoint", "outcome"))
+
+class _Flight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+# ✅ Single-flight + TTL cache keyed by (endpoint, normalized request parameters).
+# Outcome is "hit" (cached), "coalesced" (waited on another caller's run) or "miss" (ran it).
+# Callers get the shared result object and must copy before changing it.
+class ResultCache:
+
+    def __init__(self, ttls, max_entries):
+        self.ttls = ttls
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # key -> (expires_at, result)
+        self._inflight = {}             # key -> _Flight
+        self._last_good = OrderedDict() # key -> (time.monotonic() it was computed, result)
+        self._lock = threading.Lock()
+
+    def lookup(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._entries[key]
+                return None
+            return entry[1]
+
+    def store(self, key, result, max_age=None):
+        now = time.monotonic()
+        ttl = self.ttls.get(key[0], 0.0)
+        if max_age is not None:
+            ttl = min(ttl, max_age)
+        with self._lock:
+            self._last_good[key] = (now, result)
+            self._last_good.move_to_end(key)
+            while len(self._last_good) > self.max_entries:
+                self._last_good.popitem(last=False)
+            if ttl <= 0:
+                return
+            self._entries[key] = (now + ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # (result, age in seconds) of the latest successful run, if not older than max_age
+    def last_good(self, key, max_age):
+        with self._lock:
+            entry = self._last_good.get(key)
+        if entry is None:
+            return None
+        age = time.monotonic() - entry[0]
+        return (entry[1], age) if age <= max_age else None
+
+    # Background run(); skipped when one for the key is already in flight
+    def revalidate(self, key, compute, max_age=None):
+        with self._lock:
+            if key in self._inflight:
+                return
+        REVALIDATE_EXECUTOR.submit(self._revalidate, key, compute, max_age)
+
+    def _revalidate(self, key, compute, max_age):
+        try:
+            self.run(key, compute, max_age)
+        except Exception:
+            # The next request tries again (or gets the stale result)
+            pass
+
+    def run(self, key, compute, max_age=None):
+        endpoint = key[0]
+        result = self.lookup(key)
+        if result is not None:
+            RESULT_CACHE_EVENTS.inc(endpoint, "hit")
+            return result, "hit"
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+        if not leader:
+            flight.done.wait()
+            RESULT_CACHE_EVENTS.inc(endpoint, "coalesced")
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, "coalesced"
+        try:
+            result = compute()
+            self.store(key, result, max_age)
+            flight.result = result
+            RESULT_CACHE_EVENTS.inc(endpoint, "miss")
+            return result, "miss"
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._last_good.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "last_good": len(self._last_good),
+                    "inflight": len(self._inflight), "ttl_sec": dict(self.ttls)}
+
+RESULT_CACHE = ResultCache(RESULT_CACHE_SEC, RESULT_CACHE_MAX)
+
+def stale_result(result, age, reason):
+    result = dict(result)
+    result["stale"] = {"age_sec": round(age, 3), "reason": reason}
+    return result
+
+# ✅ RESULT_CACHE.run with the stale-while-revalidate policy; outcome "stale" when it applied
+def run_with_stale(key, compute, max_age=None, mode=None):
+    mode = mode or SWR_MODE
+    stale = RESULT_CACHE.last_good(key, SWR_MAX_AGE_SEC) if mode != "off" else None
+    if stale is not None and mode == "always" and RESULT_CACHE.lookup(key) is None:
+        RESULT_CACHE.revalidate(key, compute, max_age)
+        RESULT_CACHE_EVENTS.inc(key[0], "stale")
+        return stale_result(*stale, "revalidating"), "stale"
+    try:
+        return RESULT_CACHE.run(key, compute, max_age)
+    except Exception as e:
+        if stale is None:
+            raise
+        RESULT_CACHE_EVENTS.inc(key[0], "stale")
+        return stale_result(*stale, str(e)), "stale"
+
+# ---- Watchlist pre-warming (chains, expirations and DxLink windows kept hot in memory) ----
+# TT_WATCHLIST="SPY,QQQ,IWM": every TT_PREWARM_INTERVAL_SEC during market hours (plus
+# TT_PREWARM_LEAD_MIN before the open) each symbol runs the /fetch pipeline with the default
+# target, so its chain, parsed expiration and strike window are live when a request arrives.
+# Chains are re-downloaded every TT_PREWARM_CHAIN_REFRESH_SEC. Outside market hours the
+# watchlist's subscriptions are dropped and the scheduler idles. Exchange holidays are not known.
+WATCHLIST = [s.strip().upper() for s in os.getenv("TT_WATCHLIST", "").split(",") if s.strip()]
+PREWARM_INTERVAL_SEC = float(os.getenv("TT_PREWARM_INTERVAL_SEC", "30"))
+PREWARM_CHAIN_REFRESH_SEC = float(os.getenv("TT_PREWARM_CHAIN_REFRESH_SEC", "3600"))
+PREWARM_TARGET_DTE = int(os.getenv("TT_PREWARM_TARGET_DTE", "21"))
+PREWARM_TARGET_DELTA = float(os.getenv("TT_PREWARM_TARGET_DELTA", "0.30"))
+PREWARM_LEAD_MIN = float(os.getenv("TT_PREWARM_LEAD_MIN", "15"))
+MARKET_HOURS = os.getenv("TT_MARKET_HOURS", "09:30-16:00")
+
+# "09:30-16:00" -> (570, 960), minutes after midnight
+def _parse_hours(spec):
+    bounds = []
+    for hhmm in spec.split("-"):
+        hours, minutes = hhmm.strip().split(":")
+        bounds.append(int(hours) * 60 + int(minutes))
+    return bounds[0], bounds[1]
+
+MARKET_OPEN_MIN, MARKET_CLOSE_MIN = _parse_hours(MARKET_HOURS)
+
+# ✅ Weekday session in MARKET_TZ, opened `lead_min` early
+def market_hours_active(now=None, lead_min=0.0):
+    now = (now or datetime.now(MARKET_TZ)).astimezone(MARKET_TZ)
+    if now.weekday() >= 5:
+        return False
+    minute = now.hour * 60 + now.minute + now.second / 60.0
+    return MARKET_OPEN_MIN - lead_min <= minute < MARKET_CLOSE_MIN
+
+# ✅ Background thread that keeps the watchlist warm; one per worker, started on first request
+class Prewarmer:
+
+    def __init__(self, symbols, interval_sec, chain_refresh_sec, target_dte, target_delta):
+        self.symbols = list(symbols)
+        self.interval_sec = interval_sec
+        self.chain_refresh_sec = chain_refresh_sec
+        self.target_dte = target_dte
+        self.target_delta = target_delta
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.active = False
+        self.cycles = 0
+        self.last_cycle_sec = None
+        self.state = {s: {"expiration": None, "warmed_at": None, "chain_at": None, "error": None}
+                      for s in self.symbols}
+
+    def ensure_started(self):
+        # Threads don't survive fork: a worker forked from a started parent starts its own
+        if not self.symbols or (self._pid == os.getpid() and self._thread and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="prewarm", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            if market_hours_active(lead_min=PREWARM_LEAD_MIN):
+                self.active = True
+                t0 = time.perf_counter()
+                with timed("prewarm_cycle"):
+                    for symbol in self.symbols:
+                        if self._stop.is_set():
+                            break
+                        self._warm(symbol)
+                self.cycles += 1
+                self.last_cycle_sec = round(time.perf_counter() - t0, 3)
+            elif self.active:
+                self.active = False
+                self.idle()
+            self._stop.wait(self.interval_sec)
+
+    def _warm(self, symbol):
+        entry = self.state[symbol]
+        now = time.time()
+        refresh_chain = entry["chain_at"] is None or now - entry["chain_at"] >= self.chain_refresh_sec
+        try:
+            entry["expiration"] = self.warm_symbol(symbol, refresh_chain)
+            entry["warmed_at"] = time.time()
+            if refresh_chain:
+                entry["chain_at"] = now
+            entry["error"] = None
+        except Exception as e:
+            entry["error"] = str(e)
+
+    # Chain (re)fetch, expiration pick and a full scan, so the strike window stays subscribed
+    def warm_symbol(self, symbol, refresh_chain):
+        token = get_valid_access_token()
+        if refresh_chain:
+            fetch_nested_chain(symbol, token, refresh=True, context="prewarm_chain_failed")
+        expiration = get_closest_expiration(symbol, token, self.target_dte)
+        find_30_delta_options(symbol, expiration, token, target_delta=self.target_delta)
+        return expiration
+
+    # Market closed: unsubscribe the warm groups of the expirations it scanned (scans still
+    # in flight hold their own leases and keep streaming)
+    def idle(self):
+        streamer = get_streamer()
+        for key in self.warm_keys():
+            streamer.drop_group(key)
+
+    def warm_keys(self):
+        return [f"{symbol}|{entry['expiration']}" for symbol, entry in self.state.items() if entry["expiration"]]
+
+    def status(self):
+        return {
+            "symbols": self.symbols,
+            "running": bool(self._thread and self._thread.is_alive()),
+            "market_hours": self.active,
+            "interval_sec": self.interval_sec,
+            "cycles": self.cycles,
+            "last_cycle_sec": self.last_cycle_sec,
+            "state": self.state,
+        }
+
+PREWARMER = Prewarmer(WATCHLIST, PREWARM_INTERVAL_SEC, PREWARM_CHAIN_REFRESH_SEC,
+                      PREWARM_TARGET_DTE, PREWARM_TARGET_DELTA)
+
+@app.before_request
+def _start_prewarm():
+    PREWARMER.ensure_started()
+
 @app.route('/')
 def home():
     return '✅ Tastytrade Webhook is Running!'
 
+# Prometheus scrape endpoint (this worker's counters and stage histograms)
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
 # 🔎 Debug: token validity
 @app.route('/debug/token-status', methods=['GET'])
 def token_status():
@@ -396,7 +2928,8 @@ def token_status():
             "ok": probe.status_code == 200,
             "status_code": probe.status_code,
             "url": f"{BASE_URL}/customers/me/accounts",
-            "body": probe.text[:500]
+            "body": probe.text[:500],
+            "token": TOKEN_MANAGER.status()
         }), 200
     except requests.HTTPError as e:
         return jsonify({"ok": False, "where": "token_status_http_error", "details": str(e)}), 500
@@ -409,20 +2942,15 @@ def nested_raw():
     try:
         symbol = request.args.get('symbol', 'AMAT')
         token = get_valid_access_token()
-        exp = get_closest_expiration(symbol, token)
-
-        url = f"{BASE_URL}/option-chains/{symbol}/nested"
-        headers = {'Authorization': f'Bearer {token}'}
-        params = {'expiration-date': exp}
-        r = SESSION.get(url, headers=headers, params=params)
-        _raise_for_status_with_context(r, "nested_chain_fetch_failed")
+        exp = get_closest_expiration(symbol, token, int(request.args.get('target_dte', 21)))
+        data = fetch_nested_chain(symbol, token, exp)
 
         return jsonify({
             "symbol": symbol,
             "expiration": exp,
-            "status_code": r.status_code,
-            "url": r.url,
-            "body_head": r.text[:2000]
+            "url": f"{BASE_URL}/option-chains/{symbol}/nested?{urlencode({'expiration-date': exp})}",
+            "body_head": json_dumps({"data": data})[:2000],
+            "cache": CHAIN_CACHE.stats()
         }), 200
     except requests.HTTPError as e:
         return jsonify({"error": "HTTPError", "details": str(e)}), 500
@@ -435,15 +2963,9 @@ def nested_sample():
     try:
         symbol = request.args.get('symbol', 'AMAT')
         token = get_valid_access_token()
-        expiration = get_closest_expiration(symbol, token)
-
-        url = f"{BASE_URL}/option-chains/{symbol}/nested"
-        headers = {'Authorization': f'Bearer {token}'}
-        params = {'expiration-date': expiration}
-        r = SESSION.get(url, headers=headers, params=params)
-        _raise_for_status_with_context(r, "nested_chain_fetch_failed")
+        expiration = get_closest_expiration(symbol, token, int(request.args.get('target_dte', 21)))
 
-        data = r.json().get('data', {})
+        data = fetch_nested_chain(symbol, token, expiration)
         items = data.get('items', [])
 
         total_options = 0
@@ -470,6 +2992,56 @@ def nested_sample():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# 🔎 Debug: chain cache counters
+@app.route('/debug/chain-cache', methods=['GET'])
+def chain_cache_status():
+    if request.args.get('clear'):
+        CHAIN_CACHE.invalidate(request.args.get('symbol'))
+    return jsonify(CHAIN_CACHE.stats()), 200
+
+# 🔎 Debug: coalescing / result cache state
+@app.route('/debug/result-cache', methods=['GET'])
+def result_cache_status():
+    if request.args.get('clear'):
+        RESULT_CACHE.clear()
+    return jsonify(RESULT_CACHE.stats()), 200
+
+# 🔎 Debug: circuit breaker per upstream dependency
+@app.route('/debug/breakers', methods=['GET'])
+def breakers_status():
+    return jsonify({name: b.status() for name, b in BREAKERS.items()}), 200
+
+# 🔎 Debug: /stream topics and subscriber counts
+@app.route('/debug/stream', methods=['GET'])
+def stream_status():
+    return jsonify(STREAM_HUB.stats()), 200
+
+# ✅ Alert rules: POST a rule, GET rules with their state, DELETE /alerts/<id>
+@app.route('/alerts', methods=['GET', 'POST'])
+def alerts():
+    if request.method == 'GET':
+        return jsonify(ALERTS.status()), 200
+    try:
+        rule = ALERTS.add(request.get_json() or {})
+        return jsonify(rule.status()), 201
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/alerts/<rule_id>', methods=['DELETE'])
+def delete_alert(rule_id):
+    try:
+        ALERTS.remove(rule_id)
+    except KeyError:
+        return jsonify({"error": f"No alert rule {rule_id}"}), 404
+    return jsonify({"deleted": rule_id}), 200
+
+# 🔎 Debug: watchlist pre-warming state
+@app.route('/debug/prewarm', methods=['GET'])
+def prewarm_status():
+    return jsonify(PREWARMER.status()), 200
+
 @app.route('/fetch', methods=['POST'])
 def fetch_data():
     try:
@@ -478,11 +3050,205 @@ def fetch_data():
         if not symbol:
             return jsonify({"error": "Missing symbol"}), 400
 
+        try:
+            options = scan_options(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        target_dte = options.pop("target_dte")
+        stale_mode = data.get('stale')
+        if stale_mode is not None and stale_mode not in SWR_MODES:
+            return jsonify({"error": f"stale must be one of {', '.join(SWR_MODES)}"}), 400
+
+        timings = Timings()
+
+        def compute():
+            with timings.stage("token"):
+                token = get_valid_access_token()
+            with timings.stage("expiration"):
+                expiration = get_closest_expiration(symbol, token, target_dte)
+            return find_30_delta_options(symbol, expiration, token, timings=timings, **options)
+
+        key = ("fetch", symbol.upper(), target_dte, *options.values())
+        result, outcome = run_with_stale(key, compute, options["max_age"], stale_mode)
+        result = dict(result)
+        if data.get('timings'):
+            # Stage timings only exist when this request ran the scan itself
+            result["cache"] = outcome
+            if timings.stages:
+                result["timings"] = timings.as_ms()
+        return jsonify(result), 200, {"X-Result-Cache": outcome}
+    except CircuitOpenError as e:
+        return jsonify({"error": "CircuitOpen", "details": str(e)}), 503
+    except requests.HTTPError as http_err:
+        return jsonify({"error": "HTTPError", "details": str(http_err)}), 500
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/query', methods=['POST'])
+def query():
+    try:
+        data = request.get_json() or {}
+        symbol = data.get('symbol')
+        if not symbol:
+            return jsonify({"error": "Missing symbol"}), 400
+
+        try:
+            deltas = data.get('deltas', [0.30])
+            deltas = [parse_number("deltas", d) for d in (deltas if isinstance(deltas, list) else [deltas])]
+            dte_range = data.get('dte_range')
+            dtes = data.get('dte', [] if dte_range else [21])
+            dtes = [parse_number("dte", d, int) for d in (dtes if isinstance(dtes, list) else [dtes])]
+            if dte_range is not None:
+                if not isinstance(dte_range, list) or len(dte_range) != 2:
+                    raise ValueError("dte_range must be [min, max]")
+                dte_range = tuple(parse_number("dte_range", d, int) for d in dte_range)
+            max_age = number_field(data, 'max_staleness')
+            strike_window = number_field(data, 'strike_window', int)
+            rate = number_field(data, 'rate')
+            timeout_sec = timeout_option(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        sides = data.get('sides', ["put", "call"])
+        sides = tuple(s for s in (sides if isinstance(sides, list) else [sides]) if s in ("put", "call"))
+        if not deltas or not sides or not (dtes or dte_range):
+            return jsonify({"error": "Need at least one delta, side and dte"}), 400
+
+        wait_mode = data.get('wait')
+        greeks_source = data.get('greeks')
+
+        def compute():
+            return query_options(symbol, get_valid_access_token(), deltas=deltas, sides=sides, dtes=dtes,
+                                 dte_range=dte_range, max_age=max_age, wait_mode=wait_mode,
+                                 strike_window=strike_window, timeout_sec=timeout_sec,
+                                 greeks_source=greeks_source, rate=rate)
+
+        key = ("query", symbol.upper(), tuple(sorted(set(deltas))), tuple(sorted(set(sides))),
+               tuple(sorted(set(dtes))), dte_range, max_age, wait_mode, strike_window, timeout_sec,
+               greeks_source, rate)
+        result, outcome = RESULT_CACHE.run(key, compute, max_age)
+        return jsonify(result), 200, {"X-Result-Cache": outcome}
+    except CircuitOpenError as e:
+        return jsonify({"error": "CircuitOpen", "details": str(e)}), 503
+    except requests.HTTPError as http_err:
+        return jsonify({"error": "HTTPError", "details": str(http_err)}), 500
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# ✅ Serialize streamed batch results as NDJSON lines or SSE events
+def _stream_results(results, fmt):
+    for sym, result in results:
+        line = json_dumps({"symbol": sym, **result})
+        if fmt == "sse":
+            yield f"event: result\ndata: {line}\n\n"
+        else:
+            yield line + "\n"
+    if fmt == "sse":
+        yield "event: done\ndata: {}\n\n"
+
+@app.route('/fetch/batch', methods=['POST'])
+def fetch_batch():
+    try:
+        data = request.get_json() or {}
+        symbols = data.get('symbols')
+        if not symbols or not isinstance(symbols, list):
+            return jsonify({"error": "Missing symbols"}), 400
+        # De-duplicate while keeping order
+        symbols = list(dict.fromkeys(str(s).upper() for s in symbols if s))
+        if len(symbols) > BATCH_MAX_SYMBOLS:
+            return jsonify({"error": f"Too many symbols (max {BATCH_MAX_SYMBOLS})"}), 400
+        try:
+            options = scan_options(data)
+            timeout_sec = timeout_option(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
         token = get_valid_access_token()
-        expiration = get_closest_expiration(symbol, token)
-        result = find_30_delta_options(symbol, expiration, token)
+
+        stream = request.args.get('stream') or data.get('stream')
+        if stream in ("ndjson", "sse"):
+            results = iter_delta_options_batch(symbols, token, timeout_sec=timeout_sec, **options)
+            return Response(_stream_results(results, stream),
+                            mimetype="text/event-stream" if stream == "sse" else "application/x-ndjson",
+                            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+        def compute():
+            return find_delta_options_batch(symbols, token, timeout_sec=timeout_sec, **options)
+
+        key = ("batch", tuple(sorted(symbols)), timeout_sec, *options.values())
+        results, outcome = RESULT_CACHE.run(key, compute, options["max_age"])
+        return jsonify({"results": results}), 200, {"X-Result-Cache": outcome}
+    except CircuitOpenError as e:
+        return jsonify({"error": "CircuitOpen", "details": str(e)}), 503
+    except requests.HTTPError as http_err:
+        return jsonify({"error": "HTTPError", "details": str(http_err)}), 500
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# ✅ Rank a watchlist: {"symbols": [...] (default TT_WATCHLIST), "k": 20, "sort": "annualized_return",
+# "side": "put", plus the /fetch/batch fields}
+@app.route('/screen', methods=['POST'])
+def screen_route():
+    try:
+        data = request.get_json() or {}
+        try:
+            symbols, sort, side, k = screen_options(data)
+            options = scan_options(data)
+            timeout_sec = timeout_option(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        token = get_valid_access_token()
+        result = screen(symbols, token, sort=sort, side=side, k=k, timeout_sec=timeout_sec, **options)
         return jsonify(result), 200
+    except CircuitOpenError as e:
+        return jsonify({"error": "CircuitOpen", "details": str(e)}), 503
     except requests.HTTPError as http_err:
         return jsonify({"error": "HTTPError", "details": str(http_err)}), 500
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+# ✅ Stored snapshot rows for one underlying:
+# GET /snapshots?symbol=SPY&start=...&end=...&expiration=2026-11-20&side=put&strike_min=&strike_max=
+#                &columns=bid,ask,delta&limit=
+@app.route('/snapshots', methods=['GET'])
+def snapshots_route():
+    if SNAPSHOTS is None:
+        return jsonify({"error": "Snapshot store disabled (set TT_SNAPSHOT_DIR)"}), 404
+    try:
+        options = snapshot_query_options(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    columns, truncated = SNAPSHOTS.query(**options)
+    return jsonify(snapshot_response(options, columns, truncated)), 200
+
+@app.route('/debug/snapshots', methods=['GET'])
+def snapshots_status():
+    if SNAPSHOTS is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **SNAPSHOTS.status()}), 200
+
+# ✅ Server-sent events: GET /stream?symbols=SPY,QQQ[&target_delta=0.30&target_dte=21&interval=1]
+# pushes {"symbol", "expiration", "put": {strike, bid, ask, delta}, "call": {...}} as selections change.
+# Each connected client holds a request thread for as long as it stays connected (as do streamed
+# /fetch/batch responses): serve app:app with threaded workers (Procfile: -k gthread --threads N,
+# overridable through GUNICORN_CMD_ARGS), whose heartbeat doesn't depend on requests finishing.
+# A sync worker would be taken over by one client and killed at --timeout. asgi:app serves the
+# same endpoint on the event loop.
+@app.route('/stream', methods=['GET'])
+def stream():
+    try:
+        symbols = list(dict.fromkeys(s.strip().upper() for s in request.args.get('symbols', '').split(',')
+                                     if s.strip()))
+        if not symbols:
+            return jsonify({"error": "Missing symbols"}), 400
+        if len(symbols) > STREAM_MAX_SYMBOLS:
+            return jsonify({"error": f"Too many symbols (max {STREAM_MAX_SYMBOLS})"}), 400
+        target_delta = float(request.args.get('target_delta', 0.30))
+        target_dte = int(request.args.get('target_dte', 21))
+        interval = request.args.get('interval')
+        interval = float(interval) if interval is not None else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return Response(_stream_updates(symbols, target_delta, target_dte, interval),
+                    mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -0,0 +1,820 @@
+# ASGI variant of the service: `uvicorn asgi:app` (or gunicorn -k uvicorn.workers.UvicornWorker asgi:app).
+# Same contract as app:app for /fetch, /fetch/batch (including ?stream=ndjson|sse), /screen,
+# /snapshots, /stream, /alerts and the metrics/debug counters, but REST calls go through a
+# pooled httpx.AsyncClient and the DxLink feed is read by an asyncio task, so an in-flight
+# /fetch is a suspended coroutine instead of a blocked worker. Everything that doesn't
+# do I/O (chain parsing, the market book, coverage tracking, strike windows, local
+# greeks, selection) is shared with app.py.
+# Not served here (ASGI_UNSUPPORTED answers 404 naming app:app): /query, the OAuth
+# /authorize flow and the token/nested-chain debug probes.
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+import requests
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocketDisconnect
+from websockets.asyncio.client import connect as ws_connect
+
+from app import (
+    BASE_URL, BATCH_MAX_SYMBOLS, CHAIN_CACHE, DX_DATA_FORMAT, DX_KEEPALIVE_SEC, DX_RECONNECT_MAX_SEC,
+    MAX_STALENESS_SEC, PREWARM_CHAIN_REFRESH_SEC, PREWARM_INTERVAL_SEC, PREWARM_TARGET_DELTA,
+    PREWARM_TARGET_DTE, RESULT_CACHE, RESULT_CACHE_EVENTS, SHARED_QUOTES, SNAPSHOTS, SPOT_WAIT_SEC,
+    STRIKE_WINDOW, STREAM_KEEPALIVE_SEC, STREAM_MAX_SYMBOLS, STREAM_MIN_INTERVAL_SEC, SWR_MAX_AGE_SEC, SWR_MODE,
+    SWR_MODES, TOKEN_MANAGER, WAIT_MODE, WATCHLIST, AlertEngine, DeltaScan, DxLinkStreamer, Prewarmer,
+    StreamHub, StreamSubscriber, TopK, _endpoint_label, json_dumps, json_loads, screen_candidate,
+    scan_options, screen_options, snapshot_query_options, snapshot_response, stale_result, timeout_option,
+)
+from metrics import REGISTRY, STAGE_SECONDS, UPSTREAM_RESPONSES, Timings, timed
+import upstream
+from upstream import BREAKERS, CircuitOpenError, is_upstream_failure
+
+# Pool size, timeout and retry policy default to the sync client's (upstream.py)
+ASYNC_HTTP_MAX_CONNECTIONS = int(os.getenv("TT_ASYNC_HTTP_MAX_CONNECTIONS", str(upstream.POOL_SIZE)))
+ASYNC_HTTP_TIMEOUT_SEC = float(os.getenv("TT_ASYNC_HTTP_TIMEOUT_SEC", str(upstream.TIMEOUT_SEC)))
+# HTTP/2 multiplexes every request over one connection; needs the optional `h2` package
+try:
+    import h2  # noqa: F401
+    ASYNC_HTTP2 = os.getenv("TT_ASYNC_HTTP2", "1") == "1"
+except ImportError:
+    ASYNC_HTTP2 = False
+
+_HTTP = None             # httpx.AsyncClient, opened in the lifespan handler
+_HTTP_SLOTS = None       # asyncio.Semaphore sized like the pool; time spent acquiring = pool wait
+_PREWARMER = None        # AsyncPrewarmer, started in the lifespan handler
+_CHAIN_INFLIGHT = {}     # (SYMBOL, expiration) -> Task, so concurrent misses share one request
+_RESULT_INFLIGHT = {}    # RESULT_CACHE key -> Task, so identical concurrent scans share one run
+
+def _raise_for_status_with_context(resp, context):
+    if resp.is_error:
+        raise requests.HTTPError(
+            f"{context} | url={resp.request.method} {resp.url} | "
+            f"status={resp.status_code} | body={resp.text}"
+        )
+
+# ✅ TokenManager is thread-based (single-flight refresh, shared store); run it off the loop
+async def get_valid_access_token():
+    return await asyncio.to_thread(TOKEN_MANAGER.get)
+
+# ✅ GET with the upstream.py retry policy (backoff + jitter, Retry-After, rate-limit hold)
+async def _get(path, **kwargs):
+    attempt = 0
+    while True:
+        hold = upstream.RATE_LIMIT.hold()
+        if hold:
+            with timed("rate_limit_wait"):
+                await asyncio.sleep(hold)
+        t0 = time.perf_counter()
+        async with _HTTP_SLOTS:
+            STAGE_SECONDS.observe(time.perf_counter() - t0, "pool_wait")
+            try:
+                r = await _HTTP.get(path, **kwargs)
+            except httpx.TransportError:
+                if attempt >= upstream.RETRIES:
+                    raise
+                r = None
+        if r is None:
+            reason, delay = "connection", upstream.retry_delay(attempt)
+        else:
+            upstream.RATE_LIMIT.note(r.headers)
+            if attempt >= upstream.RETRIES or not upstream.should_retry("GET", r.status_code):
+                return r
+            delay = upstream.retry_delay(attempt, r.headers)
+            if delay > upstream.BACKOFF_MAX_SEC:
+                return r
+            reason = str(r.status_code)
+        upstream.UPSTREAM_RETRIES.inc(reason)
+        await asyncio.sleep(delay)
+        attempt += 1
+
+# ✅ Authenticated GET that refreshes the token and retries once on 401, behind a circuit breaker
+async def _api_get(path, token, context, params=None, breaker=None):
+    breaker = breaker or BREAKERS["rest"]
+    breaker.check()
+    try:
+        r = await _get(path, headers={"Authorization": f"Bearer {token}"}, params=params)
+        UPSTREAM_RESPONSES.inc(_endpoint_label(path), r.status_code)
+        if r.status_code == 401:
+            token = await asyncio.to_thread(TOKEN_MANAGER.invalidate, token)
+            r = await _get(path, headers={"Authorization": f"Bearer {token}"}, params=params)
+            UPSTREAM_RESPONSES.inc(_endpoint_label(path), r.status_code)
+    except Exception as e:
+        breaker.record_failure(e)
+        raise
+    if is_upstream_failure(r.status_code):
+        breaker.record_failure(f"HTTP {r.status_code} from {_endpoint_label(path)}")
+    else:
+        breaker.record_success()
+    _raise_for_status_with_context(r, context)
+    return r
+
+async def get_api_quote_token(access_token):
+    with timed("quote_token"):
+        r = await _api_get("/api-quote-tokens", access_token, "api_quote_token_failed",
+                           breaker=BREAKERS["quote_token"])
+    payload = json_loads(r.content).get("data", {})
+    return payload.get("token"), payload.get("dxlink-url")
+
+async def _load_nested_chain(symbol, token, expiration, context):
+    params = {'expiration-date': expiration} if expiration else None
+    with timed("chain_fetch"):
+        r = await _api_get(f"/option-chains/{symbol}/nested", token, context, params=params)
+        data = json_loads(r.content).get('data', {})
+    if data.get('items'):
+        CHAIN_CACHE.put(symbol, expiration, data)
+    return data
+
+# ✅ Same cache as app.fetch_nested_chain; concurrent misses for one key await a single request
+async def fetch_nested_chain(symbol, token, expiration=None, context="nested_chain_fetch_failed", refresh=False):
+    data = None if refresh else CHAIN_CACHE.get(symbol, expiration)
+    if data is not None:
+        return data
+    key = (symbol.upper(), expiration)
+    task = _CHAIN_INFLIGHT.get(key)
+    if task is None:
+        task = _CHAIN_INFLIGHT[key] = asyncio.ensure_future(_load_nested_chain(symbol, token, expiration, context))
+        task.add_done_callback(lambda _: _CHAIN_INFLIGHT.pop(key, None))
+    return await asyncio.shield(task)
+
+async def get_parsed_chain(symbol, token, expiration=None, context="nested_chain_fetch_failed"):
+    data = await fetch_nested_chain(symbol, token, expiration, context=context)
+    return CHAIN_CACHE.parsed(symbol, expiration, data)
+
+# ✅ Closest expiration to target_dte plus its streamer symbols (app._prepare_symbol, async)
+async def prepare_symbol(symbol, token, target_dte):
+    chain = await get_parsed_chain(symbol, token, context="expirations_fetch_failed")
+    if not chain.expirations:
+        raise Exception(f"No expirations found for {symbol}")
+    expiration = chain.closest_expiration(target_dte)
+    ce = chain.get(expiration)
+    if ce is None or not ce.puts or not ce.calls:
+        # Unfiltered document did not list strikes for this date; ask for it directly
+        chain = await get_parsed_chain(symbol, token, expiration, context="nested_for_symbols_failed")
+        ce = chain.get(expiration)
+    if ce is None:
+        raise Exception(f"No option data found for {symbol} @ {expiration}")
+    if not ce.puts or not ce.calls:
+        raise Exception(f"No streamer symbols found for {symbol} @ {expiration}")
+    return expiration, list(ce.puts), list(ce.calls), ce.sym_to_strike
+
+# ✅ DxLinkStreamer driven by an asyncio task instead of a thread.
+# Subscription groups, coverage trackers and the book are the base class's; only the
+# transport and the waits differ. Must be used from the event loop that started it.
+class AsyncDxLinkStreamer(DxLinkStreamer):
+
+    def __init__(self):
+        super().__init__()
+        self._task = None
+        self._writer = None
+        self._outbox = None
+        self._changed = asyncio.Event()
+
+    # -- lifecycle --
+    def start(self):
+        if self._task is not None and not self._task.done():
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        if SHARED_QUOTES is not None:
+            SHARED_QUOTES.start(self.book)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self._disconnect()
+
+    # Queued so that messages go out in order from a single writer task
+    def _send(self, obj):
+        if self._ws is None:
+            return False
+        self._outbox.put_nowait(obj)
+        return True
+
+    async def _write_loop(self, ws, outbox):
+        while True:
+            obj = await outbox.get()
+            await ws.send(json_dumps(obj))
+
+    async def _connect(self):
+        access_token = await get_valid_access_token()
+        dx_token, dx_url = await get_api_quote_token(access_token)
+        if not dx_token or not dx_url:
+            raise Exception("Failed to obtain DxLink token/url")
+
+        with timed("ws_connect"):
+            ws = await ws_connect(dx_url, open_timeout=10, max_size=None)
+            self._outbox = asyncio.Queue()
+            self._writer = asyncio.get_running_loop().create_task(self._write_loop(ws, self._outbox))
+            self._ws = ws
+            self._open_session(dx_token)
+
+    async def _disconnect(self):
+        with self._cond:
+            self._connected = False
+            self.book.live_since = None
+        ws, self._ws = self._ws, None
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+        if ws is not None:
+            try:
+                await ws.close()
+            except Exception:
+                pass
+
+    async def _run(self):
+        backoff = 1
+        while True:
+            try:
+                await self._connect()
+                BREAKERS["dxlink"].record_success()
+                backoff = 1
+                await self._read_loop()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                BREAKERS["dxlink"].record_failure(e)
+            await self._disconnect()
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, DX_RECONNECT_MAX_SEC)
+
+    async def _read_loop(self):
+        last_keepalive = time.time()
+        while True:
+            if time.time() - last_keepalive >= DX_KEEPALIVE_SEC:
+                self._send({"type": "KEEPALIVE", "channel": 0})
+                last_keepalive = time.time()
+                self.evict_idle()
+            if self._writer.done():
+                raise Exception(f"DxLink send failed: {self._writer.exception()}")
+            try:
+                raw = await asyncio.wait_for(self._ws.recv(), 1.0)
+            except asyncio.TimeoutError:
+                continue
+            self._handle_message(raw)
+
+    def _apply_events(self, data):
+        version = self.version
+        super()._apply_events(data)
+        if self.version != version:
+            # Wake every waiter; each re-checks its own tracker
+            self._changed.set()
+            self._changed = asyncio.Event()
+
+    async def _wait(self, timeout_sec):
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout_sec)
+        except asyncio.TimeoutError:
+            pass
+
+    # -- reads (coroutine versions of the base class's blocking waits) --
+    async def snapshot(self, symbols, timeout_sec=3.0, max_age=None, until=None):
+        if max_age is None:
+            max_age = MAX_STALENESS_SEC
+        t_end = time.time() + timeout_sec
+        borrowed = {}
+        if SHARED_QUOTES is not None:
+            now = time.time()
+            missing = [s for s in symbols if not self.book.fresh(s, max_age, now)]
+            if missing:
+                borrowed = await asyncio.to_thread(SHARED_QUOTES.load, missing, max_age)
+        tracker = self.track(symbols, max_age, borrowed)
+        try:
+            while not tracker.complete:
+                if until is not None and tracker.changed:
+                    tracker.changed = False
+                    if until(tracker):
+                        break
+                remaining = t_end - time.time()
+                if remaining <= 0:
+                    break
+                await self._wait(remaining)
+            records = self.collect(symbols, max_age)
+        finally:
+            self.untrack(tracker)
+        for s, rec in borrowed.items():
+            if s not in records or not records[s].has_quote:
+                records[s] = rec
+        return records
+
+    async def wait_for_prices(self, symbols, timeout_sec=1.0):
+        t_end = time.time() + timeout_sec
+        while True:
+            prices = {}
+            for s in symbols:
+                rec = self.book.get(s)
+                if rec is not None and rec.spot:
+                    prices[s] = rec.spot
+            remaining = t_end - time.time()
+            if len(prices) == len(symbols) or remaining <= 0:
+                return prices
+            await self._wait(remaining)
+
+_STREAMER = None
+
+def get_streamer():
+    global _STREAMER
+    if _STREAMER is None:
+        _STREAMER = AsyncDxLinkStreamer()
+    return _STREAMER
+
+# ✅ app.find_30_delta_options, awaiting the feed instead of blocking on it
+async def find_delta_options(symbol, token, target_dte=21, max_age=None, target_delta=0.30, wait_mode=None,
+                             strike_window=None, timeout_sec=3.0, greeks_source=None, rate=None, timings=None):
+    BREAKERS["dxlink"].check(probe=False)
+    t_end = time.time() + timeout_sec
+    bracket = (wait_mode or WAIT_MODE) == "bracket"
+    half_width = STRIKE_WINDOW if strike_window is None else strike_window
+    timings = timings or Timings()
+
+    # Underlying price streams in while the chain is fetched
+    streamer = get_streamer()
+    lease = streamer.lease(symbol)
+    scan = None
+    try:
+        streamer.set_group(lease, [symbol])
+        with timings.stage("chain_symbols"):
+            expiration, put_syms, call_syms, sym_to_strike = await prepare_symbol(symbol, token, target_dte)
+        with timings.stage("spot"):
+            spot = (await streamer.wait_for_prices([symbol], min(SPOT_WAIT_SEC, timeout_sec))).get(symbol)
+        scan = DeltaScan(symbol, expiration, put_syms, call_syms, sym_to_strike, target_delta, spot, half_width,
+                         greeks_source, rate)
+
+        records = {}
+        while True:
+            streamer.set_group(lease, scan.subscription())
+            with timings.stage("coverage"):
+                records = await streamer.snapshot(scan.option_symbols(),
+                                                  timeout_sec=max(0.0, t_end - time.time()),
+                                                  max_age=max_age, until=scan.wait_until(bracket))
+            with timings.stage("finish"):
+                scan.finish(records)
+            if time.time() >= t_end or scan.bracketed(records) or not scan.window.widen():
+                break
+    finally:
+        streamer.release(lease, scan.keep() if scan else None)
+    with timings.stage("selection"):
+        return scan.select(records)
+
+# ✅ app.Prewarmer's schedule (its own thread) with the warming itself run on the event loop
+class AsyncPrewarmer(Prewarmer):
+
+    def __init__(self, loop, *args):
+        super().__init__(*args)
+        self.loop = loop
+
+    def warm_symbol(self, symbol, refresh_chain):
+        return asyncio.run_coroutine_threadsafe(self._warm_async(symbol, refresh_chain), self.loop).result()
+
+    async def _warm_async(self, symbol, refresh_chain):
+        token = await get_valid_access_token()
+        if refresh_chain:
+            await fetch_nested_chain(symbol, token, refresh=True, context="prewarm_chain_failed")
+        result = await find_delta_options(symbol, token, target_dte=self.target_dte,
+                                          target_delta=self.target_delta)
+        return result["expiration"]
+
+    def idle(self):
+        asyncio.run_coroutine_threadsafe(self._idle_async(), self.loop).result()
+
+    async def _idle_async(self):
+        for key in self.warm_keys():
+            get_streamer().drop_group(key)
+
+# ✅ app.ResultCache semantics on the event loop: cached, else join the in-flight task, else run it
+async def coalesced(key, compute, max_age=None):
+    result = RESULT_CACHE.lookup(key)
+    if result is not None:
+        RESULT_CACHE_EVENTS.inc(key[0], "hit")
+        return result, "hit"
+    task = _RESULT_INFLIGHT.get(key)
+    if task is not None:
+        result = await asyncio.shield(task)
+        RESULT_CACHE_EVENTS.inc(key[0], "coalesced")
+        return result, "coalesced"
+
+    async def run():
+        result = await compute()
+        RESULT_CACHE.store(key, result, max_age)
+        return result
+
+    task = _RESULT_INFLIGHT[key] = asyncio.ensure_future(run())
+    task.add_done_callback(lambda _: _RESULT_INFLIGHT.pop(key, None))
+    result = await asyncio.shield(task)
+    RESULT_CACHE_EVENTS.inc(key[0], "miss")
+    return result, "miss"
+
+async def _revalidate(key, compute, max_age):
+    try:
+        await coalesced(key, compute, max_age)
+    except Exception:
+        pass
+
+# ✅ app.run_with_stale on the event loop
+async def coalesced_with_stale(key, compute, max_age=None, mode=None):
+    mode = mode or SWR_MODE
+    stale = RESULT_CACHE.last_good(key, SWR_MAX_AGE_SEC) if mode != "off" else None
+    if stale is not None and mode == "always" and RESULT_CACHE.lookup(key) is None:
+        if key not in _RESULT_INFLIGHT:
+            asyncio.ensure_future(_revalidate(key, compute, max_age))
+        RESULT_CACHE_EVENTS.inc(key[0], "stale")
+        return stale_result(*stale, "revalidating"), "stale"
+    try:
+        return await coalesced(key, compute, max_age)
+    except Exception as e:
+        if stale is None:
+            raise
+        RESULT_CACHE_EVENTS.inc(key[0], "stale")
+        return stale_result(*stale, str(e)), "stale"
+
+# /fetch and every symbol of /fetch/batch and /screen share scans when their options (timeout
+# included: a shorter wait may return a less complete selection) match. The access token is
+# only looked up when a scan actually runs; only that caller's `timings` get filled.
+async def find_delta_options_coalesced(symbol, timeout_sec=3.0, stale=None, timings=None, **options):
+    key = ("fetch", symbol.upper(), options["target_dte"], options["target_delta"], options["max_age"],
+           options["wait_mode"], options["strike_window"], options["greeks_source"], options["rate"], timeout_sec)
+    timings = timings or Timings()
+
+    async def compute():
+        with timings.stage("token"):
+            token = await get_valid_access_token()
+        return await find_delta_options(symbol, token, timeout_sec=timeout_sec, timings=timings, **options)
+
+    return await coalesced_with_stale(key, compute, options["max_age"], stale)
+
+# ✅ app.StreamSubscriber woken through an asyncio.Event (offers come from the loop)
+class AsyncStreamSubscriber(StreamSubscriber):
+
+    def __init__(self, interval_sec):
+        super().__init__(interval_sec)
+        self._ready = asyncio.Event()
+
+    async def wait(self, timeout_sec):
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout_sec)
+        except asyncio.TimeoutError:
+            pass
+        return self.drain()
+
+# ✅ app.StreamHub with preparation and the publisher running on the event loop
+class AsyncStreamHub(StreamHub):
+
+    def __init__(self):
+        super().__init__()
+        self._task = None
+
+    def _new_subscriber(self, interval_sec):
+        return AsyncStreamSubscriber(interval_sec)
+
+    async def subscribe(self, symbols, target_delta=0.30, target_dte=21, interval_sec=None, subscriber=None):
+        sub, fresh = super().subscribe(symbols, target_delta, target_dte, interval_sec, subscriber)
+        await asyncio.gather(*(self._prepare(topic) for topic in fresh))
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+        return sub
+
+    def unsubscribe(self, sub):
+        streamer = get_streamer()
+        for topic in super().unsubscribe(sub):
+            streamer.drop_group(topic.group)
+
+    async def _prepare(self, topic):
+        try:
+            token = await get_valid_access_token()
+            expiration, put_syms, call_syms, sym_to_strike = await prepare_symbol(topic.symbol, token,
+                                                                                  topic.target_dte)
+            streamer = get_streamer()
+            streamer.extend_groups({topic.group: [topic.symbol]}, pinned=True)
+            spot = (await streamer.wait_for_prices([topic.symbol], SPOT_WAIT_SEC)).get(topic.symbol)
+            scan = DeltaScan(topic.symbol, expiration, put_syms, call_syms, sym_to_strike, topic.target_delta,
+                             spot, STRIKE_WINDOW)
+            streamer.set_group(topic.group, scan.subscription(), pinned=True)
+            topic.scan = scan
+            topic.dirty = True
+        except Exception as e:
+            self.publish(topic, topic.error_payload(e))
+        topic.prepared_at = time.time()
+
+    async def _run(self):
+        streamer = get_streamer()
+        while self.topics:
+            topics = list(self.topics.values())
+            t0 = time.time()
+            due = [topic for topic in topics if topic.due(t0)]
+            if due:
+                await asyncio.gather(*(self._prepare(topic) for topic in due))
+            version = streamer.version
+            self.publish_all(streamer, topics)
+            await asyncio.sleep(max(0.0, STREAM_MIN_INTERVAL_SEC - (time.time() - t0)))
+            if streamer.version == version:
+                await streamer._wait(STREAM_KEEPALIVE_SEC)
+
+STREAM_HUB = AsyncStreamHub()
+
+# ✅ app.AlertEngine on the async hub (delivery still runs on its own thread)
+class AsyncAlertEngine(AlertEngine):
+
+    async def add(self, spec):
+        rule, sub = self._add(spec)
+        if sub is not None:
+            await self.hub.subscribe([rule.symbol], rule.target_delta, rule.target_dte, subscriber=sub)
+        return rule
+
+ALERTS = AsyncAlertEngine(STREAM_HUB)
+
+# Query parameters shared by the SSE and websocket endpoints; raises ValueError
+def _stream_params(params):
+    symbols = list(dict.fromkeys(s.strip().upper() for s in params.get('symbols', '').split(',') if s.strip()))
+    if not symbols:
+        raise ValueError("Missing symbols")
+    if len(symbols) > STREAM_MAX_SYMBOLS:
+        raise ValueError(f"Too many symbols (max {STREAM_MAX_SYMBOLS})")
+    interval = params.get('interval')
+    return (symbols, float(params.get('target_delta', 0.30)), int(params.get('target_dte', 21)),
+            float(interval) if interval is not None else None)
+
+def _error_body(e):
+    if isinstance(e, CircuitOpenError):
+        return {"error": "CircuitOpen", "details": str(e)}
+    if isinstance(e, requests.HTTPError):
+        return {"error": "HTTPError", "details": str(e)}
+    return {"error": str(e)}
+
+async def _json_body(request):
+    try:
+        return await request.json() or {}
+    except Exception:
+        return {}
+
+async def home(request):
+    return JSONResponse({"status": "ok", "mode": "asgi", "dx_data_format": DX_DATA_FORMAT})
+
+async def fetch_data(request):
+    try:
+        data = await _json_body(request)
+        symbol = data.get('symbol')
+        if not symbol:
+            return JSONResponse({"error": "Missing symbol"}, 400)
+        stale = data.get('stale')
+        if stale is not None and stale not in SWR_MODES:
+            return JSONResponse({"error": f"stale must be one of {', '.join(SWR_MODES)}"}, 400)
+        try:
+            options = scan_options(data)
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, 400)
+        timings = Timings()
+        result, outcome = await find_delta_options_coalesced(symbol, stale=stale, timings=timings, **options)
+        result = dict(result)
+        if data.get('timings'):
+            result["cache"] = outcome
+            if timings.stages:
+                result["timings"] = timings.as_ms()
+        return JSONResponse(result, 200, headers={"X-Result-Cache": outcome})
+    except Exception as e:
+        return JSONResponse(_error_body(e), 503 if isinstance(e, CircuitOpenError) else 500)
+
+# ✅ (symbol, result or error body) as each symbol's coroutine completes (app.iter_delta_options_batch)
+async def iter_delta_options_batch(symbols, timeout_sec, options):
+
+    async def scan(sym):
+        try:
+            return sym, (await find_delta_options_coalesced(sym, timeout_sec=timeout_sec, **options))[0]
+        except Exception as e:
+            return sym, _error_body(e)
+
+    for done in asyncio.as_completed([scan(sym) for sym in symbols]):
+        yield await done
+
+# ✅ Every symbol runs as its own coroutine on the shared connection
+async def fetch_batch(request):
+    try:
+        data = await _json_body(request)
+        symbols = data.get('symbols')
+        if not symbols or not isinstance(symbols, list):
+            return JSONResponse({"error": "Missing symbols"}, 400)
+        symbols = list(dict.fromkeys(str(s).upper() for s in symbols if s))
+        if len(symbols) > BATCH_MAX_SYMBOLS:
+            return JSONResponse({"error": f"Too many symbols (max {BATCH_MAX_SYMBOLS})"}, 400)
+        try:
+            options = scan_options(data)
+            timeout_sec = timeout_option(data)
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, 400)
+
+        stream = request.query_params.get('stream') or data.get('stream')
+        if stream in ("ndjson", "sse"):
+            return StreamingResponse(_stream_results(symbols, timeout_sec, options, stream),
+                                     media_type="text/event-stream" if stream == "sse" else "application/x-ndjson",
+                                     headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+        results = await asyncio.gather(
+            *(find_delta_options_coalesced(sym, timeout_sec=timeout_sec, **options) for sym in symbols),
+            return_exceptions=True)
+        return JSONResponse({"results": {sym: _error_body(r) if isinstance(r, Exception) else r[0]
+                                         for sym, r in zip(symbols, results)}}, 200)
+    except Exception as e:
+        return JSONResponse(_error_body(e), 500)
+
+# One line (ndjson) or event (sse) per symbol as it completes, same framing as app._stream_results
+async def _stream_results(symbols, timeout_sec, options, fmt):
+    async for sym, result in iter_delta_options_batch(symbols, timeout_sec, options):
+        line = json_dumps({"symbol": sym, **result})
+        yield f"event: result\ndata: {line}\n\n" if fmt == "sse" else line + "\n"
+    if fmt == "sse":
+        yield "event: done\ndata: {}\n\n"
+
+# app:app routes with no ASGI implementation: an explicit 404 instead of Starlette's bare one
+ASGI_UNSUPPORTED = ('/query', '/authorize', '/authorize/callback', '/debug/token-status',
+                    '/debug/nested-raw', '/debug/nested-sample')
+
+async def unsupported(request):
+    return JSONResponse({"error": f"{request.url.path} is only served by app:app"}, 404)
+
+# ✅ Same contract as app:app's /screen; rows are ranked as each symbol's scan completes
+async def screen(request):
+    try:
+        data = await _json_body(request)
+        try:
+            symbols, sort, side, k = screen_options(data)
+            options = scan_options(data)
+            timeout_sec = timeout_option(data)
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, 400)
+
+        top = TopK(k, sort)
+        errors = {}
+        async for sym, result in iter_delta_options_batch(symbols, timeout_sec, options):
+            if "error" in result:
+                errors[sym] = result["error"]
+                continue
+            row = screen_candidate(sym, result, side, options["target_delta"])
+            if row is not None:
+                top.push(row)
+        return JSONResponse({"sort": sort, "side": side, "k": k, "screened": len(symbols), "errors": errors,
+                             "results": top.rows()}, 200)
+    except Exception as e:
+        return JSONResponse(_error_body(e), 500)
+
+# ✅ Same contract as app:app's /snapshots; the memory-mapped reads run off the event loop
+async def snapshots(request):
+    if SNAPSHOTS is None:
+        return JSONResponse({"error": "Snapshot store disabled (set TT_SNAPSHOT_DIR)"}, 404)
+    try:
+        options = snapshot_query_options(request.query_params)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, 400)
+    columns, truncated = await asyncio.to_thread(SNAPSHOTS.query, **options)
+    return JSONResponse(snapshot_response(options, columns, truncated), 200)
+
+async def snapshots_status(request):
+    if SNAPSHOTS is None:
+        return JSONResponse({"enabled": False}, 200)
+    return JSONResponse({"enabled": True, **SNAPSHOTS.status()}, 200)
+
+async def metrics(request):
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+async def chain_cache_status(request):
+    if request.query_params.get('clear'):
+        CHAIN_CACHE.invalidate(request.query_params.get('symbol'))
+    return JSONResponse(CHAIN_CACHE.stats(), 200)
+
+async def result_cache_status(request):
+    if request.query_params.get('clear'):
+        RESULT_CACHE.clear()
+    return JSONResponse(RESULT_CACHE.stats(), 200)
+
+async def breakers_status(request):
+    return JSONResponse({name: b.status() for name, b in BREAKERS.items()}, 200)
+
+async def prewarm_status(request):
+    return JSONResponse(_PREWARMER.status(), 200)
+
+# ✅ Server-sent events, same contract as app:app's /stream
+async def stream(request):
+    try:
+        params = _stream_params(request.query_params)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, 400)
+
+    async def events():
+        sub = await STREAM_HUB.subscribe(*params)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                sent_at = time.time()
+                updates = await sub.wait(STREAM_KEEPALIVE_SEC)
+                if not updates:
+                    yield ": keepalive\n\n"
+                    continue
+                for payload in updates:
+                    yield f"event: update\ndata: {json_dumps(payload)}\n\n"
+                await asyncio.sleep(max(0.0, sub.interval_sec - (time.time() - sent_at)))
+        finally:
+            STREAM_HUB.unsubscribe(sub)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# ✅ Same updates over a websocket: one JSON text message per changed selection
+async def stream_ws(websocket):
+    try:
+        params = _stream_params(websocket.query_params)
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+    await websocket.accept()
+    sub = await STREAM_HUB.subscribe(*params)
+    # Nothing is expected from the client; reading only notices the disconnect
+    closed = asyncio.ensure_future(websocket.receive_text())
+    try:
+        while not closed.done():
+            sent_at = time.time()
+            waiter = asyncio.ensure_future(sub.wait(STREAM_KEEPALIVE_SEC))
+            await asyncio.wait((waiter, closed), return_when=asyncio.FIRST_COMPLETED)
+            if not waiter.done():
+                waiter.cancel()
+                break
+            for payload in waiter.result():
+                await websocket.send_text(json_dumps(payload))
+            await asyncio.sleep(max(0.0, sub.interval_sec - (time.time() - sent_at)))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        closed.cancel()
+        STREAM_HUB.unsubscribe(sub)
+
+async def alerts(request):
+    if request.method == 'GET':
+        return JSONResponse(ALERTS.status(), 200)
+    try:
+        rule = await ALERTS.add(await _json_body(request))
+        return JSONResponse(rule.status(), 201)
+    except (ValueError, TypeError) as e:
+        return JSONResponse({"error": str(e)}, 400)
+    except Exception as e:
+        return JSONResponse(_error_body(e), 500)
+
+async def delete_alert(request):
+    rule_id = request.path_params['rule_id']
+    try:
+        ALERTS.remove(rule_id)
+    except KeyError:
+        return JSONResponse({"error": f"No alert rule {rule_id}"}, 404)
+    return JSONResponse({"deleted": rule_id}, 200)
+
+async def stream_status(request):
+    return JSONResponse(STREAM_HUB.stats(), 200)
+
+@asynccontextmanager
+async def lifespan(_app):
+    global _HTTP, _HTTP_SLOTS, _PREWARMER
+    _HTTP = httpx.AsyncClient(
+        base_url=BASE_URL,
+        timeout=ASYNC_HTTP_TIMEOUT_SEC,
+        http2=ASYNC_HTTP2,
+        limits=httpx.Limits(max_connections=ASYNC_HTTP_MAX_CONNECTIONS,
+                            max_keepalive_connections=ASYNC_HTTP_MAX_CONNECTIONS),
+    )
+    _HTTP_SLOTS = asyncio.Semaphore(ASYNC_HTTP_MAX_CONNECTIONS)
+    _PREWARMER = AsyncPrewarmer(asyncio.get_running_loop(), WATCHLIST, PREWARM_INTERVAL_SEC,
+                                PREWARM_CHAIN_REFRESH_SEC, PREWARM_TARGET_DTE, PREWARM_TARGET_DELTA)
+    _PREWARMER.ensure_started()
+    try:
+        yield
+    finally:
+        _PREWARMER.stop()
+        if _STREAMER is not None:
+            await _STREAMER.stop()
+        await _HTTP.aclose()
+
+app = Starlette(
+    routes=[
+        Route('/', home),
+        Route('/fetch', fetch_data, methods=['POST']),
+        Route('/fetch/batch', fetch_batch, methods=['POST']),
+        *(Route(path, unsupported, methods=['GET', 'POST']) for path in ASGI_UNSUPPORTED),
+        Route('/screen', screen, methods=['POST']),
+        Route('/snapshots', snapshots),
+        Route('/stream', stream),
+        WebSocketRoute('/stream/ws', stream_ws),
+        Route('/alerts', alerts, methods=['GET', 'POST']),
+        Route('/alerts/{rule_id}', delete_alert, methods=['DELETE']),
+        Route('/metrics', metrics),
+        Route('/debug/chain-cache', chain_cache_status),
+        Route('/debug/result-cache', result_cache_status),
+        Route('/debug/breakers', breakers_status),
+        Route('/debug/stream', stream_status),
+        Route('/debug/prewarm', prewarm_status),
+        Route('/debug/snapshots', snapshots_status),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,355 @@
+"""Local stand-ins for the Tastytrade REST API and the DxLink websocket feed.
+
+REST (http.server, threaded):
+    POST /oauth/token                      -> fresh access token
+    GET  /api-quote-tokens                 -> token + ws:// URL of the fake feed
+    GET  /option-chains/{symbol}/nested    -> recorded document from --chains DIR/{SYMBOL}.json,
+                                              else a synthetic chain (--expirations x --strikes)
+DxLink (websockets): SETUP/AUTH/CHANNEL_REQUEST/FEED_SETUP handshake, then Quote, Greeks and
+Trade events for every subscribed symbol, released at --rate events/sec after --first-event-ms.
+The data format follows the client's acceptDataFormat (COMPACT or JSON). With --feed FILE
+(a capture.py recording), subscriptions are answered with the recorded values for each symbol
+and the recorded FEED_DATA frames are replayed on their original schedule, at --speed.
+
+    python bench/fake_upstream.py --rest-port 8901 --dx-port 8902
+    TT_BASE_URL=http://127.0.0.1:8901 TT_REFRESH_TOKEN=x gunicorn app:app
+"""
+import argparse
+import asyncio
+import collections
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from websockets.asyncio.server import serve
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import capture
+from pricing import bs_delta, bs_price, bs_vega
+
+OPTION_RE = re.compile(r"^\.([A-Z]+)(\d{6})([CP])([\d.]+)$")
+FEED_FIELDS = {
+    "Quote": ["eventType", "eventSymbol", "bidPrice", "askPrice", "bidSize", "askSize"],
+    "Greeks": ["eventType", "eventSymbol", "volatility", "delta", "gamma", "theta", "rho", "vega"],
+    "Trade": ["eventType", "eventSymbol", "price"],
+}
+
+def spot_for(symbol):
+    # Stable per-symbol price between 20 and 500
+    return float(20 + (sum(map(ord, symbol)) * 37) % 480)
+
+# ---- synthetic market ----
+class SyntheticMarket:
+
+    def __init__(self, n_expirations=8, n_strikes=100, chains_dir=None):
+        self.n_expirations = n_expirations
+        self.n_strikes = n_strikes
+        self.chains_dir = chains_dir
+
+    def expirations(self):
+        today = date.today()
+        first = today + timedelta(days=(4 - today.weekday()) % 7 or 7)   # next Friday
+        return [first + timedelta(weeks=i) for i in range(self.n_expirations)]
+
+    def strikes(self, symbol):
+        spot = spot_for(symbol)
+        step = max(0.5, round(spot / self.n_strikes, 1))
+        lo = spot - step * (self.n_strikes // 2)
+        return [round(lo + i * step, 2) for i in range(self.n_strikes)]
+
+    def chain(self, symbol, expiration=None):
+        if self.chains_dir:
+            path = os.path.join(self.chains_dir, f"{symbol}.json")
+            if os.path.exists(path):
+                with open(path) as f:
+                    return json.load(f)
+        expirations = []
+        for d in self.expirations():
+            if expiration and d.isoformat() != expiration:
+                continue
+            ymd = d.strftime("%y%m%d")
+            expirations.append({
+                "expiration-date": d.isoformat(),
+                "days-to-expiration": (d - date.today()).days,
+                "strikes": [{
+                    "strike-price": f"{k:g}",
+                    "call-streamer-symbol": f".{symbol}{ymd}C{k:g}",
+                    "put-streamer-symbol": f".{symbol}{ymd}P{k:g}",
+                } for k in self.strikes(symbol)],
+            })
+        return {"data": {"items": [{"underlying-symbol": symbol, "expirations": expirations}]}}
+
+    # Quote/Greeks (options) or Quote/Trade (underlyings) rows for one streamer symbol
+    def events(self, symbol, wiggle=0.0):
+        m = OPTION_RE.match(symbol)
+        if not m:
+            spot = spot_for(symbol) * (1 + wiggle)
+            return [["Quote", symbol, spot - 0.01, spot + 0.01, 100, 100], ["Trade", symbol, spot]]
+        underlying, ymd, cp, strike = m.group(1), m.group(2), m.group(3), float(m.group(4))
+        spot = spot_for(underlying) * (1 + wiggle)
+        expiry = date(2000 + int(ymd[:2]), int(ymd[2:4]), int(ymd[4:]))
+        t = max((expiry - date.today()).days, 0.5) / 365.0
+        is_call = cp == "C"
+        iv = 0.25 + 0.15 * abs(math.log(strike / spot))       # a little smile
+        price = float(bs_price(spot, strike, t, 0.045, iv, is_call))
+        delta = float(bs_delta(spot, strike, t, 0.045, iv, is_call))
+        vega = float(bs_vega(spot, strike, t, 0.045, iv)) / 100
+        half = max(0.01, round(price * 0.02, 2))
+        bid = max(0.0, round(price - half, 2))
+        return [["Quote", symbol, bid, round(price + half, 2), 10, 12],
+                ["Greeks", symbol, iv, delta, 0.01, -0.02, 0.01, vega]]
+
+# ---- recorded market (capture.py file) ----
+class RecordedMarket:
+
+    def __init__(self, entries, fallback):
+        self.fallback = fallback
+        self.frames = []          # (t, raw) of every recorded inbound FEED_DATA frame
+        self.rows = {}            # symbol -> {event type: latest row in FEED_FIELDS order}
+        fields = FEED_FIELDS
+        for e in entries:
+            if e.get("kind") != "ws" or e.get("dir") != "in":
+                continue
+            msg = json.loads(e["raw"])
+            if msg.get("type") == "FEED_CONFIG" and isinstance(msg.get("eventFields"), dict):
+                fields = msg["eventFields"]
+            elif msg.get("type") == "FEED_DATA":
+                self.frames.append((e["t"], e["raw"]))
+                for row in self._rows(msg.get("data"), fields):
+                    self.rows.setdefault(row[1], {})[row[0]] = row
+
+    @staticmethod
+    def _rows(data, fields):
+        if isinstance(data, list) and data and isinstance(data[0], str):
+            for k in range(0, len(data) - 1, 2):
+                names = fields.get(data[k])
+                if not names:
+                    continue
+                n = len(names)
+                for j in range(0, len(data[k + 1]) - n + 1, n):
+                    ev = dict(zip(names, data[k + 1][j:j + n]))
+                    yield [ev.get(f) for f in FEED_FIELDS[data[k]]]
+        else:
+            for ev in ([data] if isinstance(data, dict) else data or []):
+                if ev.get("eventType") in FEED_FIELDS:
+                    yield [ev.get(f) for f in FEED_FIELDS[ev["eventType"]]]
+
+    def chain(self, symbol, expiration=None):
+        return self.fallback.chain(symbol, expiration)
+
+    def events(self, symbol, wiggle=0.0):
+        recorded = self.rows.get(symbol)
+        return list(recorded.values()) if recorded else self.fallback.events(symbol, wiggle)
+
+# ---- REST ----
+def make_rest_handler(market, dx_url_ref):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _json(self, status, body):
+            raw = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            self.rfile.read(length)
+            if self.path.startswith("/oauth/token"):
+                return self._json(200, {"access_token": f"bench-{time.time():.0f}", "expires_in": 900,
+                                        "token_type": "Bearer"})
+            self._json(404, {"error": "not found"})
+
+        def do_GET(self):
+            path, _, query = self.path.partition("?")
+            if path == "/api-quote-tokens":
+                return self._json(200, {"data": {"token": "bench-dx", "dxlink-url": dx_url_ref[0]}})
+            m = re.match(r"^/option-chains/([^/]+)/nested$", path)
+            if m:
+                params = dict(p.split("=", 1) for p in query.split("&") if "=" in p)
+                return self._json(200, market.chain(m.group(1), params.get("expiration-date")))
+            if path == "/customers/me/accounts":
+                return self._json(200, {"data": {"items": []}})
+            self._json(404, {"error": "not found"})
+
+    return Handler
+
+# ---- DxLink ----
+class FeedSession:
+
+    def __init__(self, ws, market, rate, first_event_sec, speed=1.0):
+        self.ws = ws
+        self.market = market
+        self.rate = rate
+        self.first_event_sec = first_event_sec
+        self.speed = speed
+        self.compact = True
+        self.pending = collections.deque()    # (release_at, [row, ...])
+        self.subscribed = set()
+
+    async def send(self, obj):
+        await self.ws.send(json.dumps(obj))
+
+    def frame(self, rows):
+        if not self.compact:
+            return [dict(zip(FEED_FIELDS[r[0]], r)) for r in rows]
+        by_type = {}
+        for r in rows:
+            by_type.setdefault(r[0], []).extend(r)
+        data = []
+        for et, flat in by_type.items():
+            data += [et, flat]
+        return data
+
+    async def pump(self):
+        # Release queued rows at `rate` per second in 10ms frames
+        tick = 0.01
+        budget = 0.0
+        while True:
+            await asyncio.sleep(tick)
+            budget = min(budget + self.rate * tick, self.rate) if self.rate else float("inf")
+            now = time.time()
+            rows = []
+            while self.pending and self.pending[0][0] <= now and len(rows) < budget:
+                rows.extend(self.pending.popleft()[1])
+            if rows:
+                budget -= len(rows)
+                await self.send({"type": "FEED_DATA", "channel": 3, "data": self.frame(rows)})
+
+    # Recorded frames on their original schedule (the client drops what it didn't subscribe)
+    async def replay(self, frames):
+        start = time.time()
+        t0 = frames[0][0]
+        for t, raw in frames:
+            delay = start + (t - t0) / self.speed - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self.ws.send(raw)
+
+    async def run(self):
+        pump = asyncio.create_task(self.pump())
+        replay = None
+        try:
+            async for raw in self.ws:
+                msg = json.loads(raw)
+                mtype = msg.get("type")
+                if mtype == "SETUP":
+                    await self.send({"type": "SETUP", "channel": 0, "version": "bench/1.0",
+                                     "keepaliveTimeout": 60, "acceptKeepaliveTimeout": 60})
+                    await self.send({"type": "AUTH_STATE", "channel": 0, "state": "UNAUTHORIZED"})
+                elif mtype == "AUTH":
+                    await self.send({"type": "AUTH_STATE", "channel": 0, "state": "AUTHORIZED",
+                                     "userId": "bench"})
+                elif mtype == "CHANNEL_REQUEST":
+                    await self.send({"type": "CHANNEL_OPENED", "channel": msg["channel"],
+                                     "service": "FEED", "parameters": msg.get("parameters", {})})
+                elif mtype == "FEED_SETUP":
+                    self.compact = msg.get("acceptDataFormat", "COMPACT") == "COMPACT"
+                    await self.send({"type": "FEED_CONFIG", "channel": msg["channel"],
+                                     "dataFormat": "COMPACT" if self.compact else "FULL",
+                                     "eventFields": FEED_FIELDS, "aggregationPeriod": 0.1})
+                elif mtype == "FEED_SUBSCRIPTION":
+                    if msg.get("reset"):
+                        self.subscribed.clear()
+                    for entry in msg.get("remove", []):
+                        self.subscribed.discard(entry["symbol"])
+                    added = {e["symbol"] for e in msg.get("add", [])} - self.subscribed
+                    self.subscribed |= added
+                    frames = getattr(self.market, "frames", None)
+                    if frames and replay is None:
+                        replay = asyncio.create_task(self.replay(frames))
+                    release = time.time() + self.first_event_sec
+                    for s in sorted(added):
+                        self.pending.append((release, self.market.events(s)))
+        finally:
+            pump.cancel()
+            if replay is not None:
+                replay.cancel()
+
+class FakeTastytrade:
+
+    def __init__(self, rest_port=0, dx_port=0, n_expirations=8, n_strikes=100, rate=0,
+                 first_event_ms=20, chains_dir=None, feed_file=None, speed=1.0):
+        self.market = SyntheticMarket(n_expirations, n_strikes, chains_dir)
+        if feed_file:
+            self.market = RecordedMarket(capture.load(feed_file), self.market)
+        self.rest_port = rest_port
+        self.dx_port = dx_port
+        self.rate = rate
+        self.first_event_sec = first_event_ms / 1000.0
+        self.speed = speed
+        self._dx_url = [None]
+        self._loop = None
+        self._ready = threading.Event()
+
+    @property
+    def rest_url(self):
+        return f"http://127.0.0.1:{self.rest_port}"
+
+    @property
+    def dx_url(self):
+        return self._dx_url[0]
+
+    async def _handle(self, ws):
+        await FeedSession(ws, self.market, self.rate, self.first_event_sec, self.speed).run()
+
+    def _run_dx(self):
+        async def main():
+            async with serve(self._handle, "127.0.0.1", self.dx_port, max_size=None) as server:
+                self.dx_port = server.sockets[0].getsockname()[1]
+                self._dx_url[0] = f"ws://127.0.0.1:{self.dx_port}"
+                self._ready.set()
+                await asyncio.Future()
+        self._loop = asyncio.new_event_loop()
+        self._loop.run_until_complete(main())
+
+    def start(self):
+        threading.Thread(target=self._run_dx, name="fake-dxlink", daemon=True).start()
+        self._ready.wait(5)
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", self.rest_port), make_rest_handler(self.market, self._dx_url))
+        self._httpd.daemon_threads = True
+        self.rest_port = self._httpd.server_address[1]
+        threading.Thread(target=self._httpd.serve_forever, name="fake-rest", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+
+def add_arguments(ap):
+    ap.add_argument("--expirations", type=int, default=8, help="synthetic expirations per chain")
+    ap.add_argument("--strikes", type=int, default=100, help="synthetic strikes per expiration")
+    ap.add_argument("--rate", type=float, default=0, help="DxLink events/sec per connection (0 = unlimited)")
+    ap.add_argument("--first-event-ms", type=float, default=20, help="delay before a new subscription's first event")
+    ap.add_argument("--chains", help="directory of recorded {SYMBOL}.json nested-chain responses")
+    ap.add_argument("--feed", help="capture.py file whose DxLink FEED_DATA frames are replayed")
+    ap.add_argument("--speed", type=float, default=1.0, help="replay speed multiplier for --feed")
+
+def from_args(args, rest_port=0, dx_port=0):
+    return FakeTastytrade(rest_port, dx_port, args.expirations, args.strikes, args.rate,
+                          args.first_event_ms, args.chains, args.feed, args.speed)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rest-port", type=int, default=8901)
+    ap.add_argument("--dx-port", type=int, default=8902)
+    add_arguments(ap)
+    args = ap.parse_args()
+    fake = from_args(args, args.rest_port, args.dx_port).start()
+    print(f"REST   {fake.rest_url}\nDxLink {fake.dx_url}\nexport TT_BASE_URL={fake.rest_url} TT_REFRESH_TOKEN=bench")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        fake.stop()
@@ -0,0 +1,91 @@
+"""Micro-benchmark: DxLink FEED_DATA decoding and chain payload parsing.
+
+Compares the original path (stdlib json + per-event dicts in FULL/"JSON" format)
+against the serializer backend + positional COMPACT decoding used by app.py.
+
+    python bench/feed_decode.py [--events 2000] [--repeat 200]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import serialization
+from app import DX_EVENT_FIELDS, _iter_feed_events
+
+def make_frames(n_events):
+    full, quotes, greeks = [], [], []
+    for i in range(n_events // 2):
+        sym = f".SPY261120{'C' if i % 2 else 'P'}{400 + i}"
+        q = ["Quote", sym, 1.05 + i * 0.01, 1.10 + i * 0.01, 12, 30]
+        g = ["Greeks", sym, 0.21, 0.5 - i * 0.001, 0.012, -0.05, 0.03, 0.11]
+        quotes += q
+        greeks += g
+        full.append(dict(zip(DX_EVENT_FIELDS["Quote"], q)))
+        full.append(dict(zip(DX_EVENT_FIELDS["Greeks"], g)))
+    full_frame = json.dumps({"type": "FEED_DATA", "channel": 3, "data": full})
+    compact_frame = json.dumps({"type": "FEED_DATA", "channel": 3, "data": ["Quote", quotes, "Greeks", greeks]})
+    return full_frame, compact_frame
+
+# The pre-serializer decode path, kept here as the baseline
+def legacy_decode(raw):
+    msg = json.loads(raw)
+    out = 0
+    for ev in msg.get("data"):
+        if isinstance(ev, dict) and ev.get("eventType") in DX_EVENT_FIELDS and ev.get("eventSymbol"):
+            if ev["eventType"] == "Quote":
+                ev.get("bidPrice"), ev.get("askPrice"), ev.get("bidSize"), ev.get("askSize")
+            else:
+                ev.get("delta"), ev.get("gamma"), ev.get("theta"), ev.get("vega"), ev.get("rho"), ev.get("volatility")
+            out += 1
+    return out
+
+def decode(raw, loads):
+    return sum(1 for _ in _iter_feed_events(loads(raw).get("data")))
+
+def make_chain(n_exp, n_strikes):
+    return json.dumps({"data": {"items": [{"underlying-symbol": "SPY", "expirations": [
+        {"expiration-date": f"2026-12-{e + 1:02d}", "days-to-expiration": e + 7, "strikes": [
+            {"strike-price": str(300 + k), "call": f"SPY  2612{e + 1:02d}C00{300 + k}000",
+             "put": f"SPY  2612{e + 1:02d}P00{300 + k}000",
+             "call-streamer-symbol": f".SPY2612{e + 1:02d}C{300 + k}",
+             "put-streamer-symbol": f".SPY2612{e + 1:02d}P{300 + k}"}
+            for k in range(n_strikes)]} for e in range(n_exp)]}]}}).encode()
+
+def report(label, seconds, repeat, per):
+    print(f"  {label:<38} {seconds / repeat * 1e3:8.3f} ms/frame  {seconds / repeat / per * 1e9:8.1f} ns/event")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--events", type=int, default=2000)
+    ap.add_argument("--repeat", type=int, default=200)
+    args = ap.parse_args()
+
+    full, compact = make_frames(args.events)
+    stdlib = serialization.load_backend("json")[1]
+    fast = serialization.loads
+    assert legacy_decode(full) == decode(full, fast) == decode(compact, fast)
+
+    print(f"FEED_DATA, {args.events} events/frame, backend={serialization.BACKEND}")
+    cases = [
+        ("legacy: json.loads + FULL dicts", lambda: legacy_decode(full)),
+        ("stdlib loads + FULL (typed tuples)", lambda: decode(full, stdlib)),
+        (f"{serialization.BACKEND} loads + FULL (typed tuples)", lambda: decode(full, fast)),
+        ("stdlib loads + COMPACT", lambda: decode(compact, stdlib)),
+        (f"{serialization.BACKEND} loads + COMPACT", lambda: decode(compact, fast)),
+    ]
+    for label, fn in cases:
+        report(label, timeit.timeit(fn, number=args.repeat), args.repeat, args.events)
+
+    chain = make_chain(30, 200)
+    print(f"Nested chain payload, {len(chain) / 1e6:.1f} MB")
+    for label, fn in (("json.loads", lambda: json.loads(chain)),
+                      (f"{serialization.BACKEND}.loads", lambda: fast(chain))):
+        seconds = timeit.timeit(fn, number=20)
+        print(f"  {label:<38} {seconds / 20 * 1e3:8.2f} ms")
+
+if __name__ == "__main__":
+    main()
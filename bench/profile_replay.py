@@ -0,0 +1,67 @@
+"""Profile find_30_delta_options offline from a capture.py recording.
+
+Record first (live or against bench/fake_upstream.py), e.g.:
+    TT_CAPTURE_MODE=record TT_CAPTURE_PATH=spy.ndjson.gz gunicorn app:app   # then hit /fetch
+Then replay it here, at the recorded pace (--speed 1) or faster (--speed 0 = no waiting).
+The first run must issue the same requests as the recording (same symbols, in order);
+later runs are served from the book that replay filled.
+    python bench/profile_replay.py spy.ndjson.gz --symbol SPY --runs 20 --speed 0 --cprofile
+"""
+import argparse
+import cProfile
+import os
+import pstats
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("capture")
+    ap.add_argument("--symbol", action="append", required=True, help="repeat for several, in recorded order")
+    ap.add_argument("--target-dte", type=int, default=21)
+    ap.add_argument("--target-delta", type=float, default=0.30)
+    ap.add_argument("--runs", type=int, default=10)
+    ap.add_argument("--speed", type=float, default=1.0, help="replay speed multiplier (0 = as fast as possible)")
+    ap.add_argument("--timeout", type=float, default=3.0)
+    ap.add_argument("--cprofile", action="store_true", help="print the top functions by cumulative time")
+    ap.add_argument("--top", type=int, default=25)
+    args = ap.parse_args()
+
+    os.environ["TT_CAPTURE_MODE"] = "replay"
+    os.environ["TT_CAPTURE_PATH"] = args.capture
+    os.environ["TT_REPLAY_SPEED"] = str(args.speed)
+    os.environ.setdefault("TT_REFRESH_TOKEN", "replay")
+    import app
+    from metrics import Timings
+
+    profiler = cProfile.Profile() if args.cprofile else None
+    totals = {}
+    wall = []
+    for _ in range(args.runs):
+        timings = Timings()
+        t0 = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        token = app.get_valid_access_token()
+        for symbol in args.symbol:
+            expiration = app.get_closest_expiration(symbol, token, args.target_dte)
+            result = app.find_30_delta_options(symbol, expiration, token, target_delta=args.target_delta,
+                                               timeout_sec=args.timeout, timings=timings)
+        if profiler:
+            profiler.disable()
+        wall.append((time.perf_counter() - t0) * 1000.0)
+        for stage, ms in timings.as_ms().items():
+            totals[stage] = totals.get(stage, 0.0) + ms
+
+    print(f"last result: {result}")
+    wall.sort()
+    print(f"{args.runs} runs: min={wall[0]:.2f}ms median={wall[len(wall) // 2]:.2f}ms max={wall[-1]:.2f}ms")
+    for stage, ms in sorted(totals.items()):
+        print(f"  {stage:<16} {ms / args.runs:>9.3f} ms mean")
+    if profiler:
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(args.top)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Offline load benchmark for /fetch and /fetch/batch against bench/fake_upstream.py.
+
+By default the Flask app is imported in-process (pointed at the fakes through TT_BASE_URL)
+and driven with its test client from --concurrency threads. With --url, requests go over
+HTTP to an already running server instead (gunicorn app:app / uvicorn asgi:app started
+with TT_BASE_URL of `python bench/fake_upstream.py`).
+
+In-process runs turn the result cache off (TT_RESULT_CACHE_*_SEC=0) unless --result-cache
+is given, so every timed request takes the scan path. Either way the report counts the
+X-Result-Cache outcome of each request (hit / miss / coalesced / stale).
+
+    python bench/run.py --requests 500 --concurrency 16 --symbols 20
+    python bench/run.py --mode batch --batch-size 50 --strikes 200 --rate 20000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_upstream
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values) - 1, max(0, int(round(q / 100.0 * (len(sorted_values) - 1)))))
+    return sorted_values[k]
+
+class Client:
+
+    def __init__(self, url=None):
+        self.url = url
+        if url:
+            import requests
+            self.session = requests.Session()
+        else:
+            import app
+            self.flask = app.app
+
+    def post(self, path, body):
+        if self.url:
+            r = self.session.post(self.url + path, json=body)
+            return r.status_code, r.json(), r.headers.get("X-Result-Cache")
+        with self.flask.test_client() as c:
+            r = c.post(path, json=body)
+            return r.status_code, r.get_json(), r.headers.get("X-Result-Cache")
+
+    def get(self, path):
+        if self.url:
+            return self.session.get(self.url + path).text
+        with self.flask.test_client() as c:
+            return c.get(path).get_data(as_text=True)
+
+def run(client, mode, symbols, n_requests, concurrency, batch_size, cold, body_extra):
+    def one(i):
+        if cold:
+            client.get("/debug/chain-cache?clear=1")
+        if mode == "fetch":
+            body = {"symbol": symbols[i % len(symbols)], **body_extra}
+            path = "/fetch"
+        else:
+            start = (i * batch_size) % len(symbols)
+            body = {"symbols": (symbols * 2)[start:start + batch_size], **body_extra}
+            path = "/fetch/batch"
+        t0 = time.perf_counter()
+        status, payload, outcome = client.post(path, body)
+        elapsed = time.perf_counter() - t0
+        ok = status == 200 and "error" not in payload
+        if ok and mode == "batch":
+            ok = all("error" not in r for r in payload["results"].values())
+        return elapsed, ok, outcome or "none"
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as ex:
+        results = list(ex.map(one, range(n_requests)))
+    wall = time.perf_counter() - t0
+    latencies = sorted(r[0] * 1000.0 for r in results)
+    return {
+        "mode": mode,
+        "requests": n_requests,
+        "concurrency": concurrency,
+        "errors": sum(1 for r in results if not r[1]),
+        "wall_sec": round(wall, 3),
+        "throughput_rps": round(n_requests / wall, 1),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p90_ms": round(percentile(latencies, 90), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(latencies[-1], 2),
+        "result_cache": dict(Counter(r[2] for r in results)),
+    }
+
+# Mean seconds per stage from the in-process /metrics histograms
+def stage_means(metrics_text):
+    sums, counts = {}, {}
+    for line in metrics_text.splitlines():
+        if line.startswith("tt_stage_seconds_sum"):
+            stage = line.split('"')[1]
+            sums[stage] = float(line.rsplit(" ", 1)[1])
+        elif line.startswith("tt_stage_seconds_count"):
+            stage = line.split('"')[1]
+            counts[stage] = int(line.rsplit(" ", 1)[1])
+    return {s: round(sums[s] / counts[s] * 1000.0, 3) for s in sorted(sums) if counts.get(s)}
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--url", help="benchmark a running server instead of the in-process app")
+    ap.add_argument("--mode", choices=("fetch", "batch", "both"), default="both")
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--symbols", type=int, default=10, help="distinct synthetic underlyings")
+    ap.add_argument("--batch-size", type=int, default=25)
+    ap.add_argument("--cold", action="store_true", help="clear the chain cache before every request")
+    ap.add_argument("--result-cache", action="store_true",
+                    help="keep the in-process result cache on (timed requests may be cache hits)")
+    ap.add_argument("--warmup", type=int, default=1, help="untimed passes over every symbol first")
+    ap.add_argument("--body", default="{}", help="extra JSON merged into every request body")
+    ap.add_argument("--json", action="store_true", help="print results as JSON")
+    fake_upstream.add_arguments(ap)
+    args = ap.parse_args()
+
+    fake = None
+    if not args.url:
+        fake = fake_upstream.from_args(args).start()
+        os.environ["TT_BASE_URL"] = fake.rest_url
+        os.environ.setdefault("TT_REFRESH_TOKEN", "bench")
+        os.environ.setdefault("TT_CLIENT_SECRET", "bench")
+        if not args.result_cache:
+            for kind in ("FETCH", "QUERY", "BATCH"):
+                os.environ[f"TT_RESULT_CACHE_{kind}_SEC"] = "0"
+    client = Client(args.url)
+
+    symbols = [f"S{chr(65 + i // 26 % 26)}{chr(65 + i % 26)}" for i in range(args.symbols)]
+    body_extra = json.loads(args.body)
+    for _ in range(args.warmup):
+        for s in symbols:
+            client.post("/fetch", {"symbol": s, **body_extra})
+
+    modes = ("fetch", "batch") if args.mode == "both" else (args.mode,)
+    report = {"results": [run(client, m, symbols, args.requests if m == "fetch" else max(1, args.requests // 10),
+                              args.concurrency, args.batch_size, args.cold, body_extra) for m in modes]}
+    if fake is not None:
+        report["stage_mean_ms"] = stage_means(client.get("/metrics"))
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for r in report["results"]:
+        print(f"{r['mode']:<6} n={r['requests']:<5} c={r['concurrency']:<3} err={r['errors']:<3} "
+              f"{r['throughput_rps']:>8} req/s  p50={r['p50_ms']}ms p90={r['p90_ms']}ms "
+              f"p99={r['p99_ms']}ms max={r['max_ms']}ms")
+        print("  result cache: " + ", ".join(f"{k}={v}" for k, v in sorted(r["result_cache"].items())))
+    for stage, ms in report.get("stage_mean_ms", {}).items():
+        print(f"  {stage:<16} {ms:>9} ms mean")
+
+if __name__ == "__main__":
+    main()
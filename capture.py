@@ -0,0 +1,282 @@
+import atexit
+import gzip
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from websocket import WebSocketTimeoutException
+
+# Record/replay of upstream traffic. One NDJSON line per event (gzip if the path ends in .gz):
+#   {"t": 0.123, "kind": "rest", "method": "GET", "path": "/option-chains/SPY/nested",
+#    "params": [["expiration-date", "2026-11-20"]], "status": 200, "body": "..."}
+#   {"t": 1.5, "kind": "ws", "conn": 0, "dir": "open" | "in" | "out", "raw": "..."}
+# "t" is seconds since the capture started. Credentials are redacted on the way in, so a
+# capture can be shared; replay doesn't need real tokens.
+# bench/fake_upstream.py --feed reads the same file (the "in" frames).
+
+REDACT_KEYS = ("access_token", "refresh_token", "id_token", "token")
+
+def _redact(obj):
+    if isinstance(obj, dict):
+        return {k: ("REDACTED" if k in REDACT_KEYS and isinstance(v, str) else _redact(v)) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_redact(v) for v in obj]
+    return obj
+
+def _redact_text(text):
+    try:
+        return json.dumps(_redact(json.loads(text)), separators=(",", ":"))
+    except ValueError:
+        return text
+
+def _open(path, mode):
+    return gzip.open(path, mode + "t") if path.endswith(".gz") else open(path, mode)
+
+def _params_key(params):
+    if not params:
+        return []
+    items = params.items() if isinstance(params, dict) else params
+    return sorted([str(k), str(v)] for k, v in items)
+
+# ✅ Append-only capture writer shared by the session and websocket wrappers
+class Capture:
+
+    def __init__(self, path):
+        self.path = path
+        self._file = _open(path, "a")
+        self._lock = threading.Lock()
+        self._t0 = time.monotonic()
+        self._connections = 0
+        atexit.register(self.close)
+
+    def write(self, entry):
+        entry["t"] = round(time.monotonic() - self._t0, 6)
+        line = json.dumps(entry, separators=(",", ":"))
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line + "\n")
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def next_connection(self):
+        with self._lock:
+            conn, self._connections = self._connections, self._connections + 1
+        return conn
+
+# Entries of a capture; a file cut short (process killed mid-write) yields what was complete
+def load(path):
+    entries = []
+    with _open(path, "r") as f:
+        try:
+            for line in f:
+                if line.endswith("\n"):
+                    entries.append(json.loads(line))
+        except EOFError:
+            pass
+    return entries
+
+# ---- record ----
+class RecordingSession:
+
+    def __init__(self, session, capture):
+        self._session = session
+        self._capture = capture
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+    def request(self, method, url, params=None, **kwargs):
+        r = self._session.request(method, url, params=params, **kwargs)
+        self._capture.write({
+            "kind": "rest",
+            "method": method.upper(),
+            "path": urlsplit(url).path,
+            "params": _params_key(params),
+            "status": r.status_code,
+            "body": _redact_text(r.text),
+        })
+        return r
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+class RecordingWebSocket:
+
+    def __init__(self, ws, capture, url):
+        self._ws = ws
+        self._capture = capture
+        self._conn = capture.next_connection()
+        capture.write({"kind": "ws", "conn": self._conn, "dir": "open", "raw": url})
+
+    def settimeout(self, timeout):
+        self._ws.settimeout(timeout)
+
+    def send(self, raw):
+        self._capture.write({"kind": "ws", "conn": self._conn, "dir": "out", "raw": _redact_text(raw)})
+        return self._ws.send(raw)
+
+    def recv(self):
+        raw = self._ws.recv()
+        if raw:
+            self._capture.write({"kind": "ws", "conn": self._conn, "dir": "in", "raw": raw})
+        return raw
+
+    def close(self):
+        self._ws.close()
+
+# ---- replay ----
+class ReplayResponse:
+
+    def __init__(self, method, url, status, body):
+        self.status_code = status
+        self.text = body
+        self.content = body.encode()
+        self.url = url
+        self.request = requests.Request(method, url)
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} (replayed) for url: {self.url}", response=None)
+
+# ✅ Serves recorded REST responses by (method, path, params), in recorded order per key;
+# the last response for a key repeats once the recorded ones are used up
+class ReplaySession:
+
+    def __init__(self, entries):
+        self.headers = {}
+        self._lock = threading.Lock()
+        self._responses = {}
+        for e in entries:
+            if e.get("kind") == "rest":
+                key = (e["method"], e["path"], json.dumps(e["params"]))
+                self._responses.setdefault(key, []).append((e["status"], e["body"]))
+        self._served = {}
+
+    def request(self, method, url, params=None, **kwargs):
+        key = (method.upper(), urlsplit(url).path, json.dumps(_params_key(params)))
+        with self._lock:
+            recorded = self._responses.get(key)
+            if not recorded:
+                return ReplayResponse(method, url, 404, '{"error":"not in capture"}')
+            i = self._served.get(key, 0)
+            self._served[key] = i + 1
+            status, body = recorded[min(i, len(recorded) - 1)]
+        return ReplayResponse(method, url, status, body)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+# ✅ Plays back one recorded DxLink connection's inbound frames. A frame is held until the
+# app has sent as many messages as it had when the frame was recorded (so data never arrives
+# before its subscription), then released after the recorded gap divided by `speed`
+# (0 = no waiting). Replay therefore assumes the same request sequence as the recording.
+class ReplayWebSocket:
+
+    def __init__(self, frames, speed=1.0):
+        self._frames = frames       # [(sends before it, seconds after that send, raw)]
+        self._speed = speed
+        self._i = 0
+        self._sent_at = [time.monotonic()]   # [connection opened, 1st send, 2nd send, ...]
+        self._cond = threading.Condition()
+        self._timeout = None
+
+    def settimeout(self, timeout):
+        self._timeout = timeout
+
+    def send(self, raw):
+        with self._cond:
+            self._sent_at.append(time.monotonic())
+            self._cond.notify_all()
+
+    def recv(self):
+        timeout = self._timeout or 1.0
+        if self._i >= len(self._frames):
+            # Recording is over: stay connected and idle
+            time.sleep(timeout)
+            raise WebSocketTimeoutException("replay finished")
+        sends, gap, raw = self._frames[self._i]
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while len(self._sent_at) <= sends:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise WebSocketTimeoutException("waiting for the app to subscribe")
+                self._cond.wait(remaining)
+            due = self._sent_at[sends] + (gap / self._speed if self._speed else 0)
+        wait = due - time.monotonic()
+        if wait > 0:
+            if wait > deadline - time.monotonic():
+                time.sleep(max(0.0, deadline - time.monotonic()))
+                raise WebSocketTimeoutException("no frame due yet")
+            time.sleep(wait)
+        self._i += 1
+        return raw
+
+    def close(self):
+        pass
+
+class ReplayConnector:
+
+    def __init__(self, entries, speed=1.0):
+        self.speed = speed
+        self._connections = []
+        last = {}     # conn -> [sends so far, time of the latest send (or of opening)]
+        for e in entries:
+            if e.get("kind") != "ws":
+                continue
+            conn = e["conn"]
+            if e["dir"] == "open":
+                last[conn] = [0, e["t"]]
+                self._connections.append([])
+            elif conn not in last:
+                continue
+            elif e["dir"] == "out":
+                last[conn] = [last[conn][0] + 1, e["t"]]
+            elif e["dir"] == "in":
+                sends, t_send = last[conn]
+                self._connections[conn].append((sends, e["t"] - t_send, e["raw"]))
+        self._next = 0
+        self._lock = threading.Lock()
+
+    # Same call shape as websocket.create_connection; reconnects get the following recording
+    def __call__(self, url, timeout=None, **kwargs):
+        with self._lock:
+            if not self._connections:
+                raise Exception("No DxLink connection in capture")
+            frames = self._connections[min(self._next, len(self._connections) - 1)]
+            self._next += 1
+        return ReplayWebSocket(frames, self.speed)
+
+# ✅ Wrap (record) or replace (replay) the app's HTTP session and websocket connector.
+# Returns (session, create_connection) to install in place of the originals.
+def install(mode, path, session, create_connection, speed=1.0):
+    if mode == "record":
+        capture = Capture(path)
+
+        def connect(url, *args, **kwargs):
+            return RecordingWebSocket(create_connection(url, *args, **kwargs), capture, url)
+
+        return RecordingSession(session, capture), connect
+    if mode == "replay":
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Capture file not found: {path}")
+        entries = load(path)
+        replay = ReplaySession(entries)
+        replay.headers.update(session.headers)
+        return replay, ReplayConnector(entries, speed)
+    raise ValueError(f"Unknown capture mode: {mode}")
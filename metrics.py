@@ -0,0 +1,122 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# In-process counters/histograms rendered in the Prometheus text format (no client library).
+# Each gunicorn worker keeps its own numbers; scrape every worker or run one per host.
+
+# Seconds; covers a cached lookup (~µs) up to a full DxLink timeout
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _label_str(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, values)) + "}"
+
+class Counter:
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for values, v in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_str(self.labels, values)} {v}")
+        return lines
+
+class Histogram:
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}    # label values -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for values, series in sorted(self._series.items()):
+                for bound, n in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_label_str(self.labels + ('le',), values + (bound,))} {n}")
+                lines.append(f"{self.name}_bucket{_label_str(self.labels + ('le',), values + ('+Inf',))} {series[-2]}")
+                lines.append(f"{self.name}_count{_label_str(self.labels, values)} {series[-2]}")
+                lines.append(f"{self.name}_sum{_label_str(self.labels, values)} {series[-1]}")
+        return lines
+
+class Registry:
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help_text, labels=()):
+        metric = Counter(name, help_text, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram("tt_stage_seconds", "Time spent per pipeline stage", ("stage",))
+UPSTREAM_RESPONSES = REGISTRY.counter("tt_upstream_http_responses_total",
+                                      "Upstream REST responses by endpoint and status", ("endpoint", "status"))
+DX_EVENTS = REGISTRY.counter("tt_dxlink_events_total", "DxLink events received by type", ("type",))
+
+@contextmanager
+def timed(stage):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - t0, stage)
+
+# ✅ Per-request stage timings: every stage also lands in STAGE_SECONDS
+class Timings:
+
+    def __init__(self):
+        self.stages = {}     # stage -> seconds (summed if a stage runs more than once)
+
+    def record(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        STAGE_SECONDS.observe(seconds, stage)
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - t0)
+
+    def as_ms(self):
+        return {k: round(v * 1000.0, 3) for k, v in self.stages.items()}
@@ -0,0 +1,101 @@
+import numpy as np
+
+# Black-Scholes greeks for a whole expiration at once (European, no dividends).
+# Everything takes/returns NumPy arrays; entries that can't be solved come back as NaN.
+
+SQRT_2PI = np.sqrt(2.0 * np.pi)
+IV_LOW = 1e-4
+IV_HIGH = 5.0
+IV_ITERATIONS = 60        # bisection halves the bracket each step: 5.0 / 2**60 is plenty
+
+# ✅ Standard normal CDF (Abramowitz & Stegun 7.1.26 erf, |error| < 1.5e-7)
+def norm_cdf(x):
+    x = np.asarray(x, dtype=float)
+    z = np.abs(x) / np.sqrt(2.0)
+    t = 1.0 / (1.0 + 0.3275911 * z)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1.0 - poly * np.exp(-z * z)
+    return 0.5 * (1.0 + np.sign(x) * erf)
+
+def norm_pdf(x):
+    x = np.asarray(x, dtype=float)
+    return np.exp(-0.5 * x * x) / SQRT_2PI
+
+def _d1_d2(spot, strikes, t, rate, sigma):
+    vol_t = sigma * np.sqrt(t)
+    d1 = (np.log(spot / strikes) + (rate + 0.5 * sigma * sigma) * t) / vol_t
+    return d1, d1 - vol_t
+
+# ✅ Option prices; is_call is a bool array (True = call, False = put)
+def bs_price(spot, strikes, t, rate, sigma, is_call):
+    strikes = np.asarray(strikes, dtype=float)
+    sigma = np.asarray(sigma, dtype=float)
+    d1, d2 = _d1_d2(spot, strikes, t, rate, sigma)
+    disc = np.exp(-rate * t)
+    call = spot * norm_cdf(d1) - strikes * disc * norm_cdf(d2)
+    put = strikes * disc * norm_cdf(-d2) - spot * norm_cdf(-d1)
+    return np.where(is_call, call, put)
+
+def bs_delta(spot, strikes, t, rate, sigma, is_call):
+    d1, _ = _d1_d2(spot, np.asarray(strikes, dtype=float), t, rate, np.asarray(sigma, dtype=float))
+    nd1 = norm_cdf(d1)
+    return np.where(is_call, nd1, nd1 - 1.0)
+
+def bs_vega(spot, strikes, t, rate, sigma):
+    d1, _ = _d1_d2(spot, np.asarray(strikes, dtype=float), t, rate, np.asarray(sigma, dtype=float))
+    return spot * norm_pdf(d1) * np.sqrt(t)
+
+# ✅ Implied vol for every option at once by vectorized bisection.
+# Prices outside the no-arbitrage range (below intrinsic, above the upper bound) give NaN.
+def implied_vol(prices, spot, strikes, t, rate, is_call):
+    prices = np.asarray(prices, dtype=float)
+    strikes = np.asarray(strikes, dtype=float)
+    is_call = np.asarray(is_call, dtype=bool)
+
+    lo = np.full(prices.shape, IV_LOW)
+    hi = np.full(prices.shape, IV_HIGH)
+    p_lo = bs_price(spot, strikes, t, rate, lo, is_call)
+    p_hi = bs_price(spot, strikes, t, rate, hi, is_call)
+    valid = np.isfinite(prices) & (prices > 0) & (prices >= p_lo) & (prices <= p_hi)
+
+    for _ in range(IV_ITERATIONS):
+        mid = 0.5 * (lo + hi)
+        too_high = bs_price(spot, strikes, t, rate, mid, is_call) > prices
+        hi = np.where(too_high, mid, hi)
+        lo = np.where(too_high, lo, mid)
+
+    return np.where(valid, 0.5 * (lo + hi), np.nan)
+
+# ✅ IV and delta for an expiration from quote mids: returns (iv, delta) arrays
+def expiration_greeks(spot, strikes, t, rate, mids, is_call):
+    iv = implied_vol(mids, spot, strikes, t, rate, is_call)
+    delta = bs_delta(spot, strikes, t, rate, np.where(np.isnan(iv), 1.0, iv), is_call)
+    return iv, np.where(np.isnan(iv), np.nan, delta)
+
+# ✅ Strike where |delta| hits target, by interpolating between the bracketing strikes.
+# strikes must be sorted ascending; deltas are the matching (signed) deltas, NaN allowed.
+# Returns (interpolated strike, index of the listed strike closest in |delta|), or
+# (None, None) if no strike has a usable delta.
+def strike_for_delta(strikes, deltas, target_delta):
+    strikes = np.asarray(strikes, dtype=float)
+    abs_d = np.abs(np.asarray(deltas, dtype=float))
+    ok = np.flatnonzero(np.isfinite(abs_d))
+    if ok.size == 0:
+        return None, None
+    k, d = strikes[ok], abs_d[ok]
+
+    # |delta| falls with strike for calls and rises for puts; search in increasing order
+    if d[0] > d[-1]:
+        k, d, ok = k[::-1], d[::-1], ok[::-1]
+    # Deltas from noisy quotes can wobble; searchsorted needs them non-decreasing
+    d = np.maximum.accumulate(d)
+
+    i = int(np.searchsorted(d, target_delta))
+    if i == 0 or i == d.size:
+        edge = 0 if i == 0 else d.size - 1
+        return float(k[edge]), int(ok[edge])
+    d0, d1 = d[i - 1], d[i]
+    w = 0.0 if d1 == d0 else (target_delta - d0) / (d1 - d0)
+    strike = float(k[i - 1] + w * (k[i] - k[i - 1]))
+    nearest = i - 1 if (target_delta - d0) <= (d1 - target_delta) else i
+    return strike, int(ok[nearest])
@@ -0,0 +1,44 @@
+import json
+import os
+
+# JSON encode/decode behind one interface: orjson, then ujson, then the stdlib.
+# TT_JSON_BACKEND=orjson|ujson|json forces a backend (falls back to json if it isn't installed).
+# loads() accepts str or bytes; dumps() always returns str. Every backend accepts the same
+# values: JSON types plus NumPy scalars/arrays (local greeks); anything else raises TypeError.
+
+# Shared `default` hook, so a payload doesn't serialize under one backend and fail under another
+def _default(obj):
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def _load_orjson():
+    import orjson
+
+    # orjson would encode datetimes/dataclasses itself; pass them to _default like the others
+    option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+    def dumps(obj):
+        return orjson.dumps(obj, default=_default, option=option).decode()
+
+    return "orjson", orjson.loads, dumps
+
+def _load_ujson():
+    import ujson
+    return "ujson", ujson.loads, lambda obj: ujson.dumps(obj, ensure_ascii=False, default=_default)
+
+def _load_stdlib():
+    return "json", json.loads, lambda obj: json.dumps(obj, separators=(",", ":"), default=_default)
+
+_BACKENDS = {"orjson": _load_orjson, "ujson": _load_ujson, "json": _load_stdlib}
+
+def load_backend(name=None):
+    order = [name] if name in _BACKENDS else ["orjson", "ujson"]
+    for candidate in order:
+        try:
+            return _BACKENDS[candidate]()
+        except ImportError:
+            continue
+    return _load_stdlib()
+
+BACKEND, loads, dumps = load_backend(os.getenv("TT_JSON_BACKEND"))
@@ -0,0 +1,276 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from metrics import REGISTRY, STAGE_SECONDS
+
+# Append-only, columnar history of every option snapshot a scan collects (DeltaScan.finish).
+#
+#   {TT_SNAPSHOT_DIR}/{YYYY-MM-DD (UTC)}/{UNDERLYING}/{segment}.{column}
+#
+# Each column is a raw little-endian array (dtypes in COLUMNS), so a reader maps it with
+# np.memmap and only touches the pages it needs. A segment belongs to one writer (process
+# + start time), so gunicorn workers never append to the same file. Rows are appended in
+# batches by a background thread; the request path only enqueues the copied records. A row
+# is stored only when its quote, greeks or delta changed since that option's previous row.
+# Within a segment "ts" never decreases, so time ranges are a binary search. A flush cut
+# short (crash, or a write error after which the writer moves on to a new segment) leaves
+# some columns longer than others: readers use the shortest.
+SNAPSHOT_DIR = os.getenv("TT_SNAPSHOT_DIR")
+BATCH_ROWS = int(os.getenv("TT_SNAPSHOT_BATCH_ROWS", "20000"))
+FLUSH_SEC = float(os.getenv("TT_SNAPSHOT_FLUSH_SEC", "5"))
+QUEUE_MAX = int(os.getenv("TT_SNAPSHOT_QUEUE_MAX", "5000"))
+QUERY_MAX_ROWS = int(os.getenv("TT_SNAPSHOT_QUERY_MAX_ROWS", "100000"))
+
+COLUMNS = {
+    "ts": "<f8",            # epoch seconds the snapshot was taken
+    "expiration": "<i4",    # yyyymmdd
+    "strike": "<f8",
+    "side": "S1",           # b"P" | b"C"
+    "bid": "<f8",           # NaN where unknown, as for every float column
+    "ask": "<f8",
+    "delta": "<f8",
+    "gamma": "<f8",
+    "theta": "<f8",
+    "vega": "<f8",
+    "iv": "<f8",
+    "spot": "<f8",          # underlying price used by the scan
+    "local": "u1",          # 1 = delta/iv from pricing.py, not DxLink
+}
+_FLOAT_FIELDS = ("bid", "ask", "delta", "gamma", "theta", "vega", "iv")
+
+SNAPSHOT_ROWS = REGISTRY.counter("tt_snapshot_rows_total", "Option rows appended to the snapshot store")
+SNAPSHOT_DROPPED = REGISTRY.counter("tt_snapshot_dropped_total",
+                                    "Snapshots not stored, by reason", ("reason",))
+
+def _float(v):
+    return float(v) if v is not None else np.nan
+
+def _partition_date(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%d")
+
+# ✅ Background batching writer + memory-mapped range reads over the files it produces
+class SnapshotStore:
+
+    def __init__(self, root, batch_rows=BATCH_ROWS, flush_sec=FLUSH_SEC, queue_max=QUEUE_MAX):
+        self.root = root
+        self.batch_rows = batch_rows
+        self.flush_sec = flush_sec
+        self.queue_max = queue_max
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self._segment = None
+        self._segment_seq = 0    # segments started by this writer, for unique names
+        self._last = {}          # option symbol -> (quote_ts, greeks_ts, delta) of its latest row
+        self._last_ts = {}       # partition -> latest ts written by this segment
+        self.rows_written = 0
+        self.flushes = 0
+        self.last_error = None
+
+    # Threads and queues don't survive fork: each worker starts its own writer and segment
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(self.queue_max)
+            self._new_segment()
+            self._thread = threading.Thread(target=self._run, args=(self._queue,), daemon=True,
+                                            name="snapshot-writer")
+            self._thread.start()
+            self._pid = os.getpid()
+            atexit.register(self.close)
+
+    # Columns are appended one file at a time, so after a failed write the current segment's
+    # columns may no longer line up: later rows go to a fresh one
+    def _new_segment(self):
+        self._segment_seq += 1
+        self._segment = f"{os.getpid()}-{int(time.time() * 1000)}-{self._segment_seq}"
+        self._last, self._last_ts = {}, {}
+
+    # Called on the request path: never blocks, drops the snapshot if the writer is behind
+    def append(self, underlying, expiration, spot, symbols, records, sym_to_strike, put_syms):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((time.time(), underlying, expiration, spot, symbols, records,
+                                    sym_to_strike, put_syms))
+        except queue.Full:
+            SNAPSHOT_DROPPED.inc("queue_full")
+
+    # Write out whatever is queued and stop the writer (atexit)
+    def close(self, timeout=5.0):
+        if self._pid != os.getpid():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def _run(self, q):
+        while True:
+            item = q.get()
+            if item is None:
+                return
+            batch, rows = [item], len(item[4])
+            deadline = time.monotonic() + self.flush_sec
+            stop = False
+            while rows < self.batch_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = q.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+                rows += len(item[4])
+            t0 = time.perf_counter()
+            try:
+                self._write(batch)
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                SNAPSHOT_DROPPED.inc("write_error", amount=len(batch))
+                self._new_segment()
+            STAGE_SECONDS.observe(time.perf_counter() - t0, "snapshot_write")
+            if stop:
+                return
+
+    # Changed rows of a batch, grouped by partition
+    def _rows(self, batch):
+        partitions = {}
+        for ts, underlying, expiration, spot, symbols, records, sym_to_strike, put_syms in batch:
+            key = (_partition_date(ts), underlying.upper())
+            out = partitions.setdefault(key, [])
+            exp = int(expiration.replace("-", ""))
+            puts = set(put_syms)
+            for s in symbols:
+                rec = records.get(s)
+                if rec is None:
+                    continue
+                stamp = (rec.quote_ts, rec.greeks_ts, rec.delta)
+                if self._last.get(s) == stamp:
+                    continue
+                self._last[s] = stamp
+                out.append((ts, exp, float(sym_to_strike[s]), b"P" if s in puts else b"C",
+                            *(_float(getattr(rec, f)) for f in _FLOAT_FIELDS),
+                            _float(spot), 1 if rec.local_greeks else 0))
+        if len(self._last) > 500_000:
+            self._last = {}
+        return partitions
+
+    def _write(self, batch):
+        written = 0
+        for (day, underlying), rows in self._rows(batch).items():
+            if not rows:
+                continue
+            rows.sort(key=lambda r: r[0])
+            directory = os.path.join(self.root, day, underlying)
+            os.makedirs(directory, exist_ok=True)
+            # Keep ts monotonic within the segment (a snapshot queued a moment late would
+            # otherwise land after a newer one)
+            floor = self._last_ts.get((day, underlying), 0.0)
+            columns = list(zip(*rows))
+            ts = np.maximum(np.asarray(columns[0], dtype=COLUMNS["ts"]), floor)
+            self._last_ts[(day, underlying)] = float(ts[-1])
+            arrays = [ts] + [np.asarray(values, dtype=dtype)
+                             for values, dtype in zip(columns[1:], list(COLUMNS.values())[1:])]
+            for name, values in zip(COLUMNS, arrays):
+                with open(os.path.join(directory, f"{self._segment}.{name}"), "ab") as f:
+                    f.write(values.tobytes())
+            written += len(rows)
+        self.rows_written += written
+        self.flushes += 1
+        SNAPSHOT_ROWS.inc(amount=written)
+
+    # ---- reads ----
+    def _segments(self, directory):
+        segments = set()
+        for name in os.listdir(directory):
+            segment, _, column = name.rpartition(".")
+            if column == "ts":
+                segments.add(segment)
+        return sorted(segments)
+
+    def _open_segment(self, directory, segment, names):
+        lengths = []
+        for name in names:
+            path = os.path.join(directory, f"{segment}.{name}")
+            if not os.path.exists(path):
+                return None
+            lengths.append(os.path.getsize(path) // np.dtype(COLUMNS[name]).itemsize)
+        n = min(lengths)
+        if n == 0:
+            return None
+        return {name: np.memmap(os.path.join(directory, f"{segment}.{name}"), dtype=COLUMNS[name],
+                                mode="r", shape=(n,))
+                for name in names}
+
+    # ✅ Rows of one underlying with start <= ts < end (epoch seconds), oldest first.
+    # Only the partitions in range are opened and only the requested columns (plus "ts"
+    # and the filtered ones) are mapped; returns ({column: ndarray}, truncated).
+    def query(self, underlying, start, end, columns=None, expiration=None, side=None,
+              strike_min=None, strike_max=None, limit=QUERY_MAX_ROWS):
+        columns = list(dict.fromkeys(["ts"] + list(columns or COLUMNS)))
+        filters = set()
+        if expiration is not None:
+            filters.add("expiration")
+        if side is not None:
+            filters.add("side")
+        if strike_min is not None or strike_max is not None:
+            filters.add("strike")
+        names = list(dict.fromkeys(columns + sorted(filters)))
+
+        parts = {name: [] for name in columns}
+        day = datetime.fromtimestamp(start, timezone.utc).date()
+        last_day = datetime.fromtimestamp(end, timezone.utc).date()
+        while day <= last_day:
+            directory = os.path.join(self.root, day.isoformat(), underlying.upper())
+            day += timedelta(days=1)
+            if not os.path.isdir(directory):
+                continue
+            for segment in self._segments(directory):
+                maps = self._open_segment(directory, segment, names)
+                if maps is None:
+                    continue
+                ts = maps["ts"]
+                lo, hi = np.searchsorted(ts, start, "left"), np.searchsorted(ts, end, "left")
+                if lo >= hi:
+                    continue
+                mask = np.ones(hi - lo, dtype=bool)
+                if expiration is not None:
+                    mask &= maps["expiration"][lo:hi] == expiration
+                if side is not None:
+                    mask &= maps["side"][lo:hi] == side
+                if strike_min is not None:
+                    mask &= maps["strike"][lo:hi] >= strike_min
+                if strike_max is not None:
+                    mask &= maps["strike"][lo:hi] <= strike_max
+                idx = np.flatnonzero(mask) + lo
+                for name in columns:
+                    parts[name].append(np.asarray(maps[name][idx]))
+
+        out = {name: (np.concatenate(parts[name]) if parts[name] else np.empty(0, dtype=COLUMNS[name]))
+               for name in columns}
+        # Segments of different workers overlap in time
+        n = len(out["ts"])
+        if len(parts["ts"]) > 1:
+            order = np.argsort(out["ts"], kind="stable")
+            out = {name: values[order] for name, values in out.items()}
+        return {name: values[:limit] for name, values in out.items()}, n > limit
+
+    def status(self):
+        return {"root": self.root, "segment": self._segment, "rows_written": self.rows_written,
+                "flushes": self.flushes, "queued": self._queue.qsize() if self._queue else 0,
+                "last_error": self.last_error}
@@ -0,0 +1,18 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "bench")]
+
+# app.py reads its upstream from the environment at import time: point it at bench/'s fake
+# REST + DxLink servers before any test module imports app
+def pytest_configure(config):
+    from fake_upstream import FakeTastytrade
+    fake = FakeTastytrade(first_event_ms=300).start()
+    os.environ.update(TT_BASE_URL=fake.rest_url, TT_REFRESH_TOKEN="x", TT_CLIENT_SECRET="x")
+    config.fake_upstream = fake
+
+def pytest_unconfigure(config):
+    fake = getattr(config, "fake_upstream", None)
+    if fake is not None:
+        fake.stop()
@@ -0,0 +1,18 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def import_app(**env):
+    env = {k: v for k, v in os.environ.items() if not k.startswith("TT_CAPTURE")} | env
+    return subprocess.run([sys.executable, "-c", "import app"], cwd=ROOT, env=env, capture_output=True, text=True)
+
+def test_replay_without_a_path_says_which_variable_to_set():
+    proc = import_app(TT_CAPTURE_MODE="replay")
+    assert proc.returncode != 0
+    assert "TT_CAPTURE_MODE=replay needs TT_CAPTURE_PATH" in proc.stderr
+
+def test_replay_path_is_used_as_given(tmp_path):
+    proc = import_app(TT_CAPTURE_MODE="replay", TT_CAPTURE_PATH=str(tmp_path / "upstream-{pid}.ndjson.gz"))
+    assert f"Capture file not found: {tmp_path}/upstream-{{pid}}.ndjson.gz" in proc.stderr
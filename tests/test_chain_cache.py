@@ -0,0 +1,66 @@
+import time
+from datetime import datetime, timedelta
+
+import app
+from app import ChainCache, SQLiteStore
+
+def chain_doc(*expirations):
+    return {"items": [{"underlying-symbol": "SPY", "expirations": [
+        {"expiration-date": exp, "strikes": [
+            {"strike-price": str(k), "put-streamer-symbol": f".SPY{exp}P{k}", "call-streamer-symbol": f".SPY{exp}C{k}"}
+            for k in (400, 410)]} for exp in expirations]}]}
+
+def test_parsed_chain_is_built_once_per_entry_and_evicted_with_it():
+    cache = ChainCache(max_entries=1, ttl_sec=60)
+    doc = chain_doc("2026-11-06")
+    cache.put("SPY", None, doc)
+    parsed = cache.parsed("SPY", None, cache.get("SPY"))
+    assert parsed is cache.parsed("SPY", None, cache.get("SPY"))
+    assert parsed.get("2026-11-06").puts == [".SPY2026-11-06P400", ".SPY2026-11-06P410"]
+    cache.put("QQQ", None, chain_doc("2026-11-06"))   # LRU evicts SPY, parsed view included
+    assert cache.get("SPY") is None
+    assert all(entry[1] is not doc for entry in cache._entries.values())
+
+def test_refreshed_document_is_parsed_again():
+    cache = ChainCache(max_entries=4, ttl_sec=60)
+    cache.put("SPY", None, chain_doc("2026-11-06"))
+    first = cache.parsed("SPY", None, cache.get("SPY"))
+    cache.put("SPY", None, chain_doc("2026-11-06", "2026-11-13"))
+    second = cache.parsed("SPY", None, cache.get("SPY"))
+    assert second is not first and list(second.expirations) == ["2026-11-06", "2026-11-13"]
+
+def test_uncached_document_is_not_kept():
+    cache = ChainCache(max_entries=4, ttl_sec=60)
+    parsed = cache.parsed("SPY", None, {"items": []})
+    assert not parsed.expirations and not cache._entries
+    assert not hasattr(app, "_PARSED_CHAINS")
+
+def test_entries_expire_after_ttl():
+    cache = ChainCache(max_entries=4, ttl_sec=0.05)
+    cache.put("SPY", None, chain_doc("2026-11-06"))
+    assert cache.get("spy") is not None
+    time.sleep(0.06)
+    assert cache.get("SPY") is None and not cache._entries
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_entries_roll_over_at_midnight():
+    cache = ChainCache(max_entries=4, ttl_sec=3600)
+    late = datetime(2026, 11, 5, 23, 30)
+    assert cache._expires_at(None, late) == datetime(2026, 11, 6).timestamp()
+    early = datetime(2026, 11, 5, 9, 0)
+    assert cache._expires_at(None, early) == (early + timedelta(hours=1)).timestamp()
+
+def test_filtered_document_expires_with_its_expiration():
+    cache = ChainCache(max_entries=4, ttl_sec=86400 * 7)
+    assert cache._expires_at("2026-11-05", datetime(2026, 11, 5, 9, 0)) == datetime(2026, 11, 6).timestamp()
+    yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+    cache.put("SPY", yesterday, chain_doc(yesterday))
+    assert cache.get("SPY", yesterday) is None
+
+def test_second_level_store_is_shared(tmp_path):
+    store = SQLiteStore(str(tmp_path / "chains.db"))
+    writer, reader = ChainCache(4, 60, store), ChainCache(4, 60, store)
+    writer.put("SPY", None, chain_doc("2026-11-06"))
+    assert reader.get("SPY") == chain_doc("2026-11-06") and reader.store_hits == 1
+    writer.invalidate("SPY")
+    assert ChainCache(4, 60, store).get("SPY") is None
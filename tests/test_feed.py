@@ -0,0 +1,20 @@
+from app import _compact_layouts, _iter_feed_events
+
+def test_compact_decode_rows_and_placeholders():
+    data = ["Quote", ["Quote", "SPY", 1.0, 1.1, 10, 12, "Quote", ".SPY261106P400", 2.0, "NaN", 1, 2],
+            "Greeks", ["Greeks", ".SPY261106P400", 0.2, -0.3, 0.01, -0.02, 0.01, 0.1]]
+    assert list(_iter_feed_events(data)) == [
+        ("Quote", "SPY", (1.0, 1.1, 10, 12)),
+        ("Quote", ".SPY261106P400", (2.0, None, 1, 2)),
+        ("Greeks", ".SPY261106P400", (0.2, -0.3, 0.01, -0.02, 0.01, 0.1)),
+    ]
+
+def test_compact_decode_follows_server_field_order():
+    # FEED_CONFIG may confirm fields in another order (and with extras)
+    layouts = _compact_layouts({"Quote": ["eventSymbol", "eventType", "askPrice", "bidPrice", "sequence"]})
+    data = ["Quote", ["SPY", "Quote", 1.1, 1.0, 7]]
+    assert list(_iter_feed_events(data, layouts)) == [("Quote", "SPY", (1.0, 1.1, None, None))]
+
+def test_full_format_events():
+    data = {"eventType": "Greeks", "eventSymbol": ".SPY261106P400", "delta": -0.3, "volatility": "NaN"}
+    assert list(_iter_feed_events(data)) == [("Greeks", ".SPY261106P400", (None, -0.3, None, None, None, None))]
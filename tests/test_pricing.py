@@ -0,0 +1,43 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from app import _years_to_expiration
+from pricing import bs_delta, bs_price, implied_vol, strike_for_delta
+
+# Reference values: S=100, K=100, T=1, r=5%, sigma=20%
+def test_bs_price_call_and_put():
+    call, put = bs_price(100.0, [100.0, 100.0], 1.0, 0.05, 0.2, np.array([True, False]))
+    assert call == pytest.approx(10.4506, abs=1e-4)
+    assert put == pytest.approx(5.5735, abs=1e-4)
+
+def test_bs_delta_call_and_put():
+    assert bs_delta(100.0, 100.0, 1.0, 0.05, 0.2, True) == pytest.approx(0.6368, abs=1e-4)
+    assert bs_delta(100.0, 100.0, 1.0, 0.05, 0.2, False) == pytest.approx(0.6368 - 1.0, abs=1e-4)
+
+def test_implied_vol_round_trip():
+    strikes = np.array([90.0, 100.0, 110.0])
+    sigmas = np.array([0.25, 0.30, 0.35])
+    is_call = np.array([False, True, True])
+    prices = bs_price(100.0, strikes, 0.5, 0.03, sigmas, is_call)
+    assert implied_vol(prices, 100.0, strikes, 0.5, 0.03, is_call) == pytest.approx(sigmas, abs=1e-9)
+
+def test_implied_vol_below_intrinsic_is_nan():
+    assert np.isnan(implied_vol([5.0], 100.0, [90.0], 0.5, 0.03, [True])[0])
+
+def test_strike_for_delta_interpolates_puts_and_calls():
+    assert strike_for_delta([90, 100, 110], [-0.2, -0.4, -0.6], 0.35) == (97.5, 1)
+    assert strike_for_delta([90, 100, 110], [0.6, 0.4, 0.2], 0.35) == (102.5, 1)
+    # Outside the listed deltas: the edge strike; nothing usable: (None, None)
+    assert strike_for_delta([90, 100, 110], [-0.2, -0.4, -0.6], 0.9) == (110.0, 2)
+    assert strike_for_delta([90, 100], [np.nan, np.nan], 0.3) == (None, None)
+
+# Expiry is the 4pm New York close whatever the host's zone (16:00 EST = 21:00 UTC in November)
+@pytest.mark.parametrize("now, hours", [
+    (datetime(2026, 11, 6, 15, 0, tzinfo=timezone.utc), 6.0),
+    (datetime(2026, 11, 5, 21, 0, tzinfo=timezone.utc), 24.0),
+    (datetime(2026, 11, 6, 20, 30, tzinfo=timezone.utc), 1.0),   # floor of an hour
+])
+def test_years_to_expiration_counts_to_the_new_york_close(now, hours):
+    assert _years_to_expiration("2026-11-06", now) * 365 * 24 == pytest.approx(hours)
@@ -0,0 +1,57 @@
+import pytest
+from starlette.testclient import TestClient
+
+import app
+import asgi
+from app import MAX_TIMEOUT_SEC, scan_options, timeout_option
+
+SCAN_BODIES = [
+    {"target_dte": "abc"},
+    {"target_delta": "0.3x"},
+    {"strike_window": [5]},
+    {"max_staleness": {}},
+    {"rate": "NaN"},
+]
+TIMEOUT_BODIES = [{"timeout": MAX_TIMEOUT_SEC + 1}, {"timeout": -1}, {"timeout": "soon"}]
+
+def test_scan_options_defaults_and_casts():
+    assert scan_options({"target_dte": "45", "rate": 0.05, "strike_window": 10.0}) == {
+        "target_dte": 45, "target_delta": 0.30, "max_age": None, "wait_mode": None,
+        "strike_window": 10, "greeks_source": None, "rate": 0.05,
+    }
+    assert timeout_option({}) == 5.0
+    assert timeout_option({"timeout": MAX_TIMEOUT_SEC}) == MAX_TIMEOUT_SEC
+
+@pytest.mark.parametrize("body", SCAN_BODIES)
+def test_scan_options_rejects(body):
+    with pytest.raises(ValueError, match=next(iter(body))):
+        scan_options(body)
+
+@pytest.mark.parametrize("body", TIMEOUT_BODIES)
+def test_timeout_option_rejects(body):
+    with pytest.raises(ValueError, match="timeout"):
+        timeout_option(body)
+
+@pytest.mark.parametrize("path, body", [(path, body) for path in ("/fetch", "/fetch/batch", "/screen")
+                                        for body in SCAN_BODIES] +
+                                       [(path, body) for path in ("/query", "/fetch/batch", "/screen")
+                                        for body in TIMEOUT_BODIES])
+def test_app_answers_malformed_fields_with_400(path, body):
+    r = app.app.test_client().post(path, json={"symbol": "SPY", "symbols": ["SPY"], **body})
+    assert r.status_code == 400
+    assert next(iter(body)) in r.get_json()["error"]
+
+@pytest.mark.parametrize("body", [{"dte": ["x"]}, {"deltas": [0.3, "y"]}, {"dte_range": [7, "z"]},
+                                  {"strike_window": "wide"}])
+def test_query_answers_malformed_fields_with_400(body):
+    r = app.app.test_client().post("/query", json={"symbol": "SPY", **body})
+    assert r.status_code == 400
+    assert next(iter(body)) in r.get_json()["error"]
+
+@pytest.mark.parametrize("path, body", [(path, {"target_dte": "abc"})
+                                        for path in ("/fetch", "/fetch/batch", "/screen")] +
+                                       [(path, TIMEOUT_BODIES[0]) for path in ("/fetch/batch", "/screen")])
+def test_asgi_answers_malformed_fields_with_400(path, body):
+    r = TestClient(asgi.app).post(path, json={"symbol": "SPY", "symbols": ["SPY"], **body})
+    assert r.status_code == 400
+    assert next(iter(body)) in r.json()["error"]
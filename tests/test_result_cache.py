@@ -0,0 +1,105 @@
+import threading
+import time
+
+import pytest
+
+import app
+from app import ResultCache
+
+KEY = ("fetch", "SPY", 21, 0.3)
+
+class SlowScan:
+
+    def __init__(self, result=None, error=None, delay=0.1):
+        self.calls = 0
+        self.result, self.error, self.delay = result, error, delay
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+def run_concurrently(cache, compute, n=6):
+    out = []
+
+    def one():
+        try:
+            out.append(cache.run(KEY, compute))
+        except Exception as e:
+            out.append(e)
+
+    threads = [threading.Thread(target=one) for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return out
+
+def test_identical_concurrent_requests_share_one_run():
+    cache = ResultCache({"fetch": 0.0}, 16)
+    scan = SlowScan({"put": 1})
+    out = run_concurrently(cache, scan)
+    assert scan.calls == 1
+    assert sorted(outcome for _, outcome in out) == ["coalesced"] * 5 + ["miss"]
+    assert all(result is out[0][0] for result, _ in out)
+    # TTL 0: nothing is served from cache afterwards
+    assert cache.run(KEY, scan)[1] == "miss" and scan.calls == 2
+
+def test_followers_get_the_leaders_error():
+    cache = ResultCache({"fetch": 1.0}, 16)
+    scan = SlowScan(error=RuntimeError("upstream down"))
+    out = run_concurrently(cache, scan)
+    assert scan.calls == 1
+    assert all(isinstance(e, RuntimeError) for e in out)
+    assert cache.lookup(KEY) is None and cache.stats()["inflight"] == 0
+
+def test_results_are_cached_for_the_endpoint_ttl_capped_by_max_age():
+    cache = ResultCache({"fetch": 60.0}, 16)
+    scan = SlowScan({"put": 1}, delay=0)
+    assert cache.run(KEY, scan)[1] == "miss"
+    assert cache.run(KEY, scan)[1] == "hit" and scan.calls == 1
+    short = ("fetch", "QQQ")
+    cache.run(short, scan, max_age=0.05)
+    time.sleep(0.06)
+    assert cache.run(short, scan)[1] == "miss"
+
+def test_lru_bound():
+    cache = ResultCache({"fetch": 60.0}, 2)
+    for symbol in ("A", "B", "C"):
+        cache.store(("fetch", symbol), {"symbol": symbol})
+    assert cache.lookup(("fetch", "A")) is None
+    assert cache.lookup(("fetch", "C")) == {"symbol": "C"}
+
+# ---- stale-while-revalidate (run_with_stale) ----
+@pytest.fixture
+def swr_cache(monkeypatch):
+    cache = ResultCache({"fetch": 0.0}, 16)
+    monkeypatch.setattr(app, "RESULT_CACHE", cache)
+    cache.run(KEY, SlowScan({"put": 1}, delay=0))   # one good run to fall back on
+    return cache
+
+def test_upstream_error_serves_the_last_good_result(swr_cache):
+    result, outcome = app.run_with_stale(KEY, SlowScan(error=RuntimeError("HTTP 503")), mode="error")
+    assert outcome == "stale"
+    assert result["put"] == 1 and result["stale"]["reason"] == "HTTP 503"
+
+def test_stale_off_raises(swr_cache):
+    with pytest.raises(RuntimeError):
+        app.run_with_stale(KEY, SlowScan(error=RuntimeError("HTTP 503")), mode="off")
+
+def test_always_answers_stale_and_revalidates_in_background(swr_cache):
+    scan = SlowScan({"put": 2}, delay=0.05)
+    result, outcome = app.run_with_stale(KEY, scan, mode="always")
+    assert outcome == "stale" and result["put"] == 1
+    deadline = time.time() + 2
+    while swr_cache.last_good(KEY, 60)[0]["put"] != 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert scan.calls == 1 and swr_cache.last_good(KEY, 60)[0] == {"put": 2}
+
+def test_last_good_older_than_max_age_is_not_served(swr_cache, monkeypatch):
+    monkeypatch.setattr(app, "SWR_MAX_AGE_SEC", 0.0)
+    time.sleep(0.01)
+    with pytest.raises(RuntimeError):
+        app.run_with_stale(KEY, SlowScan(error=RuntimeError("HTTP 503")), mode="error")
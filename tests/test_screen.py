@@ -0,0 +1,28 @@
+import pytest
+
+from app import SCREEN_MAX_K, TopK, screen_options
+
+def test_topk_keeps_best_k_in_order():
+    top = TopK(3, "annualized_return")
+    for i, value in enumerate([0.1, 0.5, 0.3, 0.9, 0.2, None]):
+        top.push({"symbol": f"S{i}", "annualized_return": value})
+    assert [r["symbol"] for r in top.rows()] == ["S3", "S1", "S2"]
+
+def test_topk_lower_is_better_and_ties_keep_arrival_order():
+    top = TopK(2, "spread_pct")
+    for symbol, value in [("A", 0.05), ("B", 0.01), ("C", 0.01), ("D", 0.02)]:
+        top.push({"symbol": symbol, "spread_pct": value})
+    assert [r["symbol"] for r in top.rows()] == ["B", "C"]
+
+def test_screen_options_defaults_and_dedup():
+    assert screen_options({"symbols": ["spy", "SPY", "qqq"]}) == (["SPY", "QQQ"], "annualized_return", "put", 20)
+
+@pytest.mark.parametrize("body", [
+    {"symbols": ["SPY"], "k": 0},
+    {"symbols": ["SPY"], "k": SCREEN_MAX_K + 1},
+    {"symbols": ["SPY"], "sort": "volume"},
+    {"symbols": ["SPY"], "side": "straddle"},
+])
+def test_screen_options_rejects(body):
+    with pytest.raises(ValueError):
+        screen_options(body)
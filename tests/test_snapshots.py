@@ -0,0 +1,67 @@
+import builtins
+import errno
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import snapshots
+from snapshots import SnapshotStore
+
+SYMS = [".SPY261106P400", ".SPY261106C410"]
+STRIKES = {".SPY261106P400": 400.0, ".SPY261106C410": 410.0}
+
+def record(stamp, delta, bid=1.0):
+    return SimpleNamespace(quote_ts=stamp, greeks_ts=stamp, delta=delta, bid=bid, ask=bid + 0.1,
+                           gamma=0.01, theta=-0.02, vega=0.1, iv=0.25, local_greeks=False)
+
+def records(stamp, bid=1.0):
+    return {SYMS[0]: record(stamp, -0.3, bid), SYMS[1]: record(stamp, None, bid)}
+
+@pytest.fixture
+def store(tmp_path):
+    return SnapshotStore(str(tmp_path), batch_rows=1, flush_sec=0.01)
+
+def test_write_then_query_round_trip(store):
+    start = time.time()
+    store.append("spy", "2026-11-06", 405.0, SYMS, records(1.0), STRIKES, [SYMS[0]])
+    store.append("spy", "2026-11-06", 405.0, SYMS, records(1.0), STRIKES, [SYMS[0]])   # unchanged
+    store.close()
+    columns, truncated = store.query("SPY", start - 1, time.time() + 1)
+    assert not truncated
+    assert list(columns["strike"]) == [400.0, 410.0]
+    assert list(columns["side"]) == [b"P", b"C"]
+    assert list(columns["expiration"]) == [20261106, 20261106]
+    assert columns["delta"][0] == -0.3 and np.isnan(columns["delta"][1])
+    only_puts, _ = store.query("SPY", start - 1, time.time() + 1, columns=["strike"], side=b"P")
+    assert set(only_puts) == {"ts", "strike"} and list(only_puts["strike"]) == [400.0]
+
+def test_failed_write_leaves_later_rows_aligned(store, monkeypatch):
+    failing = {"armed": True}
+    real_open = builtins.open
+
+    def flaky_open(path, mode="r", *args, **kwargs):
+        # Disk fills up halfway through the column files of the first flush
+        if failing["armed"] and path.endswith(".delta"):
+            failing["armed"] = False
+            raise OSError(errno.ENOSPC, "No space left on device")
+        return real_open(path, mode, *args, **kwargs)
+
+    monkeypatch.setattr(snapshots, "open", flaky_open, raising=False)
+    start = time.time()
+    store.append("spy", "2026-11-06", 405.0, SYMS, records(1.0), STRIKES, [SYMS[0]])
+    deadline = time.time() + 5
+    while store.last_error is None and time.time() < deadline:
+        time.sleep(0.01)
+    assert "No space left" in store.last_error
+    store.append("spy", "2026-11-06", 406.0, SYMS, records(2.0, bid=2.0), STRIKES, [SYMS[0]])
+    store.close()
+
+    columns, _ = store.query("SPY", start - 1, time.time() + 1)
+    # The failed flush's partial columns are cut to their common (empty) length; the next
+    # flush went to a new segment with every column in step
+    assert list(columns["strike"]) == [400.0, 410.0]
+    assert list(columns["bid"]) == [2.0, 2.0]
+    assert list(columns["spot"]) == [406.0, 406.0]
+    assert columns["delta"][0] == -0.3
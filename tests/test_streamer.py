@@ -0,0 +1,64 @@
+import threading
+
+import pytest
+
+import app
+
+@pytest.fixture
+def streamer(monkeypatch):
+    # Subscription bookkeeping only: no connection
+    streamer = app.DxLinkStreamer()
+    monkeypatch.setattr(streamer, "start", lambda: None)
+    return streamer
+
+def test_leases_of_one_symbol_keep_each_others_symbols(streamer):
+    near, far = streamer.lease("SPY"), streamer.lease("SPY")
+    assert near != far
+    streamer.set_group(near, [".SPY261106P400", ".SPY261106C410", "SPY"])
+    streamer.set_group(far, [".SPY261204P390", "SPY"])
+    streamer.book.apply_quote(".SPY261106P400", (1.0, 1.1, 1, 1), 0.0)
+    # Widening/narrowing one lease leaves the other's window (and its book records) alone
+    streamer.set_group(far, [".SPY261204P380", "SPY"])
+    assert {".SPY261106P400", ".SPY261106C410", "SPY"} <= set(streamer._members)
+    assert ".SPY261204P390" not in streamer._members
+    assert streamer.book.get(".SPY261106P400") is not None
+
+def test_release_keeps_symbols_warm_until_the_shared_group_is_dropped(streamer):
+    lease = streamer.lease("SPY")
+    streamer.set_group(lease, [".SPY261106P400", "SPY"])
+    streamer.release(lease, {"SPY|2026-11-06": [".SPY261106P400", "SPY"]})
+    assert lease not in streamer._groups
+    assert set(streamer._members) == {".SPY261106P400", "SPY"}
+    # Released into, never narrowed by, later scans
+    other = streamer.lease("SPY")
+    streamer.set_group(other, [".SPY261106P410", "SPY"])
+    streamer.release(other, {"SPY|2026-11-06": [".SPY261106P410", "SPY"]})
+    assert streamer._groups["SPY|2026-11-06"] == {".SPY261106P400", ".SPY261106P410", "SPY"}
+    streamer.drop_group("SPY|2026-11-06")
+    assert not streamer._members
+
+def test_release_without_keep_unsubscribes_only_its_own_symbols(streamer):
+    failed, ok = streamer.lease("SPY"), streamer.lease("SPY")
+    streamer.set_group(ok, [".SPY261106P400", "SPY"])
+    streamer.set_group(failed, ["SPY"])
+    streamer.release(failed)
+    assert set(streamer._members) == {".SPY261106P400", "SPY"}
+
+# Regression: two /fetch calls for one underlying used to share (and replace) one group,
+# so the slower scan lost its strikes to the other and came back without greeks
+def test_concurrent_fetches_of_one_symbol_both_select():
+    client = app.app.test_client()
+    assert "error" not in client.post("/fetch", json={"symbol": "SPY", "target_dte": 7}).get_json()
+    results = {}
+
+    def fetch(dte):
+        results[dte] = client.post("/fetch", json={"symbol": "SPY", "target_dte": dte, "stale": "off"}).get_json()
+
+    threads = [threading.Thread(target=fetch, args=(dte,)) for dte in (21, 45)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert "error" not in results[21] and "error" not in results[45]
+    assert results[21]["expiration"] != results[45]["expiration"]
+    assert results[21]["put"] and results[45]["put"]
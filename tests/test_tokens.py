@@ -0,0 +1,91 @@
+import threading
+import time
+
+import pytest
+import requests
+
+import app
+from app import TokenManager
+from upstream import CircuitBreaker
+
+class CountingTokens(TokenManager):
+    # /oauth/token stand-in: slow enough that concurrent callers overlap
+    def __init__(self, *args, expires_in=3600, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.refreshes = 0
+        self.expires_in = expires_in
+
+    def _post_refresh(self):
+        self.refreshes += 1
+        time.sleep(0.05)
+        return self.set_tokens({"access_token": f"access-{self.refreshes}", "expires_in": self.expires_in})
+
+def response(url, status, body=b"{}"):
+    r = requests.Response()
+    r.status_code, r._content, r.url = status, body, url
+    r.request = requests.Request("GET", url).prepare()
+    return r
+
+def test_concurrent_callers_share_one_refresh():
+    tokens = CountingTokens(None, "refresh")
+    got = []
+    threads = [threading.Thread(target=lambda: got.append(tokens.get())) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert tokens.refreshes == 1
+    assert got == ["access-1"] * 8
+
+def test_env_token_is_trusted_until_a_401():
+    tokens = CountingTokens("from-env", "refresh")
+    assert tokens.get() == "from-env" and tokens.refreshes == 0
+    assert tokens.invalidate("from-env") == "access-1"
+    # A late 401 for the token that was already replaced doesn't refresh again
+    assert tokens.invalidate("from-env") == "access-1" and tokens.refreshes == 1
+
+def test_expiring_token_is_served_while_refreshing_in_background(monkeypatch):
+    monkeypatch.setattr(app, "TOKEN_REFRESH_MARGIN_SEC", 60)
+    tokens = CountingTokens(None, "refresh", expires_in=30)   # always inside the margin
+    assert tokens.get() == "access-1"
+    assert tokens.get() == "access-1"        # still valid: handed out, refresh started
+    deadline = time.time() + 2
+    while tokens.access_token == "access-1" and time.time() < deadline:
+        time.sleep(0.01)
+    assert tokens.access_token == "access-2"
+
+def test_api_get_refreshes_and_retries_once_on_401(monkeypatch):
+    tokens = CountingTokens("expired", "refresh")
+    seen = []
+
+    class Session:
+        def get(self, url, headers=None, params=None):
+            seen.append(headers["Authorization"])
+            return response(url, 401 if headers["Authorization"] == "Bearer expired" else 200)
+
+    monkeypatch.setattr(app, "SESSION", Session())
+    monkeypatch.setattr(app, "TOKEN_MANAGER", tokens)
+    breaker = CircuitBreaker("test")
+    assert app._api_get("http://upstream/x", "expired", "ctx", breaker=breaker).status_code == 200
+    assert seen == ["Bearer expired", "Bearer access-1"]
+    assert breaker.state == "closed" and breaker.failures == 0
+
+def test_api_get_reports_a_second_401(monkeypatch):
+    class Session:
+        def get(self, url, headers=None, params=None):
+            return response(url, 401)
+
+    monkeypatch.setattr(app, "SESSION", Session())
+    monkeypatch.setattr(app, "TOKEN_MANAGER", CountingTokens("expired", "refresh"))
+    with pytest.raises(requests.HTTPError, match="status=401"):
+        app._api_get("http://upstream/x", "expired", "ctx", breaker=CircuitBreaker("test"))
+
+# Workers sharing TT_SHARED_STORE: one refresh, adopted by the others
+def test_workers_adopt_a_token_refreshed_elsewhere(tmp_path):
+    store = app.SQLiteStore(str(tmp_path / "shared.db"))
+    first, second = CountingTokens(None, "refresh", store=store), CountingTokens(None, "refresh", store=store)
+    assert first.get() == "access-1"
+    assert second.get() == "access-1" and second.refreshes == 0
+    # A rotation after a 401 is picked up the same way
+    assert first.invalidate("access-1") == "access-2"
+    assert second.invalidate("access-1") == "access-2" and second.refreshes == 0
@@ -0,0 +1,42 @@
+import time
+
+import pytest
+
+from upstream import CircuitBreaker, CircuitOpenError
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_sec=60)
+    for _ in range(2):
+        breaker.record_failure("HTTP 503")
+    breaker.check()
+    breaker.record_success()                 # a success resets the count
+    for _ in range(3):
+        breaker.record_failure("HTTP 503")
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError, match="HTTP 503"):
+        breaker.check()
+
+def test_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_sec=0.05)
+    breaker.record_failure("timeout")
+    time.sleep(0.06)
+    with pytest.raises(CircuitOpenError):
+        breaker.check(probe=False)           # consumers wait for someone else's probe
+    breaker.check()
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.check()                      # only one probe at a time
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.check(probe=False)
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker("test", failure_threshold=5, reset_sec=0.05)
+    for _ in range(5):
+        breaker.record_failure("timeout")
+    time.sleep(0.06)
+    breaker.check()
+    breaker.record_failure("still down")
+    assert breaker.state == "open" and breaker.status()["last_error"] == "still down"
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
@@ -0,0 +1,225 @@
+import email.utils
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from metrics import REGISTRY, STAGE_SECONDS
+
+# Upstream REST client policy, shared by app.py (requests) and asgi.py (httpx):
+#   - keep-alive pools of TT_UPSTREAM_POOL_SIZE connections per host; callers beyond that wait
+#     for a free connection instead of opening throwaway ones (tt_stage_seconds{stage="pool_wait"})
+#   - 429 / 5xx / connection errors are retried up to TT_UPSTREAM_RETRIES times with exponential
+#     backoff and full jitter; a Retry-After header replaces the computed delay
+#   - X-RateLimit-Remaining: 0 plus X-RateLimit-Reset holds every caller until the reset
+# A wait longer than TT_UPSTREAM_BACKOFF_MAX_SEC isn't worth it for an interactive request:
+# the response is returned as-is and the caller reports it.
+POOL_SIZE = int(os.getenv("TT_UPSTREAM_POOL_SIZE", "20"))
+RETRIES = int(os.getenv("TT_UPSTREAM_RETRIES", "2"))
+BACKOFF_SEC = float(os.getenv("TT_UPSTREAM_BACKOFF_SEC", "0.2"))
+BACKOFF_MAX_SEC = float(os.getenv("TT_UPSTREAM_BACKOFF_MAX_SEC", "5"))
+TIMEOUT_SEC = float(os.getenv("TT_UPSTREAM_TIMEOUT_SEC", "10"))
+
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+IDEMPOTENT_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+
+UPSTREAM_RETRIES = REGISTRY.counter("tt_upstream_http_retries_total",
+                                    "Upstream REST retries by reason (status code or 'connection')", ("reason",))
+
+# Seconds to wait per Retry-After (delta-seconds or an HTTP date), or None
+def retry_after(headers):
+    value = headers.get("Retry-After") if headers else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+# A 429 was rejected before doing anything, so even a POST (token refresh) can go again
+def should_retry(method, status):
+    if status not in RETRY_STATUSES:
+        return False
+    return method.upper() in IDEMPOTENT_METHODS or status == 429
+
+# Delay before retry number `attempt` (0-based): Retry-After if given, else full jitter
+def retry_delay(attempt, headers=None):
+    delay = retry_after(headers)
+    if delay is not None:
+        return delay
+    return random.uniform(0.0, min(BACKOFF_MAX_SEC, BACKOFF_SEC * (2 ** attempt)))
+
+# ✅ Process-wide hold once the upstream says the rate-limit window is used up
+class RateLimitGate:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._until = 0.0      # time.monotonic() before which nothing should be sent
+
+    def note(self, headers):
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset = headers.get("X-RateLimit-Reset")
+        if remaining is None or reset is None:
+            return
+        try:
+            if int(float(remaining)) > 0:
+                return
+            reset = float(reset)
+        except ValueError:
+            return
+        # Either seconds until the reset or the reset's epoch time
+        wait = reset - time.time() if reset > 1e9 else reset
+        if wait <= 0:
+            return
+        with self._lock:
+            self._until = max(self._until, time.monotonic() + min(wait, BACKOFF_MAX_SEC))
+
+    def hold(self):
+        with self._lock:
+            return max(0.0, self._until - time.monotonic())
+
+RATE_LIMIT = RateLimitGate()
+
+# ---- requests (app.py) ----
+class _PoolWaitMixin:
+    # With pool_block=True this is where a caller queues for a free keep-alive connection
+    def _get_conn(self, timeout=None):
+        t0 = time.perf_counter()
+        try:
+            return super()._get_conn(timeout)
+        finally:
+            STAGE_SECONDS.observe(time.perf_counter() - t0, "pool_wait")
+
+class _TimedHTTPConnectionPool(_PoolWaitMixin, HTTPConnectionPool):
+    pass
+
+class _TimedHTTPSConnectionPool(_PoolWaitMixin, HTTPSConnectionPool):
+    pass
+
+class PooledAdapter(HTTPAdapter):
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+# ✅ requests.Session with sized keep-alive pools, a default timeout, and the retry policy above
+class UpstreamSession(requests.Session):
+
+    def __init__(self, pool_size=POOL_SIZE, retries=RETRIES, timeout=TIMEOUT_SEC, gate=RATE_LIMIT):
+        super().__init__()
+        adapter = PooledAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=True, max_retries=0)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+        self.retries = retries
+        self.timeout = timeout
+        self.gate = gate
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            hold = self.gate.hold()
+            if hold:
+                t0 = time.perf_counter()
+                time.sleep(hold)
+                STAGE_SECONDS.observe(time.perf_counter() - t0, "rate_limit_wait")
+            try:
+                r = super().request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # Only a failed connect is known not to have reached the upstream
+                if attempt >= self.retries or not (method.upper() in IDEMPOTENT_METHODS
+                                                   or isinstance(e, requests.ConnectTimeout)):
+                    raise
+                reason, delay = "connection", retry_delay(attempt)
+            else:
+                self.gate.note(r.headers)
+                if attempt >= self.retries or not should_retry(method, r.status_code):
+                    return r
+                delay = retry_delay(attempt, r.headers)
+                if delay > BACKOFF_MAX_SEC:
+                    return r
+                reason = str(r.status_code)
+                r.close()
+            UPSTREAM_RETRIES.inc(reason)
+            time.sleep(delay)
+            attempt += 1
+
+# ---- Circuit breakers, one per upstream dependency ----
+# After TT_BREAKER_FAILURES consecutive failures a breaker opens and callers fail fast with
+# CircuitOpenError for TT_BREAKER_RESET_SEC; then one probe call is let through (half-open)
+# and its outcome closes or re-opens the breaker.
+BREAKER_FAILURES = int(os.getenv("TT_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SEC = float(os.getenv("TT_BREAKER_RESET_SEC", "30"))
+
+BREAKER_TRANSITIONS = REGISTRY.counter("tt_circuit_breaker_transitions_total",
+                                       "Circuit breaker state changes by dependency", ("dependency", "state"))
+
+class CircuitOpenError(Exception):
+    pass
+
+class CircuitBreaker:
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURES, reset_sec=BREAKER_RESET_SEC):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_sec = reset_sec
+        self._lock = threading.Lock()
+        self.state = "closed"      # closed | open | half_open
+        self.failures = 0
+        self.opened_at = None      # time.monotonic()
+        self.last_error = None
+
+    def _set_state(self, state):
+        if state != self.state:
+            self.state = state
+            BREAKER_TRANSITIONS.inc(self.name, state)
+
+    # Raise CircuitOpenError unless a call may go out now. probe=False is for callers that
+    # only consume the dependency: they never become the half-open probe (someone else
+    # reconnects) and are turned away until the breaker closes.
+    def check(self, probe=True):
+        with self._lock:
+            if self.state == "closed":
+                return
+            retry_in = self.opened_at + self.reset_sec - time.monotonic()
+            if probe and self.state == "open" and retry_in <= 0:
+                self._set_state("half_open")
+                return
+            raise CircuitOpenError(f"{self.name} circuit open ({self.last_error}); "
+                                   f"retry in {max(0.0, retry_in):.1f}s")
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._set_state("closed")
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self.failures += 1
+            if error is not None:
+                self.last_error = str(error)
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state("open")
+
+    def status(self):
+        with self._lock:
+            return {"state": self.state, "failures": self.failures, "last_error": self.last_error,
+                    "open_for_sec": round(time.monotonic() - self.opened_at, 3) if self.state != "closed" else None}
+
+BREAKERS = {name: CircuitBreaker(name) for name in ("rest", "quote_token", "dxlink")}
+
+# Responses that say the upstream itself is in trouble (4xx other than 429 are the caller's problem)
+def is_upstream_failure(status):
+    return status == 429 or status >= 500